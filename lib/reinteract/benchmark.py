@@ -0,0 +1,294 @@
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+import gc
+import sys
+import textwrap
+from timeit import default_timer
+
+import gtk
+import pango
+
+from custom_result import CustomResult, ResultWidget
+
+#
+# timeit() is provided to worksheets to time a snippet of code:
+#
+#   timeit("sorted(l)")
+#   timeit(lambda: sorted(l))
+#
+# The number of loops per run is picked so that each run takes at least
+# MIN_RUN_TIME seconds (so that the resolution of the timer doesn't matter),
+# and then as many runs are done as fit in TOTAL_TIME seconds, between
+# MIN_RUNS and MAX_RUNS. The result shows the time per loop.
+#
+# The timing happens in the statement that calls timeit(), so it runs on the
+# executor thread and stops like any other code when the worksheet is
+# interrupted.
+#
+
+MIN_RUN_TIME = 0.01
+TOTAL_TIME = 1.0
+MIN_RUNS = 5
+MAX_RUNS = 100
+
+# Number of bars in the histogram of the run times, and its size in pixels
+HISTOGRAM_BINS = 12
+HISTOGRAM_BAR_WIDTH = 5
+HISTOGRAM_HEIGHT = 30
+# Space between the histogram and the text
+HISTOGRAM_SPACING = 8
+
+_TEMPLATE = """
+def inner(_it, _timer):
+    _t0 = _timer()
+    for _i in _it:
+%s
+    _t1 = _timer()
+    return _t1 - _t0
+"""
+
+def _callable_inner(func):
+    def inner(_it, _timer):
+        _t0 = _timer()
+        for _i in _it:
+            func()
+        _t1 = _timer()
+        return _t1 - _t0
+
+    return inner
+
+def _compile_inner(stmt, scope):
+    # Like the timeit module, we compile the statement into a loop so that
+    # the only overhead is the loop itself; but we use the scope of the
+    # worksheet so that the statement can use the variables defined there
+    body = textwrap.dedent(stmt).strip('\n')
+    body = "\n".join("        " + line for line in body.split("\n"))
+
+    code = compile(_TEMPLATE % body, "<timeit>", "exec")
+    local_scope = {}
+    exec code in scope, local_scope
+
+    return local_scope['inner']
+
+def _run(inner, number):
+    # Garbage collection while timing makes the results noisy; the timeit
+    # module also turns it off
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return inner(xrange(number), default_timer)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * scale >= 1:
+            return "%.3g %s" % (seconds * scale, unit)
+
+    return "%.3g ns" % (seconds * 1e9)
+
+def timeit(stmt, number=None, runs=None):
+    """Time how long a piece of code takes to run
+
+    @param stmt: a function taking no arguments, or Python code as a string. Code
+      is run with the variables of the worksheet.
+    @param number: the number of times to run stmt in each timing run. By default,
+      enough that a run takes at least %g seconds.
+    @param runs: the number of timing runs. By default, as many as fit in
+      about %g seconds, between %d and %d.
+    @returns: a TimeitResult
+
+    """
+
+    if callable(stmt):
+        inner = _callable_inner(stmt)
+    elif isinstance(stmt, basestring):
+        inner = _compile_inner(stmt, sys._getframe(1).f_globals)
+    else:
+        raise TypeError("timeit() needs a function or a string of Python code")
+
+    # Find how many loops make up a run: 1, 2, 5, 10, 20, 50, ...
+    if number is None:
+        number = 1
+        while True:
+            elapsed = _run(inner, number)
+            if elapsed >= MIN_RUN_TIME:
+                break
+            if str(number)[0] == '2':
+                number = number * 5 / 2
+            else:
+                number *= 2
+    else:
+        elapsed = _run(inner, number)
+
+    if runs is None:
+        runs = int(TOTAL_TIME / max(elapsed, 1e-9))
+        runs = max(MIN_RUNS, min(MAX_RUNS, runs))
+
+    times = [_run(inner, number) / number for i in xrange(runs)]
+
+    return TimeitResult(times, number)
+
+timeit.__doc__ = timeit.__doc__ % (MIN_RUN_TIME, TOTAL_TIME, MIN_RUNS, MAX_RUNS)
+
+class TimeitResult(CustomResult):
+    """The result of timeit(): times for a loop, one for each run"""
+
+    def __init__(self, times, number):
+        #: the time for one loop, for each of the runs, in seconds
+        self.times = sorted(times)
+        #: the number of loops in each run
+        self.number = number
+
+    @property
+    def min(self):
+        return self.times[0]
+
+    @property
+    def median(self):
+        times = self.times
+        middle = len(times) // 2
+        if len(times) % 2 == 1:
+            return times[middle]
+        else:
+            return (times[middle - 1] + times[middle]) / 2.
+
+    @property
+    def spread(self):
+        """The standard deviation of the times"""
+        mean = sum(self.times) / len(self.times)
+        return (sum((t - mean) ** 2 for t in self.times) / len(self.times)) ** 0.5
+
+    def get_histogram(self, bins=HISTOGRAM_BINS):
+        """Count the times falling in bins of equal width between the minimum and maximum"""
+        counts = [0] * bins
+        low, high = self.times[0], self.times[-1]
+        for t in self.times:
+            if high == low:
+                i = 0
+            else:
+                i = min(int(bins * (t - low) / (high - low)), bins - 1)
+            counts[i] += 1
+
+        return counts
+
+    def get_summary(self):
+        return "min %s, median %s, spread %s" % (_format_time(self.min),
+                                                 _format_time(self.median),
+                                                 _format_time(self.spread))
+
+    def get_details(self):
+        return "%d runs of %d loop%s" % (len(self.times), self.number, "s" if self.number != 1 else "")
+
+    def create_widget(self):
+        return _TimeitWidget(self)
+
+    def print_result(self, print_context, render):
+        layout = print_context.create_pango_layout()
+        height = _layout_height(self, layout)
+
+        if render:
+            _draw(self, print_context.get_cairo_context(), layout, height)
+
+        return height
+
+    def __repr__(self):
+        return "<TimeitResult %s (%s)>" % (self.get_summary(), self.get_details())
+
+def _layout_height(result, layout):
+    layout.set_text(result.get_summary() + "\n" + result.get_details())
+    _, text_height = layout.get_pixel_size()
+
+    return max(text_height, HISTOGRAM_HEIGHT)
+
+def _draw(result, cr, layout, height):
+    # A histogram of the run times, with the text next to it
+    counts = result.get_histogram()
+    largest = max(counts)
+    y = (height - HISTOGRAM_HEIGHT) / 2.
+
+    cr.set_source_rgb(0.3, 0.4, 0.7)
+    for i, count in enumerate(counts):
+        bar_height = HISTOGRAM_HEIGHT * float(count) / largest
+        cr.rectangle(i * HISTOGRAM_BAR_WIDTH, y + HISTOGRAM_HEIGHT - bar_height, HISTOGRAM_BAR_WIDTH - 1, bar_height)
+    cr.fill()
+
+    cr.set_source_rgb(0.6, 0.6, 0.6)
+    cr.rectangle(0, y + HISTOGRAM_HEIGHT - 0.5, HISTOGRAM_BINS * HISTOGRAM_BAR_WIDTH, 1)
+    cr.fill()
+
+    layout.set_text(result.get_summary() + "\n" + result.get_details())
+    _, text_height = layout.get_pixel_size()
+    cr.set_source_rgb(0, 0, 0)
+    cr.move_to(HISTOGRAM_BINS * HISTOGRAM_BAR_WIDTH + HISTOGRAM_SPACING, (height - text_height) / 2.)
+    cr.show_layout(layout)
+
+class _TimeitWidget(ResultWidget):
+    __gsignals__ = {
+        'expose-event': 'override',
+    }
+
+    def __init__(self, result):
+        ResultWidget.__init__(self)
+
+        self.result = result
+        self.layout = self.create_pango_layout("")
+
+    def sync_style(self, style):
+        self.layout.set_font_description(style.font_desc)
+        self.queue_resize()
+
+    def do_size_request(self, requisition):
+        height = _layout_height(self.result, self.layout)
+        text_width, _ = self.layout.get_pixel_size()
+
+        requisition.width = HISTOGRAM_BINS * HISTOGRAM_BAR_WIDTH + HISTOGRAM_SPACING + text_width
+        requisition.height = height
+
+    def do_expose_event(self, event):
+        cr = self.window.cairo_create()
+        _draw(self.result, cr, self.layout, self.allocation.height)
+
+        return False
+
+####################################################################################
+
+if __name__ == "__main__":
+    import time
+
+    def expect(result, expected):
+        if result != expected:
+            print "Got %r, expected %r" % (result, expected)
+
+    result = TimeitResult([3., 1., 2., 10.], 5)
+    expect(result.min, 1.)
+    expect(result.median, 2.5)
+    expect(result.times, [1., 2., 3., 10.])
+    expect(result.get_histogram(3), [3, 0, 1])
+    expect(TimeitResult([1., 1.], 1).get_histogram(3), [2, 0, 0])
+    expect(TimeitResult([1., 1.], 1).spread, 0.)
+    expect(result.get_details(), "4 runs of 5 loops")
+
+    expect(_format_time(2.5), "2.5 s")
+    expect(_format_time(0.00125), "1.25 ms")
+    expect(_format_time(3e-7), "300 ns")
+
+    l = range(100)
+    result = timeit("sorted(l)\nsorted(l)")
+    expect(result.number * result.median >= MIN_RUN_TIME / 2, True)
+    expect(MIN_RUNS <= len(result.times) <= MAX_RUNS, True)
+
+    result = timeit(lambda: time.sleep(0.001), runs=3)
+    expect(result.number, 10)
+    expect(len(result.times), 3)
+    expect(result.min >= 0.001, True)
+
+    result = timeit("pass", number=7, runs=2)
+    expect((result.number, len(result.times)), (7, 2))
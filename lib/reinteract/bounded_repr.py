@@ -0,0 +1,200 @@
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+from itertools import islice
+from repr import Repr
+
+#
+# bounded_repr() is like repr(), but stops once the representation gets
+# too long, so that evaluating a huge list in a worksheet doesn't produce
+# a huge string. For objects within the limits, the result is the same as
+# repr(). Lists, tuples, dicts, sets, strings, and longs are handled
+# incrementally; for other objects we have to call repr() and can only
+# truncate the result.
+#
+
+# maximum length of strings and other leaf objects; containers stop adding
+# items once they reach this length
+MAX_LENGTH = 10000
+
+# maximum number of items shown for a container
+MAX_ITEMS = 1000
+
+# maximum nesting depth of containers
+MAX_LEVEL = 20
+
+_builtin_repr = repr
+
+class _BoundedRepr(Repr):
+    def __init__(self, scale):
+        Repr.__init__(self)
+
+        self.maxlevel = MAX_LEVEL * scale
+        self.maxtuple = self.maxlist = self.maxdict = self.maxset = self.maxfrozenset = MAX_ITEMS * scale
+        self.maxstring = self.maxlong = self.maxother = self.maxlength = MAX_LENGTH * scale
+
+        self.truncated = False
+        self.__stack = []
+
+    def repr1(self, x, level):
+        # Repr dispatches on the name of the type, so would use repr_list()
+        # for any class called "list"
+        if type(x) in _HANDLED_TYPES:
+            return Repr.repr1(self, x, level)
+        else:
+            return self.repr_instance(x, level)
+
+    def __repr_items(self, x, level, items, format_item, left, right, trail=''):
+        if len(x) == 0:
+            return left + right
+
+        # Recursive containers are shown the same way as by repr()
+        if id(x) in self.__stack:
+            return left + '...' + right
+
+        if level <= 0:
+            self.truncated = True
+            return left + '...' + right
+
+        self.__stack.append(id(x))
+        try:
+            pieces = []
+            length = 0
+            for item in items:
+                if length > self.maxlength:
+                    break
+                piece = format_item(item, level - 1)
+                pieces.append(piece)
+                length += len(piece) + 2
+        finally:
+            self.__stack.pop()
+
+        if len(pieces) < len(x):
+            self.truncated = True
+            pieces.append('...')
+        elif len(x) == 1:
+            right = trail + right
+
+        return left + ', '.join(pieces) + right
+
+    def __repr_sequence(self, x, level, left, right, maxiter, trail=''):
+        return self.__repr_items(x, level, islice(x, maxiter), self.repr1, left, right, trail)
+
+    def repr_tuple(self, x, level):
+        return self.__repr_sequence(x, level, '(', ')', self.maxtuple, ',')
+
+    def repr_list(self, x, level):
+        return self.__repr_sequence(x, level, '[', ']', self.maxlist)
+
+    # Unlike Repr, we don't sort sets and dicts, since repr() doesn't
+    def repr_set(self, x, level):
+        return self.__repr_sequence(x, level, 'set([', '])', self.maxset)
+
+    def repr_frozenset(self, x, level):
+        return self.__repr_sequence(x, level, 'frozenset([', '])', self.maxfrozenset)
+
+    def repr_dict(self, x, level):
+        def format_item(item, level):
+            key, value = item
+            return self.repr1(key, level) + ': ' + self.repr1(value, level)
+
+        return self.__repr_items(x, level, islice(x.iteritems(), self.maxdict), format_item, '{', '}')
+
+    def repr_str(self, x, level):
+        if len(x) > self.maxstring:
+            self.truncated = True
+            return _builtin_repr(x[0:self.maxstring]) + '...'
+        else:
+            return _builtin_repr(x)
+
+    repr_unicode = repr_str
+
+    def __truncate(self, s, limit):
+        if len(s) > limit:
+            self.truncated = True
+            return s[0:limit] + '...'
+        else:
+            return s
+
+    def repr_long(self, x, level):
+        return self.__truncate(_builtin_repr(x), self.maxlong)
+
+    def repr_instance(self, x, level):
+        # Unlike Repr, we let exceptions from repr() propagate
+        return self.__truncate(_builtin_repr(x), self.maxother)
+
+_HANDLED_TYPES = set([tuple, list, dict, set, frozenset, str, unicode, long])
+
+def bounded_repr(obj, scale=1):
+    """Get a representation of obj of limited length
+
+    @param obj: the object to represent
+    @param scale: factor to multiply the limits by
+    @returns: a tuple of (text, truncated), where truncated is True if
+      text doesn't represent all of obj
+
+    """
+
+    r = _BoundedRepr(scale)
+    text = r.repr(obj)
+
+    return text, r.truncated
+
+####################################################################################
+
+if __name__ == "__main__":
+    def expect(obj, expected_text, expected_truncated):
+        text, truncated = bounded_repr(obj)
+        if text != expected_text or truncated != expected_truncated:
+            print "For %r, got %r, expected %r" % (obj, (text, truncated), (expected_text, expected_truncated))
+
+    def expect_same(obj):
+        expect(obj, repr(obj), False)
+
+    expect_same(1)
+    expect_same(10L)
+    expect_same('a')
+    expect_same(u'\u1234')
+    expect_same((1,))
+    expect_same((1, 2))
+    expect_same([])
+    expect_same([1, 'a', [2.5, (None,)]])
+    expect_same({'b': 1, 'a': [1, 2], 3: {}})
+    expect_same(set([3, 1, 2]))
+    expect_same(frozenset())
+
+    a = [1]
+    a.append(a)
+    expect_same(a)
+
+    d = {}
+    d[1] = d
+    expect_same(d)
+
+    def make_list():
+        class list(object):
+            def __repr__(self):
+                return "<my list>"
+        return list()
+    expect_same(make_list())
+
+    MAX_LENGTH = 10
+    MAX_ITEMS = 3
+    MAX_LEVEL = 2
+
+    expect(range(10), "[0, 1, 2, ...]", True)
+    expect(range(3), "[0, 1, 2]", False)
+    expect("a" * 20, "'aaaaaaaaaa'...", True)
+    expect([[[1]]], "[[[...]]]", True)
+    expect(10L ** 20, "1000000000...", True)
+    expect(dict.fromkeys(range(4)), "{0: None, 1: None, ...}", True)
+    expect(["a" * 5] * 3, "['aaaaa', 'aaaaa', ...]", True)
+
+    text, truncated = bounded_repr(range(10), scale=4)
+    if (text, truncated) != (repr(range(10)), False):
+        print "Scaled up, got %r" % ((text, truncated),)
@@ -10,6 +10,15 @@ from change_range import ChangeRange
 from statement import Statement
 from tokenized_statement import TokenizedStatement;
 
+def _interrupted_message(statement, message):
+    if statement.orphaned_calls > 0:
+        if statement.orphaned_calls == 1:
+            message += "\n1 function yielded by the statement is still running in the background"
+        else:
+            message += "\n%d functions yielded by the statement are still running in the background" % statement.orphaned_calls
+
+    return message
+
 class Chunk(object):
 
     """
@@ -90,6 +99,11 @@ class StatementChunk(Chunk):
         self.error_line = None
         self.error_offset = None
 
+        # ExecutionStats from the last time the statement was executed
+        self.stats = None
+        # ScopeMemory for the result scope of the statement, if it executed successfully
+        self.memory = None
+
     def __repr__(self):
         return "StatementChunk(%d,%d,%r,%r,%r)" % (self.start, self.end, self.needs_compile, self.needs_execute, self.tokenized.get_text())
 
@@ -107,6 +121,8 @@ class StatementChunk(Chunk):
         self.needs_execute = False
 
         self.statement_dirty = True
+        self.stats = None
+        self.memory = None
 
         return True
 
@@ -121,6 +137,8 @@ class StatementChunk(Chunk):
 
     def get_clean_statement(self, worksheet):
         if self.statement_dirty:
+            if self.statement is not None:
+                self.statement.release_output()
             self.statement = Statement(self.tokenized.get_text(), worksheet)
             self.statement.chunk = self
             self.statement_dirty = False
@@ -137,6 +155,8 @@ class StatementChunk(Chunk):
             self.executing = True
         elif self.statement.state == Statement.EXECUTE_SUCCESS:
             self.executing = False
+            self.stats = self.statement.stats
+            self.memory = self.statement.memory
             self.needs_compile = False
             self.needs_execute = False
             if self.results != self.statement.results:
@@ -155,6 +175,8 @@ class StatementChunk(Chunk):
             self.results_changed = True
         elif self.statement.state == Statement.EXECUTE_ERROR:
             self.executing = False
+            self.stats = self.statement.stats
+            self.memory = None
             self.needs_compile = False
             self.needs_execute = True
             self.error_message = self.statement.error_message
@@ -164,9 +186,22 @@ class StatementChunk(Chunk):
             self.results_changed = True
         elif self.statement.state == Statement.INTERRUPTED:
             self.executing = False
+            self.stats = self.statement.stats
+            self.memory = None
+            self.needs_compile = False
+            self.needs_execute = True
+            self.error_message = _interrupted_message(self.statement, "Interrupted")
+            self.error_line = None
+            self.error_offset = None
+            self.results = None
+            self.results_changed = True
+        elif self.statement.state == Statement.LIMIT_EXCEEDED:
+            self.executing = False
+            self.stats = self.statement.stats
+            self.memory = None
             self.needs_compile = False
             self.needs_execute = True
-            self.error_message = "Interrupted"
+            self.error_message = _interrupted_message(self.statement, self.statement.error_message)
             self.error_line = None
             self.error_offset = None
             self.results = None
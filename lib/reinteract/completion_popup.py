@@ -12,6 +12,8 @@ import inspect
 from popup import Popup
 from doc_popup import DocPopup
 from data_format import is_data_object
+import doc_format
+from lookup_thread import LookupThread, TIMED_OUT
 from shell_buffer import ADJUST_NONE
 
 # Space between the line of text where the cursor is and the popup
@@ -25,6 +27,13 @@ HEIGHT = 300
 # we start suggesting completions
 SPONTANEOUS_MIN_LENGTH = 3
 
+# Number of rows on either side of the selected row that we format docs
+# for in advance, so that moving the selection shows them immediately
+PREFILL_DOC_ROWS = 2
+
+# Shown in place of the completions if finding them takes too long
+TIMED_OUT_TEXT = "(Finding completions timed out)"
+
 class CompletionPopup(Popup):
     
     """Class implementing a completion popup for ShellView
@@ -70,25 +79,69 @@ class CompletionPopup(Popup):
         self.__doc_popup= DocPopup(fixed_width=True, fixed_height=True, max_height=HEIGHT, can_focus=False)
 
         self._in_change = False
+        self.__pending = None
+        # (line, text before the cursor) where the completions in the list were found
+        self.__completions_position = None
+        self.__timed_out = False
+        self.__prefill_thread = LookupThread()
+        self.__prefill_request = None
         self.spontaneous = False
         self.showing = False
 
         self.connect('destroy', self.on_destroy)
 
-    def __update_completions(self, spontaneous=False):
+    def __get_completion_args(self, spontaneous):
         buf = self.__view.get_buffer()
 
-        self.__in_change = True
-        self.__tree_model.clear()
         line, offset = buf.iter_to_pos(buf.get_iter_at_mark(buf.get_insert()), adjust=ADJUST_NONE)
-        if line is None:
-            completions = []
+        if spontaneous:
+            min_length = SPONTANEOUS_MIN_LENGTH
         else:
-            if spontaneous:
-                min_length = SPONTANEOUS_MIN_LENGTH
+            min_length = 0
+
+        return line, offset, min_length
+
+    def __cancel_pending(self):
+        if self.__pending is not None:
+            self.__pending.cancel()
+            self.__pending = None
+
+    def __update_completions(self, spontaneous, callback):
+        # Finding completions can be slow (it calls into user objects), so it's
+        # done in a separate thread; callback is called once the completions
+        # have been filled into the list. A request that is superseded before
+        # it completes is dropped.
+        self.__cancel_pending()
+
+        line, offset, min_length = self.__get_completion_args(spontaneous)
+        if line is None:
+            self.__set_completions([])
+            self.__completions_position = None
+            callback()
+            return
+
+        buf = self.__view.get_buffer()
+        position = (line, buf.worksheet.get_line(line)[0:offset])
+
+        def on_completions(completions):
+            self.__pending = None
+            if completions is TIMED_OUT:
+                self.__set_timed_out()
             else:
-                min_length = 0
-            completions = buf.worksheet.find_completions(line, offset, min_length)
+                self.__set_completions(completions)
+            self.__completions_position = position
+            callback()
+
+        self.__pending = buf.worksheet.find_completions_async(line, offset, on_completions, min_length)
+
+    def __set_timed_out(self):
+        self.__set_completions([(TIMED_OUT_TEXT, None, None)])
+        self.__timed_out = True
+
+    def __set_completions(self, completions):
+        self.__timed_out = False
+        self.__in_change = True
+        self.__tree_model.clear()
         for display, completion, obj in completions:
             self.__tree_model.append([display, completion, obj])
 
@@ -113,6 +166,8 @@ class CompletionPopup(Popup):
             self.__doc_popup.popdown()
             return
 
+        self.__prefill_docs(model.get_path(iter)[0])
+
         obj = model.get_value(iter, 2)
 
         # Long term it would be nice to preview the value of the
@@ -126,11 +181,60 @@ class CompletionPopup(Popup):
         self.__doc_popup.set_target(obj)
         self.__doc_popup.popup()
 
+    def __prefill_docs(self, selected):
+        if self.__prefill_request is not None:
+            self.__prefill_request.cancel()
+            self.__prefill_request = None
+
+        objects = []
+        for i in xrange(max(selected - PREFILL_DOC_ROWS, 0),
+                        min(selected + PREFILL_DOC_ROWS + 1, len(self.__tree_model))):
+            obj = self.__tree_model[i][2]
+            if i != selected and obj is not None and not is_data_object(obj):
+                objects.append(obj)
+
+        if len(objects) > 0:
+            self.__prefill_request = self.__prefill_thread.run(lambda: doc_format.prefill_docs(objects),
+                                                               lambda result: None)
+
+    def __adjust_completion(self, completion):
+        # The text may have changed since the list was computed; rather than
+        # finding the completions again here in the main thread, adjust the text
+        # to insert for what was typed or deleted since. Returns None if the
+        # completion no longer applies.
+        if self.__completions_position is None:
+            return None
+
+        line, offset, _ = self.__get_completion_args(self.spontaneous)
+        old_line, old_before = self.__completions_position
+        if line is None or line != old_line:
+            return None
+
+        buf = self.__view.get_buffer()
+        before = buf.worksheet.get_line(line)[0:offset]
+        if before.startswith(old_before):
+            typed = before[len(old_before):]
+            if completion.startswith(typed):
+                return completion[len(typed):]
+        elif old_before.startswith(before):
+            return old_before[len(before):] + completion
+
+        return None
+
     def __insert_completion(self, iter):
         completion = self.__tree_model.get_value(iter, 1)
         obj = self.__tree_model.get_value(iter, 2)
+        if completion is None: # TIMED_OUT_TEXT
+            return
 
         buf = self.__view.get_buffer()
+
+        if self.__pending is not None:
+            self.__cancel_pending()
+            completion = self.__adjust_completion(completion)
+            if completion is None:
+                return
+
         default_editable = self.__view.get_editable()
 
         buf.insert_interactive_at_cursor(completion, default_editable)
@@ -151,7 +255,8 @@ class CompletionPopup(Popup):
 
     def __insert_selected(self):
         model, iter = self.__tree.get_selection().get_selected()
-        self.__insert_completion(iter)
+        if iter is not None:
+            self.__insert_completion(iter)
             
     def __on_selection_changed(self, selection):
         if not self.__in_change:
@@ -174,10 +279,16 @@ class CompletionPopup(Popup):
 
         """
         
-        self.__update_completions(spontaneous=spontaneous)
+        self.__update_completions(spontaneous, lambda: self.__on_popup_completions(spontaneous))
+
+    def __on_popup_completions(self, spontaneous):
         num_completions = len(self.__tree_model)
         if num_completions == 0:
             return
+        elif self.__timed_out:
+            # Only tell the user about it if they asked for completions
+            if spontaneous:
+                return
         elif num_completions == 1 and not spontaneous:
             self.__insert_selected()
             return
@@ -208,7 +319,12 @@ class CompletionPopup(Popup):
         if not self.showing:
             return
         
-        self.__update_completions(spontaneous=self.spontaneous)
+        self.__update_completions(self.spontaneous, self.__on_update_completions)
+
+    def __on_update_completions(self):
+        if not self.showing:
+            return
+
         if len(self.__tree_model) == 0:
             self.popdown()
             return
@@ -218,6 +334,8 @@ class CompletionPopup(Popup):
     def popdown(self):
         """Hide the completion if it is currently showing"""
 
+        self.__cancel_pending()
+
         if not self.showing:
             return
 
@@ -230,6 +348,8 @@ class CompletionPopup(Popup):
         self.hide()
 
     def on_destroy(self, obj):
+        self.__cancel_pending()
+        self.__prefill_thread.destroy()
         self.__doc_popup.destroy()
         self.__doc_popup = None
 
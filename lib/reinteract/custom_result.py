@@ -27,6 +27,19 @@ class CustomResult(object):
         """
         raise NotImplementedError()
 
+    def is_equivalent(self, other):
+        """Check whether other would be displayed the same as this result. When a
+        statement is executed again, and the new result is equivalent to the old
+        one, the widget created for the old result is kept rather than creating
+        a new one, and the old result takes the place of the new one in the
+        results of the statement. The default implementation only considers a
+        result equivalent to itself.
+
+        @param other: a result of the same type as this result
+
+        """
+        return other is self
+
 class ResultWidget(gtk.DrawingArea):
     """Base class for custom result widgets that draw their own content"""
 
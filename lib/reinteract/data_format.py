@@ -6,9 +6,11 @@
 #
 ########################################################################
 
+import heapq
 import re
 import inspect
 import pydoc
+import sys
 import gtk
 from cStringIO import StringIO
 
@@ -27,6 +29,11 @@ from cStringIO import StringIO
 #    Lists and Tuples are formatted this way if them items in the sequence
 #    have short, single-line representations.
 #
+# Only as much of a container as fits in the display is formatted, so
+# formatting a huge dictionary or list is no more expensive than formatting
+# a small one. Long strings and large NumPy arrays are summarized rather
+# than passed to repr(), and other representations are truncated.
+#
     
 # total maximum number of lines
 _MAX_LINES = 17
@@ -40,6 +47,15 @@ _MAX_WRAPPED_ITEM_LINES = 5
 # max line width when line-wrapping
 _MAX_WIDTH = 80
 
+# maximum length of the representation of a single object
+_MAX_REPR_LENGTH = 2000
+
+# NumPy arrays with more elements than this are summarized
+_MAX_ARRAY_SIZE = 1000
+
+# number of elements shown at the start and end of a summarized array
+_ARRAY_EDGE_ITEMS = 3
+
 # Common parameters to the functions below:
 #
 #  open: opening delimeter
@@ -158,8 +174,16 @@ def __format_wrapped(sequence, open, close, nl):
 def __format_dict(obj, nl, object_stack):
     nl = nl + " "
 
+    # __format_separate() never looks at more than _MAX_LINES + 1 items, so
+    # rather than sorting the entire dictionary, we just pick out the first
+    # items in sorted order
+    if len(obj) > _MAX_LINES + 1:
+        items = heapq.nsmallest(_MAX_LINES + 1, obj.iteritems())
+    else:
+        items = sorted(obj.items())
+
     def iter():
-        for key, value in sorted(obj.items()):
+        for key, value in items:
             key_str, key_lines = __format(key, nl, object_stack)
             value_str, value_lines = __format(value, nl, object_stack)
 
@@ -169,15 +193,66 @@ def __format_dict(obj, nl, object_stack):
 
 def __format_sequence(obj, open, close, nl, object_stack):
     nl = nl + " "
-    
-    seq = (__format(x, nl, object_stack) for x in obj)
-    result = __format_wrapped(seq, open, close, nl)
+
+    # If wrapping fails, we format the sequence again as separate lines;
+    # remember the items we've already formatted so we don't have to
+    # format them twice.
+    source = (__format(x, nl, object_stack) for x in obj)
+    formatted = []
+    def seq():
+        for item in formatted:
+            yield item
+        for item in source:
+            formatted.append(item)
+            yield item
+
+    result = __format_wrapped(seq(), open, close, nl)
     if result is None:
-        seq = (__format(x, nl, object_stack) for x in obj)
-        result = __format_separate(seq, open, close, nl)
+        result = __format_separate(seq(), open, close, nl)
 
     return result
 
+def __format_string(obj):
+    if len(obj) <= _MAX_REPR_LENGTH:
+        return None
+
+    return "%s... (%d characters)" % (repr(obj[0:_MAX_REPR_LENGTH]), len(obj))
+
+def __format_array(obj, numpy):
+    if obj.size <= _MAX_ARRAY_SIZE:
+        return None
+
+    flat = obj.reshape(-1)
+    head = [repr(x) for x in flat[0:_ARRAY_EDGE_ITEMS].tolist()]
+    tail = [repr(x) for x in flat[obj.size - _ARRAY_EDGE_ITEMS:].tolist()]
+
+    return "array([%s, ..., %s], shape=%s, dtype=%s)" % (", ".join(head), ", ".join(tail),
+                                                          obj.shape, obj.dtype)
+
+def __format_leaf(obj):
+    t = type(obj)
+    repr_attr = getattr(t, '__repr__', None)
+
+    s = None
+    if (t is str or t is unicode) and len(obj) > _MAX_REPR_LENGTH:
+        s = __format_string(obj)
+    else:
+        # We don't want to import numpy just to check whether obj is an array
+        numpy = sys.modules.get('numpy')
+        if numpy is not None and isinstance(obj, numpy.ndarray) and repr_attr is numpy.ndarray.__repr__:
+            s = __format_array(obj, numpy)
+
+    if s is None:
+        s = repr(obj)
+        if len(s) > _MAX_REPR_LENGTH:
+            s = s[0:_MAX_REPR_LENGTH] + "..."
+
+    lines = s.split("\n")
+    if len(lines) > _MAX_LINES:
+        lines = lines[0:_MAX_LINES - 1] + ["..."]
+
+    return lines
+
 def __format(obj, nl, object_stack):
     for o in object_stack:
         if obj is o:
@@ -194,8 +269,8 @@ def __format(obj, nl, object_stack):
     elif issubclass(t, tuple) and repr_attr is tuple.__repr__:
         return __format_sequence(obj, '(', ')', nl, object_stack)
     else:
-        s = repr(obj)
-        return s.replace("\n", nl),  1 + s.count("\n")
+        lines = __format_leaf(obj)
+        return nl.join(lines), len(lines)
 
 def format(obj):
     """Format obj as text
@@ -339,3 +414,59 @@ if __name__ == "__main__":
     a.append(a)
 
     do_test(a, "[1, <Recursion>]")
+
+    # Only the first items of a large dictionary are shown
+    d = dict(((x, x) for x in range(10000)))
+    do_test(d,
+            """
+            {0: 0,
+             1: 1,
+             2: 2,
+             3: 3,
+             ...}
+            """)
+
+    # The items formatted while trying to wrap are reused for separate lines
+    class Counted(object):
+        count = 0
+        def __repr__(self):
+            Counted.count += 1
+            return "x" * 30
+    do_test([Counted(), Counted()],
+            """
+            [xxxxxxxxxxxxxxxxxxxxxxxxxxxxxx,
+             xxxxxxxxxxxxxxxxxxxxxxxxxxxxxx]
+            """)
+    if Counted.count != 2:
+        print "Expected 2 calls to repr(), got %d" % Counted.count
+
+    _MAX_REPR_LENGTH = 10
+    do_test("a" * 100, "'aaaaaaaaaa'... (100 characters)")
+    do_test(["a" * 100], "['aaaaaaaaaa'... (100 characters)]")
+
+    class Long(object):
+        def __repr__(self):
+            return "y" * 100
+    do_test(Long(), "yyyyyyyyyy...")
+
+    class Tall(object):
+        def __repr__(self):
+            return "\n".join(["z"] * 10)
+    do_test(Tall(),
+            """
+            z
+            z
+            z
+            z
+            ...
+            """)
+
+    try:
+        import numpy
+
+        _MAX_ARRAY_SIZE = 10
+        _ARRAY_EDGE_ITEMS = 2
+        do_test(numpy.arange(100),
+                "array([0, 1, ..., 98, 99], shape=(100,), dtype=%s)" % numpy.arange(100).dtype)
+    except ImportError:
+        pass
@@ -6,8 +6,13 @@
 #
 ########################################################################
 
+import inspect
 import re
 import pydoc
+import sys
+import thread
+import weakref
+
 import gtk
 
 from data_format import insert_with_tag, is_data_object
@@ -15,6 +20,9 @@ from data_format import insert_with_tag, is_data_object
 BOLD_RE = re.compile("(?:(.)\b(.))+")
 STRIP_BOLD_RE = re.compile("(.)\b(.)")
 
+# Number of objects that we keep formatted documentation for
+MAX_CACHED_DOCS = 64
+
 class TextDocShort(pydoc.TextDoc):
     """Formatter class that produces shorter docs for modules.
 
@@ -54,21 +62,38 @@ class TextDocShort(pydoc.TextDoc):
 textdocshort = TextDocShort()
 
 
-def format_docs(obj, callback):
-    """Gets the documentation for a given object, and format it simply
-      with a distinction between bold and normal
+# Maps id(obj) => [obj_ref, module_ref, module_version, segments, serial]; the
+# entry with the lowest serial is the least recently used. An entry is only
+# used if obj_ref() is still the object, since the id() of a freed object can
+# be reused.
+_docs_cache = {}
+_docs_cache_serial = 0
+_docs_cache_lock = thread.allocate_lock()
+
+def _make_ref(obj):
+    # Classes and modules defined in a worksheet would keep the worksheet's
+    # scopes alive, so we refer to objects weakly where possible; objects that
+    # can't be weakly referenced, like builtin functions, are held directly
+    try:
+        return weakref.ref(obj)
+    except TypeError:
+        return lambda: obj
+
+def _get_module_version(obj):
+    # Returns the module that obj is defined in and the version of that module;
+    # docs for an object are recomputed if these change
+    if inspect.ismodule(obj):
+        module = obj
+    else:
+        module_name = getattr(obj, '__module__', None)
+        if isinstance(module_name, basestring):
+            module = sys.modules.get(module_name)
+        else:
+            module = None
 
-    @param obj: the object to get documentation about
-    @param callback: callback called for each segment of text. Passed two
-      arguments; the text of the segment and a boolean that is True if the
-      text should be formatted in bold
+    return module, getattr(module, '__version__', None)
 
-    """
-    
-    # If the routine is an instance, we get help on the type instead
-    if is_data_object(obj):
-        obj = type(obj)
-        
+def _format_docs(obj, callback):
     name = getattr(obj, '__name__', None)
     document = textdocshort.document(obj, name)
 
@@ -90,6 +115,83 @@ def format_docs(obj, callback):
         callback(STRIP_BOLD_RE.sub(lambda m: m.group(1), m.group()), True)
         pos = m.end()
 
+def get_doc_segments(obj):
+    """Gets the documentation for a given object as a list of segments
+
+    Formatting the documentation for large modules and classes is slow,
+    so the result is cached; it must not be modified. This may be called
+    from any thread.
+
+    @param obj: the object to get documentation about
+    @returns: a list of (text, bold) tuples, see format_docs()
+
+    """
+
+    # If the routine is an instance, we get help on the type instead
+    if is_data_object(obj):
+        obj = type(obj)
+
+    module, module_version = _get_module_version(obj)
+
+    global _docs_cache_serial
+
+    _docs_cache_lock.acquire()
+    try:
+        entry = _docs_cache.get(id(obj))
+        if entry is not None:
+            obj_ref, module_ref, cached_module_version, segments, _ = entry
+            if (obj_ref() is obj and module_ref() is module and
+                cached_module_version == module_version):
+                _docs_cache_serial += 1
+                entry[4] = _docs_cache_serial
+                return segments
+    finally:
+        _docs_cache_lock.release()
+
+    segments = []
+    _format_docs(obj, lambda text, bold: segments.append((text, bold)))
+
+    _docs_cache_lock.acquire()
+    try:
+        _docs_cache_serial += 1
+        _docs_cache[id(obj)] = [_make_ref(obj), _make_ref(module), module_version, segments, _docs_cache_serial]
+        if len(_docs_cache) > MAX_CACHED_DOCS:
+            # Drop the entries for objects that have been freed first
+            for key in [key for key, entry in _docs_cache.iteritems() if entry[0]() is None]:
+                del _docs_cache[key]
+        if len(_docs_cache) > MAX_CACHED_DOCS:
+            oldest = min(_docs_cache.iterkeys(), key=lambda key: _docs_cache[key][4])
+            del _docs_cache[oldest]
+    finally:
+        _docs_cache_lock.release()
+
+    return segments
+
+def prefill_docs(objects):
+    """Format and cache the documentation for objects that are likely to be shown soon
+
+    @param objects: a list of objects; None entries are skipped
+
+    """
+
+    for obj in objects:
+        if obj is not None:
+            get_doc_segments(obj)
+
+def format_docs(obj, callback):
+    """Gets the documentation for a given object, and format it simply
+      with a distinction between bold and normal
+
+    @param obj: the object to get documentation about
+    @param callback: callback called for each segment of text. Passed two
+      arguments; the text of the segment and a boolean that is True if the
+      text should be formatted in bold
+
+    """
+
+    for text, bold in get_doc_segments(obj):
+        callback(text, bold)
+
 def insert_docs(buf, iter, obj, bold_tag):
     """Insert documentation about obj into a gtk.TextBuffer
 
@@ -9,13 +9,81 @@
 ########################################################################
 
 
+#--------------------------------------------------------------------------------------
+# An event loop runs functors in the thread that calls run(). It provides:
+#
+#   run()                - run until quit() is called
+#   quit()               - make run() return
+#   cache_event(functor) - call functor once from the loop; any number of calls made
+#                          before the loop gets to it are coalesced into a single call
+#                          (the usual way for a thread to notify the loop of progress)
+#   add_idle(functor)    - call functor from the loop; every functor passed is called
+#
+# Functors passed to add_idle() are called again as long as they return True.
+# All of these except run() may be called from any thread.
+#
+# Which backend eventLoop() returns is selected with set_backend(), or by
+# setting REINTERACT_EVENT_LOOP in the environment: 'glib' (the default when
+# GLib is available) or 'python', which doesn't need GLib, for running
+# worksheets headless.
+#
+
+
+#--------------------------------------------------------------------------------------
+class _CachedEvents(object) :
+    # Functors passed to cache_event() that are waiting to be called; functors
+    # that compare equal (like two bound methods for the same object) are only
+    # called once
+    #--------------------------------------------------------------------------------------
+    def __init__( self ) :
+        import thread
+        self._lock = thread.allocate_lock()
+        self._functors = []
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def add( self, functor ) :
+        # Returns True if the caller needs to schedule a call to run()
+        self._lock.acquire()
+        try :
+            a_first = len( self._functors ) == 0
+            if not functor in self._functors :
+                self._functors.append( functor )
+                pass
+
+            return a_first
+        finally :
+            self._lock.release()
+            pass
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def run( self ) :
+        self._lock.acquire()
+        try :
+            a_functors = self._functors
+            self._functors = []
+        finally :
+            self._lock.release()
+            pass
+
+        for a_functor in a_functors :
+            a_functor()
+            pass
+
+        return False
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
 #--------------------------------------------------------------------------------------
 class _GLibEventLoop(object) :
     #--------------------------------------------------------------------------------------
     def __init__( self ) :
         import glib
         self._loop = glib.MainLoop()
-        self._source_tag = None
+        self._cached_events = _CachedEvents()
         pass
 
     #--------------------------------------------------------------------------------------
@@ -30,28 +98,159 @@ class _GLibEventLoop(object) :
 
     #--------------------------------------------------------------------------------------
     def cache_event( self, functor ) :
+        # One idle source for a whole batch of notifications, rather than removing
+        # and adding a source for each one
+        if self._cached_events.add( functor ) :
+            import glib
+            glib.idle_add( self._cached_events.run )
+            pass
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def add_idle( self, functor ) :
+        # Unlike cache_event(), every functor passed here gets called
         import glib
-        if self._source_tag != None :
-            glib.source_remove( self._source_tag )
+        glib.idle_add( functor )
+        pass
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+class _PythonEventLoop(object) :
+    # An event loop that doesn't need GLib; functors are queued and run() waits
+    # on a condition variable for them
+    #--------------------------------------------------------------------------------------
+    def __init__( self ) :
+        import collections
+        import thread
+        import threading
+        self._condition = threading.Condition( thread.allocate_lock() )
+        self._queue = collections.deque()
+        self._quit = False
+        self._cached_events = _CachedEvents()
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def run( self ) :
+        while True :
+            self._condition.acquire()
+            try :
+                while len( self._queue ) == 0 and not self._quit :
+                    self._condition.wait()
+                    pass
+
+                if self._quit :
+                    self._quit = False
+                    return
+
+                a_functor = self._queue.popleft()
+            finally :
+                self._condition.release()
+                pass
+
+            if a_functor() :
+                self.add_idle( a_functor )
+                pass
             pass
+        pass
 
-        self._source_tag = glib.idle_add( functor )
+    #--------------------------------------------------------------------------------------
+    def quit( self ) :
+        self._condition.acquire()
+        try :
+            self._quit = True
+            self._condition.notify()
+        finally :
+            self._condition.release()
+            pass
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def cache_event( self, functor ) :
+        if self._cached_events.add( functor ) :
+            self.add_idle( self._cached_events.run )
+            pass
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def add_idle( self, functor ) :
+        self._condition.acquire()
+        try :
+            self._queue.append( functor )
+            self._condition.notify()
+        finally :
+            self._condition.release()
+            pass
         pass
 
     #--------------------------------------------------------------------------------------
     pass
 
 
+#--------------------------------------------------------------------------------------
+_BACKENDS = {
+    'glib' : _GLibEventLoop,
+    'python' : _PythonEventLoop
+}
+
+
+#--------------------------------------------------------------------------------------
+def _default_backend() :
+    import os
+    a_name = os.environ.get( 'REINTERACT_EVENT_LOOP' )
+    if a_name in _BACKENDS :
+        return a_name
+
+    try :
+        import glib
+        return 'glib'
+    except ImportError :
+        return 'python'
+
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def set_backend( the_name ) :
+    """
+    Select the event loop implementation that eventLoop() returns, 'glib' or 'python'.
+    Must be called before eventLoop() is first called.
+    """
+    if not the_name in _BACKENDS :
+        raise ValueError( "Unknown event loop backend '%s'" % the_name )
+
+    if hasattr( eventLoop, '_engine' ) and not isinstance( eventLoop._engine, _BACKENDS[ the_name ] ) :
+        raise RuntimeError( "The event loop is already in use" )
+
+    eventLoop._backend = the_name
+    pass
+
+
 #--------------------------------------------------------------------------------------
 def eventLoop() :
     # If we create more than one glib.MainLoop, we trigger a pygobject
     # bug - https://bugzilla.gnome.org/show_bug.cgi?id=663068 - so create
     # just one and use it for all the test runs.
     if not hasattr( eventLoop, '_engine' ) :
-        eventLoop._engine = _GLibEventLoop()
+        if not hasattr( eventLoop, '_backend' ) :
+            eventLoop._backend = _default_backend()
+            pass
+
+        eventLoop._engine = _BACKENDS[ eventLoop._backend ]()
         pass
 
     return eventLoop._engine
 
 
+#--------------------------------------------------------------------------------------
+def create_event_loop( the_name ) :
+    """
+    Create a separate event loop of the given backend, for example to run
+    the execution engine of a worksheet headless
+    """
+    return _BACKENDS[ the_name ]()
+
+
 #--------------------------------------------------------------------------------------
@@ -0,0 +1,355 @@
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+import thread
+import threading
+import time
+
+#
+# Worksheets calculate in the background, so several of them can be
+# calculating at once. Rather than each calculation getting its own thread,
+# the ThreadExecutors are queued with the ExecutionScheduler, which runs them
+# with a bounded number of threads that are reused from one calculation to
+# the next. Queued calculations for the worksheet the user is looking at go
+# ahead of the others.
+#
+# Calculations that have started aren't preempted, so a long calculation
+# holds on to its thread until it's done or interrupted. So that calculations
+# in the background can't hold up the worksheet the user is looking at, when
+# all the threads are busy, a calculation for that worksheet gets one thread
+# beyond the maximum.
+#
+
+def _default_max_threads():
+    try:
+        import multiprocessing
+        cpu_count = multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        cpu_count = 1
+
+    # With a single thread, one long calculation would block all the others
+    return max(2, cpu_count)
+
+class ExecutionJob(object):
+    """A ThreadExecutor queued with ExecutionScheduler.submit()"""
+
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+
+    def __init__(self, scheduler, executor, owner):
+        self.scheduler = scheduler
+        self.executor = executor
+        #: the object the job was submitted for, normally a Worksheet
+        self.owner = owner
+        self.state = ExecutionJob.QUEUED
+        #: time.time() when the job was submitted
+        self.submit_time = time.time()
+        #: time.time() when the job started running, or None
+        self.start_time = None
+
+    def get_wait_time(self):
+        """Get how long the job waited before it started running, in seconds;
+        if it is still queued, how long it has waited so far"""
+
+        start_time = self.start_time
+        if start_time is None:
+            start_time = time.time()
+
+        return start_time - self.submit_time
+
+    def cancel(self):
+        """Cancel the job; if it is queued, it is removed from the queue, and if it is
+        running, the executor is interrupted. Either way, the executor finishes as
+        described for ThreadExecutor.interrupt()."""
+
+        self.scheduler._cancel(self)
+
+class ExecutionScheduler(object):
+    """Run ThreadExecutors with a bounded pool of reused threads
+
+    Jobs are run in the order they were submitted, except that jobs for the
+    focused owner (see set_focused()) are run before any others, and when all
+    the threads are busy, one of them can run in an extra thread.
+
+    """
+
+    def __init__(self, max_threads=None):
+        """Initialize the ExecutionScheduler object
+
+        @param max_threads: the most executors to run at once, not counting one
+          for the focused owner; defaults to the number of processors, but at least 2
+
+        """
+
+        if max_threads is None:
+            max_threads = _default_max_threads()
+
+        self.max_threads = max_threads
+
+        self.__condition = threading.Condition(thread.allocate_lock())
+        self.__queue = []
+        self.__running = []
+        self.__idle_threads = 0
+        self.__thread_count = 0
+        self.__focused = None
+        # owner => wait time of the last job for the owner that started
+        self.__last_wait_times = {}
+
+    def submit(self, executor, owner=None):
+        """Queue a ThreadExecutor to be run
+
+        The executor should be compiled; ThreadExecutor.run() is called for it
+        in one of the threads of the scheduler.
+
+        @param executor: the ThreadExecutor to run
+        @param owner: the object the executor is run for, normally a Worksheet
+        @returns: an ExecutionJob
+
+        """
+
+        job = ExecutionJob(self, executor, owner)
+
+        self.__condition.acquire()
+        try:
+            self.__queue.append(job)
+            self.__start_job()
+        finally:
+            self.__condition.release()
+
+        return job
+
+    def set_focused(self, owner):
+        """Set the owner, normally a Worksheet, whose jobs run before the others, or None"""
+
+        self.__condition.acquire()
+        try:
+            self.__focused = owner
+            if self.__queue:
+                self.__start_job()
+        finally:
+            self.__condition.release()
+
+    def forget(self, owner):
+        """Drop what the scheduler knows about owner, like when a worksheet is closed"""
+
+        self.__condition.acquire()
+        try:
+            self.__last_wait_times.pop(owner, None)
+            if self.__focused is owner:
+                self.__focused = None
+        finally:
+            self.__condition.release()
+
+    def get_queue_depth(self):
+        """Get the number of jobs waiting to be run"""
+
+        self.__condition.acquire()
+        try:
+            return len(self.__queue)
+        finally:
+            self.__condition.release()
+
+    def get_running_count(self):
+        """Get the number of jobs currently running"""
+
+        self.__condition.acquire()
+        try:
+            return len(self.__running)
+        finally:
+            self.__condition.release()
+
+    def get_wait_time(self, owner):
+        """Get how long the calculation for owner waited to run, in seconds
+
+        @returns: how long its queued job has waited so far, if it has one;
+          otherwise how long its last job waited before starting, or None
+
+        """
+
+        self.__condition.acquire()
+        try:
+            for job in self.__queue:
+                if job.owner is owner:
+                    return job.get_wait_time()
+
+            return self.__last_wait_times.get(owner)
+        finally:
+            self.__condition.release()
+
+    def _cancel(self, job):
+        self.__condition.acquire()
+        try:
+            queued = job.state == ExecutionJob.QUEUED
+            if queued:
+                self.__queue.remove(job)
+                job.state = ExecutionJob.DONE
+        finally:
+            self.__condition.release()
+
+        job.executor.interrupt()
+        if queued:
+            # No statements are executed for an executor that was interrupted
+            # before it started, so this just finishes it off. That makes it safe
+            # to do synchronously on the caller's thread, even when that is the
+            # main thread (as for Worksheet.interrupt() and destroy()): no user
+            # code runs, the executor lock is only held briefly, and the
+            # completion signals are emitted later from the event loop.
+            job.executor.run()
+
+    def __has_focused_job(self):
+        # Must be called with the lock held
+        for job in self.__queue:
+            if job.owner is not None and job.owner is self.__focused:
+                return True
+
+        return False
+
+    def __start_job(self):
+        # Must be called with the lock held; get a thread to run the next queued job
+        if self.__idle_threads > 0:
+            self.__condition.notify()
+        elif (self.__thread_count < self.max_threads or
+              (self.__thread_count == self.max_threads and self.__has_focused_job())):
+            self.__thread_count += 1
+            thread.start_new_thread(self.__run_thread, ())
+
+    def __next_job(self):
+        # Must be called with the lock held
+        for i, job in enumerate(self.__queue):
+            if job.owner is not None and job.owner is self.__focused:
+                return self.__queue.pop(i)
+
+        return self.__queue.pop(0)
+
+    def __run_thread(self):
+        while True:
+            self.__condition.acquire()
+            try:
+                while not self.__queue:
+                    self.__idle_threads += 1
+                    self.__condition.wait()
+                    self.__idle_threads -= 1
+
+                job = self.__next_job()
+                job.state = ExecutionJob.RUNNING
+                job.start_time = time.time()
+                self.__running.append(job)
+                if job.owner is not None:
+                    self.__last_wait_times[job.owner] = job.get_wait_time()
+            finally:
+                self.__condition.release()
+
+            exiting = True
+            try:
+                job.executor.run()
+                exiting = False
+            finally:
+                self.__condition.acquire()
+                try:
+                    self.__running.remove(job)
+                    job.state = ExecutionJob.DONE
+                    # If something went badly wrong, this thread exits; let a
+                    # new one take its place
+                    if exiting:
+                        self.__thread_count -= 1
+                    elif self.__thread_count > self.max_threads:
+                        # Don't keep the extra thread for the focused owner around
+                        self.__thread_count -= 1
+                        exiting = True
+                finally:
+                    self.__condition.release()
+
+            if exiting:
+                return
+
+def executionScheduler():
+    """Get the ExecutionScheduler shared by all the worksheets of the application"""
+
+    if not hasattr(executionScheduler, '_scheduler'):
+        executionScheduler._scheduler = ExecutionScheduler()
+
+    return executionScheduler._scheduler
+
+####################################################################################
+
+if __name__ == "__main__":
+    from event_loop import create_event_loop
+    from notebook import Notebook
+    from statement import Statement
+    import stdout_capture
+    from thread_executor import ThreadExecutor
+    from worksheet import Worksheet
+
+    stdout_capture.init()
+
+    def expect(result, expected):
+        if result != expected:
+            print "Got %r, expected %r" % (result, expected)
+
+    loop = create_event_loop('python')
+    worksheet = Worksheet(Notebook())
+    scheduler = ExecutionScheduler(max_threads=1)
+
+    order = []
+    def create_job(owner, text):
+        executor = ThreadExecutor(event_loop=loop)
+        executor.add_statement(Statement(text, worksheet))
+        executor.compile()
+        executor.sig_complete.connect(lambda executor: order.append(owner))
+        return scheduler.submit(executor, owner)
+
+    # Block the only thread until we've queued everything
+    gate = thread.allocate_lock()
+    gate.acquire()
+    worksheet.global_scope['gate'] = gate
+
+    blocker = create_job('blocker', "gate.acquire()")
+    while blocker.state == ExecutionJob.QUEUED:
+        time.sleep(0.01)
+
+    create_job('a', "a = 1")
+    b = create_job('b', "b = 1")
+    c = create_job('c', "c = 1")
+    expect(scheduler.get_queue_depth(), 3)
+    expect(scheduler.get_running_count(), 1)
+    expect(scheduler.get_wait_time('a') >= 0, True)
+    expect(scheduler.get_wait_time('d'), None)
+
+    # Cancelling a queued job finishes it off without running it
+    b.cancel()
+    expect(scheduler.get_queue_depth(), 2)
+    expect(b.executor.statements[0].state, Statement.INTERRUPTED)
+
+    # The focused job jumps the queue, and since the only thread is busy, it
+    # gets an extra one
+    scheduler.set_focused('c')
+    while c.state != ExecutionJob.DONE:
+        time.sleep(0.01)
+    expect(scheduler.get_queue_depth(), 1)
+
+    gate.release()
+    while len(order) < 4:
+        loop.add_idle(loop.quit)
+        loop.run()
+        time.sleep(0.01)
+
+    expect(order, ['b', 'c', 'blocker', 'a'])
+    expect(scheduler.get_queue_depth(), 0)
+
+    # Cancelling a running job interrupts it
+    job = create_job('d', "while True: pass")
+    while job.state == ExecutionJob.QUEUED:
+        time.sleep(0.01)
+    job.cancel()
+    while len(order) < 5:
+        loop.add_idle(loop.quit)
+        loop.run()
+        time.sleep(0.01)
+    expect(job.executor.statements[0].state, Statement.INTERRUPTED)
+    expect(scheduler.get_wait_time('d') >= 0, True)
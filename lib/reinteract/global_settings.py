@@ -66,6 +66,7 @@ class GlobalSettings(gobject.GObject):
     doc_tooltip_font_name = _string_property('doc_tooltip_font_name', default="Sans 11")
 
     autocomplete = _bool_property('autocomplete', default=True)
+    prefetch_imports = _bool_property('prefetch_imports', default=False)
 
     def __init__(self):
         gobject.GObject.__init__(self)
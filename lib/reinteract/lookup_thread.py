@@ -0,0 +1,206 @@
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+import thread
+import threading
+import time
+
+from event_loop import eventLoop
+
+# How long (in seconds) we wait for a lookup before giving up on it. Lookups
+# call getattr() and friends on arbitrary user objects, so they may take
+# arbitrarily long or never return at all.
+DEFAULT_DEADLINE = 2.0
+
+class _TimedOut(object):
+    def __repr__(self):
+        return "TIMED_OUT"
+
+#: Passed to the callback of a request in place of the result when the lookup
+#: doesn't finish before its deadline
+TIMED_OUT = _TimedOut()
+
+class LookupRequest(object):
+    """A lookup queued with LookupThread.run()"""
+
+    def __init__(self, func, callback, deadline):
+        self.func = func
+        self.callback = callback
+        self.deadline = deadline
+        self.cancelled = False
+        # Set in the main thread once the callback has been called
+        self.delivered = False
+
+    def cancel(self):
+        """Cancel the request; if it hasn't completed, the callback will not be called"""
+        self.cancelled = True
+
+    def expired(self):
+        return time.time() > self.deadline
+
+class _Worker(object):
+    def __init__(self):
+        self.current = None
+        self.abandoned = False
+
+class LookupThread(object):
+    """Run lookups on user objects (completions, doc targets) outside the main thread
+
+    Requests are run one at a time in order, in a thread separate from the
+    main thread, and the callback is called with the result in the main
+    thread. Requests that are cancelled are dropped silently; for a request
+    that doesn't finish before its deadline, the callback is called with
+    TIMED_OUT instead, and a result that comes in later is dropped. If the
+    running lookup is past its deadline when a new request comes in, the
+    thread it is running in is abandoned (it will exit whenever the lookup
+    finally returns) and a new thread is started for the new request, so one
+    stuck lookup can't block the rest.
+
+    """
+
+    def __init__(self, event_loop=None, deadline=DEFAULT_DEADLINE):
+        if event_loop is None:
+            event_loop = eventLoop()
+
+        self.event_loop = event_loop
+        self.deadline = deadline
+
+        self.__condition = threading.Condition(thread.allocate_lock())
+        self.__queue = []
+        self.__worker = None
+        self.__destroyed = False
+        # Requests that neither a result nor TIMED_OUT has been queued for yet;
+        # while there are any, a watchdog thread waits for the first of their
+        # deadlines
+        self.__waiting = []
+        self.__watchdog_running = False
+
+    def destroy(self):
+        self.__condition.acquire()
+        try:
+            self.__destroyed = True
+            for request in self.__queue:
+                request.cancel()
+            self.__queue = []
+            self.__waiting = []
+            if self.__worker is not None:
+                if self.__worker.current is not None:
+                    self.__worker.current.cancel()
+                self.__worker.abandoned = True
+                self.__worker = None
+            self.__condition.notifyAll()
+        finally:
+            self.__condition.release()
+
+    def run(self, func, callback):
+        """Queue func to be called in the lookup thread
+
+        @param func: function taking no arguments that does the lookup
+        @param callback: function called in the main thread with the return value of func
+        @returns: a LookupRequest; call cancel() on it if the result is no longer needed
+
+        """
+
+        request = LookupRequest(func, callback, time.time() + self.deadline)
+
+        self.__condition.acquire()
+        try:
+            if self.__destroyed:
+                request.cancel()
+                return request
+
+            self.__queue.append(request)
+            self.__waiting.append(request)
+            if not self.__watchdog_running:
+                self.__watchdog_running = True
+                thread.start_new_thread(self.__run_watchdog, ())
+
+            worker = self.__worker
+            if worker is not None and worker.current is not None and worker.current.expired():
+                worker.current.cancel()
+                worker.abandoned = True
+                worker = None
+
+            if worker is None:
+                self.__worker = _Worker()
+                thread.start_new_thread(self.__run_thread, (self.__worker,))
+
+            # Wake up the worker, and the watchdog so it sees the new deadline
+            self.__condition.notifyAll()
+        finally:
+            self.__condition.release()
+
+        return request
+
+    def __deliver(self, request, result):
+        # Called in the main thread; the request may have been cancelled since
+        # the result was queued, or both the result and TIMED_OUT may have been
+        # queued, in which case whichever comes first wins.
+        if not (request.cancelled or request.delivered):
+            request.delivered = True
+            request.callback(result)
+
+        return False
+
+    def __queue_result(self, request, result):
+        # Must be called with the lock held
+        if request in self.__waiting:
+            self.__waiting.remove(request)
+            if not request.cancelled:
+                self.event_loop.add_idle(lambda: self.__deliver(request, result))
+
+    def __run_watchdog(self):
+        self.__condition.acquire()
+        try:
+            while True:
+                now = time.time()
+                for request in self.__waiting[:]:
+                    if request.cancelled:
+                        self.__waiting.remove(request)
+                    elif request.deadline <= now:
+                        self.__queue_result(request, TIMED_OUT)
+
+                if not self.__waiting:
+                    break
+
+                self.__condition.wait(min(r.deadline for r in self.__waiting) - now)
+
+            self.__watchdog_running = False
+        finally:
+            self.__condition.release()
+
+    def __run_thread(self, worker):
+        while True:
+            self.__condition.acquire()
+            try:
+                while not self.__queue and not worker.abandoned:
+                    self.__condition.wait()
+                if worker.abandoned:
+                    return
+                request = self.__queue.pop(0)
+                worker.current = request
+            finally:
+                self.__condition.release()
+
+            if not (request.cancelled or request.expired()):
+                try:
+                    result = request.func()
+                except Exception:
+                    # We have nowhere to report the error; a failed lookup
+                    # just finds nothing
+                    request.cancel()
+
+            self.__condition.acquire()
+            try:
+                worker.current = None
+                if not (request.cancelled or request.expired()):
+                    self.__queue_result(request, result)
+                elif request.cancelled and request in self.__waiting:
+                    self.__waiting.remove(request)
+            finally:
+                self.__condition.release()
@@ -0,0 +1,280 @@
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+from collections import deque
+import itertools
+import sys
+import types
+
+#
+# Every statement in a worksheet keeps its result scope alive, so that later
+# statements can be recalculated without recalculating the earlier ones.
+# The result scope is a shallow copy of the scope of the parent statement,
+# so what a statement adds to the memory used by the worksheet is the
+# objects bound to the names it binds or rebinds, minus anything that the
+# parent scope already keeps alive.
+#
+# We only know about sharing cheaply for the objects directly bound in the
+# parent scope and for the old value of a rebound name (which covers the
+# copy we make before a statement modifies a variable), so:
+#
+#   a = [[0] * 1000]
+#   b = a[0]
+#
+# counts the inner list twice. The sizes are estimates in any case: large
+# containers are estimated from a sample of their items, and we give up on
+# looking deeper once we've looked at MAX_VISITED objects.
+#
+
+# Containers with more items than this are estimated from the first ones
+MAX_SAMPLED_ITEMS = 100
+# We don't look further into objects nested deeper than this
+MAX_DEPTH = 20
+# Or once we have looked at this many objects for a statement
+MAX_VISITED = 20000
+# We don't bother checking whether objects that we don't look into and are
+# smaller than this are shared with the parent scope
+MIN_SHARED_CHECK_SIZE = 1024
+
+# Objects that we count, but don't look into; they are normally shared with
+# modules or other code rather than owned by the worksheet
+_OPAQUE_TYPES = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                 types.MethodType, types.ClassType, types.CodeType, types.FrameType,
+                 type, basestring, int, long, float, complex)
+
+_ITEM_CONTAINER_TYPES = (list, tuple, set, frozenset, deque)
+
+class _SizeEstimator(object):
+    def __init__(self):
+        self.seen = set()
+        self.visited = 0
+        self.__shared_scope = None
+        self.__shared_ids = None
+        # We don't want to import numpy just to check whether an object is an array
+        self.numpy = sys.modules.get('numpy')
+
+    def __sample(self, items, count, depth):
+        # Total size of the items of a container with count items
+        size = 0
+        for item in itertools.islice(items, MAX_SAMPLED_ITEMS):
+            size += self.get_size(item, depth)
+
+        if count > MAX_SAMPLED_ITEMS:
+            size = size * count // MAX_SAMPLED_ITEMS
+
+        return size
+
+    def get_size(self, obj, depth=0):
+        """Estimate the memory used by obj and the objects it refers to, not counting
+        objects we've already seen"""
+
+        if id(obj) in self.seen:
+            return 0
+        self.seen.add(id(obj))
+        self.visited += 1
+
+        try:
+            size = sys.getsizeof(obj)
+        except Exception:
+            # getsizeof() calls obj.__sizeof__(), which could do anything
+            size = 0
+
+        opaque = isinstance(obj, _OPAQUE_TYPES)
+        if self.__shared_scope is not None and (size >= MIN_SHARED_CHECK_SIZE or not opaque):
+            if self.__shared_ids is None:
+                # Building this is proportional to the size of the scope, so we
+                # avoid it for statements that only bind small things like numbers
+                self.__shared_ids = set(map(id, self.__shared_scope.itervalues()))
+            if id(obj) in self.__shared_ids:
+                return 0
+
+        if depth >= MAX_DEPTH or self.visited > MAX_VISITED or opaque:
+            return size
+
+        numpy = self.numpy
+        if numpy is not None and isinstance(obj, numpy.ndarray):
+            # Depending on the version of numpy, getsizeof() might or might not include
+            # the data; a view doesn't own its data, but keeps the array it's a view of alive
+            if obj.base is None:
+                if size < obj.nbytes:
+                    size += obj.nbytes
+            else:
+                size += self.get_size(obj.base, depth + 1)
+            return size
+
+        try:
+            if isinstance(obj, dict):
+                size += self.__sample(itertools.chain.from_iterable(obj.iteritems()), 2 * len(obj), depth + 1)
+            elif isinstance(obj, _ITEM_CONTAINER_TYPES):
+                size += self.__sample(iter(obj), len(obj), depth + 1)
+        except Exception:
+            # Subclasses can override iteration to do anything; we just count the
+            # container itself
+            pass
+
+        try:
+            obj_dict = obj.__dict__
+        except Exception:
+            obj_dict = None
+        if isinstance(obj_dict, dict):
+            size += self.get_size(obj_dict, depth + 1)
+
+        return size
+
+    def mark_shared(self, obj):
+        """Record that obj and the objects it refers to are kept alive elsewhere"""
+
+        self.get_size(obj)
+
+    def set_shared_scope(self, scope):
+        """Record that the objects bound in scope are kept alive elsewhere"""
+
+        self.__shared_scope = scope
+        self.__shared_ids = None
+
+def estimate_size(obj):
+    """Estimate the memory used by an object and the objects it refers to
+
+    @returns: an estimate of the size in bytes
+
+    """
+
+    return _SizeEstimator().get_size(obj)
+
+def _is_accounted_name(name, value):
+    # Names like __builtins__ and __reinteract_statement are ours, not the user's
+    return not name.startswith('__') and not isinstance(value, types.ModuleType)
+
+class BindingMemory(object):
+    """The memory that a statement keeps alive through one variable"""
+
+    def __init__(self, name, size, type_name):
+        #: the name of the variable
+        self.name = name
+        #: the estimated size of the objects only this statement keeps alive, in bytes
+        self.size = size
+        #: the name of the type of the value of the variable
+        self.type_name = type_name
+
+class ScopeMemory(object):
+    """The memory that a statement keeps alive beyond what its parent keeps alive"""
+
+    def __init__(self, bindings):
+        #: list of BindingMemory, largest first
+        self.bindings = sorted(bindings, key=lambda binding: binding.size, reverse=True)
+        #: the estimated total size, in bytes
+        self.total = sum(binding.size for binding in bindings)
+
+def measure_scope_memory(scope, parent_scope, names=None):
+    """Estimate the memory kept alive by the variables bound or rebound in a scope
+
+    @param scope: the result scope of a statement
+    @param parent_scope: the scope the statement was executed in
+    @param names: the names that the statement might have bound, or None to look
+      at all the names in the scope. (Scopes can have thousands of names, so
+      looking at all of them for every statement adds up.)
+    @returns: a ScopeMemory object
+
+    """
+
+    estimator = _SizeEstimator()
+
+    if names is None:
+        names = scope.iterkeys()
+
+    changed = []
+    for name in names:
+        value = scope.get(name, scope)
+        if value is scope or not _is_accounted_name(name, value):
+            continue
+
+        old_value = parent_scope.get(name, scope)
+        if old_value is value:
+            continue
+        if old_value is not scope:
+            estimator.mark_shared(old_value)
+
+        changed.append(name)
+
+    estimator.set_shared_scope(parent_scope)
+
+    # Looking at the old values shouldn't use up our budget for the new ones
+    estimator.visited = 0
+
+    # Sort so that an object bound to two names is always counted for the same one
+    changed.sort()
+
+    bindings = []
+    for name in changed:
+        value = scope[name]
+        bindings.append(BindingMemory(name, estimator.get_size(value), type(value).__name__))
+
+    return ScopeMemory(bindings)
+
+####################################################################################
+
+if __name__ == "__main__":
+    def expect(result, expected):
+        if result != expected:
+            print "Got %r, expected %r" % (result, expected)
+
+    # Containers include their items, but shared items are counted once
+    item = 'x' * 1000
+    expect(estimate_size([item, item]) >= 1000, True)
+    expect(estimate_size([item, item]) < 2000, True)
+    expect(estimate_size({'a': item}) > 1000, True)
+
+    # Large containers are estimated from a sample
+    big = [str(i) * 100 for i in xrange(10 * MAX_SAMPLED_ITEMS)]
+    exact = sys.getsizeof(big) + sum(sys.getsizeof(s) for s in big)
+    expect(abs(estimate_size(big) - exact) < exact / 2, True)
+
+    class Thing(object):
+        def __init__(self):
+            self.data = 'y' * 10000
+    expect(estimate_size(Thing()) > 10000, True)
+
+    # Containers that can't be iterated are counted without their items
+    class BadList(list):
+        def __iter__(self):
+            raise RuntimeError("no iterating")
+    expect(estimate_size(BadList([item])) < 1000, True)
+
+    # Cycles don't hang
+    cycle = []
+    cycle.append(cycle)
+    expect(estimate_size(cycle), sys.getsizeof(cycle))
+
+    parent_scope = {'__builtins__': {}, 'a': item, 'l': [item, 'z' * 500], 'unchanged': [1, 2, 3], 'sys': sys}
+    scope = dict(parent_scope)
+    scope['b'] = (item, 'w' * 2000)
+    scope['l'] = list(parent_scope['l']) # what a statement modifying l does
+    scope['l'].append(1)
+    memory = measure_scope_memory(scope, parent_scope)
+
+    expect([binding.name for binding in memory.bindings], ['b', 'l'])
+    b = memory.bindings[0]
+    expect(b.type_name, 'tuple')
+    expect(2000 < b.size < 3000, True)
+    l = memory.bindings[1]
+    expect(l.size < 500, True)
+    expect(memory.total, b.size + l.size)
+
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    if numpy is not None:
+        array = numpy.zeros(100000)
+        expect(estimate_size(array) >= array.nbytes, True)
+        # A view keeps the whole array alive
+        expect(estimate_size(array[0:10]) >= array.nbytes, True)
+
+        memory = measure_scope_memory({'array': array, 'view': array[0:10]}, {'array': array})
+        expect(memory.bindings[0].size < array.nbytes, True)
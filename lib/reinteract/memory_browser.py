@@ -0,0 +1,197 @@
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+import gobject
+import gtk
+
+from format_escaped import format_escaped
+from notebook import NotebookFile
+from resource_limits import format_size
+
+# We only list this many of the largest variables
+MAX_ROWS = 100
+
+(_COLUMN_CHUNK,
+ _COLUMN_NAME,
+ _COLUMN_LINE,
+ _COLUMN_TYPE,
+ _COLUMN_SIZE) = range(5)
+
+class MemoryBrowser(gtk.VBox):
+
+    """
+    Widget listing the variables of a worksheet that keep the most memory alive.
+
+    Each row is a variable bound by a statement in the worksheet; the same name
+    can appear several times if it is rebound. Activating a row moves the cursor
+    to the statement, and the 'Drop' button inserts a 'del' statement so that the
+    variable is no longer kept alive by the statements after its last use.
+
+    """
+
+    def __init__(self):
+        gtk.VBox.__init__(self, False, 4)
+
+        self.worksheet = None
+        self.__refresh_source = None
+
+        self.__model = gtk.ListStore(gobject.TYPE_PYOBJECT, str, int, str, gobject.TYPE_INT64)
+        self.__model.set_sort_column_id(_COLUMN_SIZE, gtk.SORT_DESCENDING)
+
+        self.__view = gtk.TreeView(self.__model)
+        self.__view.connect('row-activated', self.on_row_activated)
+        self.__view.get_selection().connect('changed', self.on_selection_changed)
+
+        self.__add_column("Name", _COLUMN_NAME, self.__name_cell_data_func)
+        self.__add_column("Line", _COLUMN_LINE, self.__line_cell_data_func)
+        self.__add_column("Type", _COLUMN_TYPE, self.__type_cell_data_func)
+        self.__add_column("Size", _COLUMN_SIZE, self.__size_cell_data_func)
+
+        scrolled_window = gtk.ScrolledWindow()
+        scrolled_window.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scrolled_window.set_shadow_type(gtk.SHADOW_IN)
+        scrolled_window.add(self.__view)
+        self.pack_start(scrolled_window, expand=True, fill=True)
+
+        hbox = gtk.HBox(False, 4)
+        self.__total_label = gtk.Label()
+        self.__total_label.set_alignment(0., 0.5)
+        hbox.pack_start(self.__total_label, expand=True, fill=True)
+        self.__drop_button = gtk.Button("_Drop")
+        self.__drop_button.set_tooltip_text("Remove the variable after the last statement that uses it")
+        self.__drop_button.connect('clicked', self.on_drop_clicked)
+        hbox.pack_end(self.__drop_button, expand=False, fill=False)
+        self.pack_start(hbox, expand=False, fill=False)
+
+        self.connect('destroy', self.on_destroy)
+
+        self.__update_drop_sensitivity()
+
+    def __add_column(self, title, sort_column, cell_data_func):
+        column = gtk.TreeViewColumn(title)
+        cell_renderer = gtk.CellRendererText()
+        column.pack_start(cell_renderer, True)
+        column.set_cell_data_func(cell_renderer, cell_data_func)
+        column.set_sort_column_id(sort_column)
+        column.set_resizable(True)
+        self.__view.append_column(column)
+
+    def __name_cell_data_func(self, column, cell, model, iter):
+        cell.props.text = model.get_value(iter, _COLUMN_NAME)
+
+    def __line_cell_data_func(self, column, cell, model, iter):
+        cell.props.text = str(model.get_value(iter, _COLUMN_LINE))
+
+    def __type_cell_data_func(self, column, cell, model, iter):
+        cell.props.text = model.get_value(iter, _COLUMN_TYPE)
+
+    def __size_cell_data_func(self, column, cell, model, iter):
+        cell.props.text = format_size(model.get_value(iter, _COLUMN_SIZE))
+
+    def __get_selected(self):
+        model, iter = self.__view.get_selection().get_selected()
+        if iter is None:
+            return None, None
+
+        return model.get_value(iter, _COLUMN_CHUNK), model.get_value(iter, _COLUMN_NAME)
+
+    def __update_drop_sensitivity(self):
+        chunk, name = self.__get_selected()
+        self.__drop_button.set_sensitive(chunk is not None and
+                                         self.worksheet is not None and
+                                         self.worksheet.state != NotebookFile.EXECUTING)
+
+    def __refresh(self):
+        if self.__refresh_source is not None:
+            gobject.source_remove(self.__refresh_source)
+            self.__refresh_source = None
+
+        self.__model.clear()
+
+        total = 0
+        if self.worksheet is not None:
+            for chunk, binding in self.worksheet.get_largest_bindings():
+                total += binding.size
+                if len(self.__model) < MAX_ROWS:
+                    # The line is 1-based as shown to the user
+                    self.__model.append((chunk, binding.name, chunk.start + 1, binding.type_name, binding.size))
+
+        if self.worksheet is not None:
+            self.__total_label.set_text("Total: %s" % format_size(total))
+        else:
+            self.__total_label.set_text("")
+
+        self.__update_drop_sensitivity()
+
+    def __on_refresh_idle(self):
+        self.__refresh_source = None
+        self.__refresh()
+
+        return False
+
+    def __queue_refresh(self):
+        # Chunks change one at a time while a worksheet is calculated, so we
+        # only refresh once things have settled down
+        if self.__refresh_source is None:
+            self.__refresh_source = gobject.idle_add(self.__on_refresh_idle)
+
+    def set_worksheet(self, worksheet):
+        """Set the worksheet to show the variables of, or None"""
+
+        if worksheet == self.worksheet:
+            return
+
+        if self.worksheet is not None:
+            self.worksheet.sig_chunk_status_changed.disconnect(self.on_chunk_status_changed)
+            self.worksheet.sig_chunk_deleted.disconnect(self.on_chunk_deleted)
+            self.worksheet.sig_state.disconnect(self.on_state)
+
+        self.worksheet = worksheet
+
+        if self.worksheet is not None:
+            self.worksheet.sig_chunk_status_changed.connect(self.on_chunk_status_changed)
+            self.worksheet.sig_chunk_deleted.connect(self.on_chunk_deleted)
+            self.worksheet.sig_state.connect(self.on_state)
+
+        self.__refresh()
+
+    def on_chunk_status_changed(self, worksheet, chunk):
+        self.__queue_refresh()
+
+    def on_chunk_deleted(self, worksheet, chunk):
+        self.__queue_refresh()
+
+    def on_state(self, worksheet, state):
+        self.__queue_refresh()
+
+    def on_row_activated(self, view, path, column):
+        chunk = self.__model.get_value(self.__model.get_iter(path), _COLUMN_CHUNK)
+        self.worksheet.place_cursor(chunk.start, 0)
+
+    def on_selection_changed(self, selection):
+        self.__update_drop_sensitivity()
+
+    def on_drop_clicked(self, button):
+        chunk, name = self.__get_selected()
+        if chunk is None:
+            return
+
+        if not self.worksheet.drop_binding(chunk, name):
+            dialog = gtk.MessageDialog(parent=self.get_toplevel(), buttons=gtk.BUTTONS_OK,
+                                       type=gtk.MESSAGE_INFO)
+            dialog.set_markup(format_escaped("'%s' can't be dropped any earlier: it is used by a later "
+                                             "statement that also changes it, or by a function that "
+                                             "could be called at any point.", name))
+            dialog.run()
+            dialog.destroy()
+
+    def on_destroy(self, widget):
+        self.set_worksheet(None)
+        if self.__refresh_source is not None:
+            gobject.source_remove(self.__refresh_source)
+            self.__refresh_source = None
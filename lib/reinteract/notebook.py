@@ -14,13 +14,21 @@ import imp
 import os
 import pkgutil
 import sys
+import tempfile
+import thread
+import weakref
 
+from benchmark import timeit
 from notebook_info import NotebookInfo
 import reunicode
+from sampling_profiler import SamplingProfiler
 
 # Used to give each notebook a unique namespace
 _counter = 1
 
+# Name of the hidden folder within a notebook folder used by create_cache_file()
+CACHE_FOLDER = ".cache"
+
 # Hook the import function in the global __builtin__ module; this is used to make
 # imports from a notebook locally scoped to that notebook. We do it this way
 # rather than replacing __builtins__ to avoid triggering restricted mode.
@@ -34,6 +42,126 @@ def reinteract_import(name, globals=None, locals=None, fromlist=None, level=-1):
 
 __builtin__.__import__ = reinteract_import
 
+######################################################################
+# Per-module import locks
+#
+# Rather than holding the global import lock for the entire duration of
+# an import, we look up already loaded modules without any locking, and
+# only lock the module being loaded. This is modeled on what Python 3.3
+# does in importlib: each module gets a recursive lock, and when acquiring
+# a lock would block on a chain of threads that ends up with the current
+# thread (two threads importing two modules that import each other), we
+# don't wait, but rather hand back the partially initialized module, just
+# as we would for a circular import within a single thread.
+
+class _DeadlockError(RuntimeError):
+    pass
+
+# Protects _module_locks
+_module_locks_lock = thread.allocate_lock()
+# Locks for modules currently being loaded, keyed by the module name in
+# sys.modules (so notebook-local modules include the notebook prefix). Locks
+# are dropped automatically once no thread is using them.
+_module_locks = weakref.WeakValueDictionary()
+# Maps a thread ID to the _ModuleLock that thread is waiting for
+_blocking_on = {}
+
+class _ModuleLock(object):
+    """A recursive lock protecting the loading of a single module"""
+
+    def __init__(self, name):
+        self.lock = thread.allocate_lock()
+        self.wakeup = thread.allocate_lock()
+        self.name = name
+        self.owner = None
+        self.count = 0
+        self.waiters = 0
+
+    def has_deadlock(self):
+        # Follow the chain of "thread X is waiting for a lock owned by
+        # thread Y" and see if it leads back to us
+        me = thread.get_ident()
+        tid = self.owner
+        while True:
+            lock = _blocking_on.get(tid)
+            if lock is None:
+                return False
+            tid = lock.owner
+            if tid == me:
+                return True
+
+    def acquire(self):
+        """Acquire the lock. Raises _DeadlockError if waiting would deadlock."""
+
+        tid = thread.get_ident()
+        _blocking_on[tid] = self
+        try:
+            while True:
+                self.lock.acquire()
+                try:
+                    if self.count == 0 or self.owner == tid:
+                        self.owner = tid
+                        self.count += 1
+                        return
+                    if self.has_deadlock():
+                        raise _DeadlockError("deadlock detected importing %s" % self.name)
+                    if self.wakeup.acquire(False):
+                        self.waiters += 1
+                finally:
+                    self.lock.release()
+
+                # Wait for a release() call
+                self.wakeup.acquire()
+                self.wakeup.release()
+        finally:
+            del _blocking_on[tid]
+
+    def release(self):
+        self.lock.acquire()
+        try:
+            if self.owner != thread.get_ident():
+                raise RuntimeError("cannot release un-acquired lock")
+            self.count -= 1
+            if self.count == 0:
+                self.owner = None
+                if self.waiters > 0:
+                    self.waiters -= 1
+                    self.wakeup.release()
+        finally:
+            self.lock.release()
+
+    def is_loading_elsewhere(self):
+        owner = self.owner
+        return owner is not None and owner != thread.get_ident()
+
+def _get_module_lock(key):
+    _module_locks_lock.acquire()
+    try:
+        lock = _module_locks.get(key)
+        if lock is None:
+            lock = _ModuleLock(key)
+            _module_locks[key] = lock
+        return lock
+    finally:
+        _module_locks_lock.release()
+
+def _wait_for_module(key):
+    # If another thread is in the middle of loading the module, wait until
+    # it is done. A plain lookup in the WeakValueDictionary is safe without
+    # holding _module_locks_lock, so in the common case this doesn't lock at all.
+    #
+    # Returns True if we waited
+    lock = _module_locks.get(key)
+    if lock is not None and lock.is_loading_elsewhere():
+        try:
+            lock.acquire()
+        except _DeadlockError:
+            return False
+        lock.release()
+        return True
+
+    return False
+
 class HelpResult:
     def __init__(self, arg):
         self.arg = arg
@@ -148,6 +276,9 @@ class Notebook(gobject.GObject):
         self.__monitors = {}
         self.worksheets = set()
 
+        self.__cache_dir = None
+        self.__cache_files = []
+
 
         if folder:
             self.info = NotebookInfo(folder)
@@ -235,7 +366,9 @@ class Notebook(gobject.GObject):
     ############################################################
 
     def __reset_all_modules(self):
-        for (name, module) in self.__modules.iteritems():
+        # Modules may be loaded concurrently from executing worksheets, so iterate
+        # over a copy
+        for (name, module) in self.__modules.items():
             del sys.modules[self.__prefix + "." + name]
             for worksheet in self.worksheets:
                 worksheet.module_changed(name)
@@ -244,7 +377,7 @@ class Notebook(gobject.GObject):
 
     def reset_module_by_filename(self, filename):
         filename = filename.lower()
-        for (name, module) in self.__modules.iteritems():
+        for (name, module) in self.__modules.items():
             # If the .py changed, we need to reload the module even if it was
             # loaded from a .pyc file.
             module_file = module.__file__.lower()
@@ -301,6 +434,45 @@ class Notebook(gobject.GObject):
 
         raise ImportError("no module named " + fullname)
 
+    def __wait_for_loading(self, names):
+        # Wait for any in-progress load of the module or of a package containing
+        # it; a package being loaded may be in the middle of loading its submodules.
+        # Returns True if we waited
+        waited = False
+        for i in xrange(1, len(names) + 1):
+            name = ".".join(names[0:i])
+            if _wait_for_module(self.__prefix + "." + name):
+                waited = True
+            if _wait_for_module(name):
+                waited = True
+
+        return waited
+
+    def __find_loaded(self, names, local_only=False):
+        # Returns (module, local) for an already loaded module, or None.
+        #
+        # This is done without any locking, so importing an already loaded module
+        # is never blocked by a slow load in a different thread. But a module is
+        # put into sys.modules before it is run, so if the module we find is still
+        # being loaded by another thread, we wait for it to finish and look again.
+        # (The lookup must come first: the module might start loading right after
+        # we check.)
+        fullname = ".".join(names)
+
+        while True:
+            try:
+                found = self.__modules[fullname], True
+            except KeyError:
+                if local_only:
+                    return None
+                try:
+                    found = sys.modules[fullname], False
+                except KeyError:
+                    return None
+
+            if not self.__wait_for_loading(names):
+                return found
+
     def __find_and_load(self, fullname, name, parent=None, local=None):
         # The 'imp' module doesn't support PEP 302 extensions like
         # sys.path_hooks (used for zipped eggs), so we use (undocumented)
@@ -323,9 +495,40 @@ class Notebook(gobject.GObject):
                 raise ImportError("no module named " + fullname)
 
         if local:
-            module = self.__load_local_module(fullname, loader)
+            modules = self.__modules
+            lock = _get_module_lock(self.__prefix + "." + fullname)
         else:
-            module =  loader.load_module(fullname)
+            modules = sys.modules
+            lock = _get_module_lock(fullname)
+
+        try:
+            lock.acquire()
+        except _DeadlockError:
+            # Two threads are importing modules that import each other. As for a
+            # circular import within a single thread, the best we can do is to
+            # return the partially initialized module
+            try:
+                return modules[fullname], local
+            except KeyError:
+                raise ImportError("no module named " + fullname)
+
+        try:
+            # Another thread may have loaded the module while we were waiting
+            try:
+                module = modules[fullname]
+            except KeyError:
+                if local:
+                    module = self.__load_local_module(fullname, loader)
+                else:
+                    # Python's own import machinery, which will handle any imports
+                    # done by the module, expects the global import lock to be held
+                    imp.acquire_lock()
+                    try:
+                        module = loader.load_module(fullname)
+                    finally:
+                        imp.release_lock()
+        finally:
+            lock.release()
 
         if parent is not None:
             parent.__dict__[name] = module
@@ -334,16 +537,10 @@ class Notebook(gobject.GObject):
         
     def __import_recurse(self, names):
         fullname = ".".join(names)
-        
-        try:
-            return self.__modules[fullname], True
-        except KeyError:
-            pass
-        
-        try:
-            return sys.modules[fullname], False
-        except KeyError:
-            pass
+
+        found = self.__find_loaded(names)
+        if found is not None:
+            return found
 
         if len(names) == 1:
             module, local = self.__find_and_load(fullname, names[-1])
@@ -351,10 +548,9 @@ class Notebook(gobject.GObject):
             parent, local = self.__import_recurse(names[0:-1])
 
             # Loading the parent might have loaded the module we were looking for
-            try:
-                return self.__modules[fullname], True
-            except KeyError:
-                pass
+            found = self.__find_loaded(names, local_only=True)
+            if found is not None:
+                return found
 
             module, _ = self.__find_and_load(fullname, names[-1], parent=parent, local=local)
 
@@ -411,78 +607,73 @@ class Notebook(gobject.GObject):
             globals_['__reinteract_wrappers'].extend(old)
 
     def do_import(self, name, globals=None, locals=None, fromlist=None, level=None):
-        # Holding the import lock around the whole import process matches what
-        # Python does internally. This does mean that the machinery of loading a slow
-        # import blocks the import of an already loaded module in a different thread.
-        # You could imagine trying to do the lookup without the lock and locking only
-        # for loading, but ensuring the safety of that would be quite complex
-        imp.acquire_lock()
-        try:
-            names = name.split('.')
+        # Unlike Python 2 internally, we don't hold the global import lock around
+        # the whole import process; instead we lock only the individual modules
+        # being loaded (see _ModuleLock), so a slow import in one worksheet
+        # doesn't block the import of an already loaded module in another.
+        names = name.split('.')
+
+        # we want to return the module pointed to by the first component of name;
+        # even if name is a relative name not an absolute name. return_index
+        # is the index of name within the absolute name
+        return_index = 0
+
+        if level != 0:
+            package = self.__get_package(globals)
+            if package is not None:
+                package_names = package.split('.')
+
+        if level == -1 and package is not None:
+            # Pre-PEP 328, first try local import, then global import
+            try:
+                tmp_names = package_names + names
+                module, local = self.__import_recurse(tmp_names)
+                names = tmp_names
+                return_index = len(package_names)
+            except ImportError:
+                module, local = self.__import_recurse(names)
+        else:
+            if level > 0:
+                # Relative import, figure out the absolute name we're importing
+                return_index = level
+                if package is None:
+                    raise ValueError("ValueError: Attempted relative import in non-package")
+                elif level - 1 > len(package_names):
+                    raise ValueError("Attempted relative import beyond toplevel package")
+
+                if level > 1:
+                    package_names = package_names[0:-(level - 1)]
+
+                names = package_names + names
+
+            module, local =  self.__import_recurse(names)
+
+        if fromlist is not None:
+            # In 'from a.b import c', if a.b.c doesn't exist after loading a.b, The built-in
+            # __import__ will try to load a.b.c as a module; do the same here.
+            for fromname in fromlist:
+                if fromname == "*":
+                    try:
+                        all = getattr(module, "__all__")
+                        for allname in all:
+                            self.__ensure_from_list_item(name, allname, module, local)
+                    except AttributeError:
+                        pass
+
+                    self.__add_wrapper(globals, module)
+                else:
+                    self.__ensure_from_list_item(name, fromname, module, local)
 
-            # we want to return the module pointed to by the first component of name;
-            # even if name is a relative name not an absolute name. return_index
-            # is the index of name within the absolute name
-            return_index = 0
+            return module
+        else:
+            self.__add_wrapper(globals, module)
 
-            if level != 0:
-                package = self.__get_package(globals)
-                if package is not None:
-                    package_names = package.split('.')
+            return_name = ".".join(names[0:return_index + 1])
 
-            if level == -1 and package is not None:
-                # Pre-PEP 328, first try local import, then global import
-                try:
-                    tmp_names = package_names + names
-                    module, local = self.__import_recurse(tmp_names)
-                    names = tmp_names
-                    return_index = len(package_names)
-                except ImportError:
-                    module, local = self.__import_recurse(names)
+            if local:
+                return self.__modules[return_name]
             else:
-                if level > 0:
-                    # Relative import, figure out the absolute name we're importing
-                    return_index = level
-                    if package is None:
-                        raise ValueError("ValueError: Attempted relative import in non-package")
-                    elif level - 1 > len(package_names):
-                        raise ValueError("Attempted relative import beyond toplevel package")
-
-                    if level > 1:
-                        package_names = package_names[0:-(level - 1)]
-
-                    names = package_names + names
-
-                module, local =  self.__import_recurse(names)
-
-            if fromlist is not None:
-                # In 'from a.b import c', if a.b.c doesn't exist after loading a.b, The built-in
-                # __import__ will try to load a.b.c as a module; do the same here.
-                for fromname in fromlist:
-                    if fromname == "*":
-                        try:
-                            all = getattr(module, "__all__")
-                            for allname in all:
-                                self.__ensure_from_list_item(name, allname, module, local)
-                        except AttributeError:
-                            pass
-
-                        self.__add_wrapper(globals, module)
-                    else:
-                        self.__ensure_from_list_item(name, fromname, module, local)
-
-                return module
-            else:
-                self.__add_wrapper(globals, module)
-
-                return_name = ".".join(names[0:return_index + 1])
-
-                if local:
-                    return self.__modules[return_name]
-                else:
-                    return sys.modules[return_name]
-        finally:
-            imp.release_lock()
+                return sys.modules[return_name]
 
     ############################################################
     # Worksheet tracking
@@ -523,7 +714,97 @@ class Notebook(gobject.GObject):
         globals['__reinteract_copy'] = copy.copy
         globals['__reinteract_wrappers'] = []
         globals['__reinteract_builder'] = _Builder
+        globals['__reinteract_profiler'] = SamplingProfiler
         globals['help'] = _Helper()
+        globals['timeit'] = timeit
+
+    def prefetch_import(self, name, fromlist=None):
+        """Import a global module ahead of time, so that importing it later from a
+        worksheet is fast. Notebook-local modules are not imported, since we'd
+        just have to reload them if they are edited, and loading them might have
+        side-effects that the user only expects when calculating. Any error
+        importing the module is ignored.
+
+        @param name: the absolute name of the module; None or an empty name (like
+          for 'from . import x') is ignored
+        @param fromlist: names to import from the module, as for __import__()
+        @returns: True if the module was imported
+
+        """
+
+        if not name:
+            return False
+
+        try:
+            self.__find_loader_in_path(name.split('.')[0], self.__path)
+            return False
+        except ImportError:
+            pass
+        except Exception:
+            return False
+
+        scope = {}
+        self.setup_globals(scope)
+        try:
+            self.do_import(name, scope, scope, fromlist, 0)
+        except Exception:
+            # Errors will be reported when the worksheet is calculated
+            return False
+
+        return True
+
+    def create_cache_file(self, prefix='', suffix=''):
+        """Create a new file in the notebook's cache directory. This is a hidden
+        folder within the notebook folder, or a temporary directory for a
+        notebook without a folder. Files created with this function are deleted
+        when the notebook is closed.
+
+        @returns: a tuple of (file object opened for writing, absolute path)
+
+        """
+
+        if self.__cache_dir is None:
+            if self.folder:
+                cache_dir = os.path.join(self.folder, CACHE_FOLDER)
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+            else:
+                cache_dir = tempfile.mkdtemp(prefix="reinteract-")
+            self.__cache_dir = cache_dir
+
+        fd, path = tempfile.mkstemp(suffix, prefix, self.__cache_dir)
+        self.__cache_files.append(path)
+
+        return os.fdopen(fd, "w"), path
+
+    def remove_cache_file(self, path):
+        """Delete a file created with create_cache_file() before the notebook is closed"""
+
+        try:
+            self.__cache_files.remove(path)
+        except ValueError:
+            return
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __remove_cache_files(self):
+        for path in self.__cache_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.__cache_files = []
+
+        if self.__cache_dir is not None:
+            # Fails if another instance is using the directory, which is fine
+            try:
+                os.rmdir(self.__cache_dir)
+            except OSError:
+                pass
+            self.__cache_dir = None
 
     def file_for_absolute_path(self, absolute_path):
         if not isinstance(absolute_path, unicode):
@@ -557,6 +838,7 @@ class Notebook(gobject.GObject):
     def close(self):
         self.__monitors = None
         self.__reset_all_modules()
+        self.__remove_cache_files()
     
 
 ########################################################################
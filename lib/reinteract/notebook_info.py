@@ -10,6 +10,8 @@ from ConfigParser import RawConfigParser, ParsingError
 import os
 import time
 
+from resource_limits import ResourceLimits
+
 def format_duration(past):
     if past < 60: # Sanity ... a date before 1972
         return ""
@@ -115,3 +117,30 @@ class NotebookInfo(object):
         self.__save()
 
     description = property(__get_description, __set_description)
+
+    def __get_float(self, option):
+        # Options we can't parse are ignored like an unreadable index.rnb
+        if self.__parser.has_option('Notebook', option):
+            try:
+                return self.__parser.getfloat('Notebook', option)
+            except ValueError:
+                pass
+        return None
+
+    @property
+    def limits(self):
+        """The ResourceLimits for the statements of the notebook, or None. Set
+        in index.rnb as time_limit and cpu_time_limit in seconds and
+        memory_limit in megabytes."""
+
+        memory = self.__get_float('memory_limit')
+        if memory is not None:
+            memory = int(memory * 1024 * 1024)
+
+        limits = ResourceLimits(wall_time=self.__get_float('time_limit'),
+                                cpu_time=self.__get_float('cpu_time_limit'),
+                                memory=memory)
+        if limits.is_unlimited():
+            return None
+
+        return limits
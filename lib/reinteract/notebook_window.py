@@ -14,8 +14,10 @@ import gtk
 import os
 
 from base_notebook_window import BaseNotebookWindow
+from execution_scheduler import executionScheduler
 from file_list import FileList
 from format_escaped import format_escaped
+from memory_browser import MemoryBrowser
 from notebook import NotebookFile, WorksheetFile, LibraryFile
 from save_file import SaveFileBuilder
 from library_editor import LibraryEditor
@@ -111,9 +113,17 @@ class NotebookWindow(BaseNotebookWindow):
         hpaned.connect('notify::position', self.on_hpaned_notify_position)
         self.main_vbox.pack_start(hpaned, expand=True, fill=True)
 
+        # The side panel has the list of files above the variables of the current
+        # worksheet that use the most memory
+        vpaned = gtk.VPaned()
+        hpaned.pack1(vpaned, resize=False)
+
         scrolled_window = gtk.ScrolledWindow()
         scrolled_window.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
-        hpaned.pack1(scrolled_window, resize=False)
+        vpaned.pack1(scrolled_window, resize=True)
+
+        self.__memory_browser = MemoryBrowser()
+        vpaned.pack2(self.__memory_browser, resize=False)
 
         self.__file_list = FileList(self.notebook)
         scrolled_window.add(self.__file_list)
@@ -150,6 +160,10 @@ class NotebookWindow(BaseNotebookWindow):
 
         self.nb_widget.set_tab_reorderable(editor.widget, True)
 
+    def _close_editor(self, editor):
+        BaseNotebookWindow._close_editor(self, editor)
+        self.__update_current_worksheet()
+
     def _update_editor_title(self, editor):
         BaseNotebookWindow._update_editor_title(self, editor)
         editor._notebook_tab_label.set_text(editor.title)
@@ -158,10 +172,36 @@ class NotebookWindow(BaseNotebookWindow):
         BaseNotebookWindow._update_editor_state(self, editor)
         editor._notebook_tab_status.props.stock = NotebookFile.stock_id_for_state(editor.state)
 
+    #######################################################
+    # Utility
+    #######################################################
+
+    def __update_current_worksheet(self):
+        if isinstance(self.current_editor, WorksheetEditor):
+            worksheet = self.current_editor.buf.worksheet
+        else:
+            worksheet = None
+
+        self.__memory_browser.set_worksheet(worksheet)
+
+        # Calculations of the worksheet the user is looking at go ahead of
+        # those of other worksheets
+        if self.window.is_active():
+            executionScheduler().set_focused(worksheet)
+
     #######################################################
     # Callbacks
     #######################################################
 
+    def on_page_switched(self, notebook, _, page_num):
+        BaseNotebookWindow.on_page_switched(self, notebook, _, page_num)
+        self.__update_current_worksheet()
+
+    def on_notify_is_active(self, window, paramspec):
+        BaseNotebookWindow.on_notify_is_active(self, window, paramspec)
+        if window.is_active():
+            self.__update_current_worksheet()
+
     def on_tab_close_button_clicked(self, editor):
         self._close_editor(editor)
 
@@ -45,6 +45,11 @@ class PreferencesBuilder(WindowBuilder):
 
         self.autocomplete_check_button.connect('toggled', self.__on_autocomplete_check_button_toggled)
 
+        global_settings.watch('prefetch-imports', self.__on_notify_prefetch_imports)
+        self.__on_notify_prefetch_imports()
+
+        self.prefetch_imports_check_button.connect('toggled', self.__on_prefetch_imports_check_button_toggled)
+
     def __on_notify_editor_font_is_custom(self):
         self.editor_font_custom_check_button.set_active(global_settings.editor_font_is_custom)
 
@@ -87,6 +92,14 @@ class PreferencesBuilder(WindowBuilder):
         if autocomplete != global_settings.autocomplete:
             global_settings.autocomplete = autocomplete
 
+    def __on_notify_prefetch_imports(self):
+        self.prefetch_imports_check_button.set_active(global_settings.prefetch_imports)
+
+    def __on_prefetch_imports_check_button_toggled(self, *args):
+        prefetch_imports = self.prefetch_imports_check_button.get_active()
+        if prefetch_imports != global_settings.prefetch_imports:
+            global_settings.prefetch_imports = prefetch_imports
+
     def __on_response(self, dialog, response_id):
         self.dialog.hide()
 
@@ -7,8 +7,10 @@
 #
 ########################################################################
 
-import copy
+import hashlib
 import inspect
+import os
+import weakref
 
 def default_filter(baseclass, name):
     """Filter out attributes that should be excluded from a proxy class.
@@ -47,6 +49,144 @@ def _arg_count(n, non_keyword=False):
     else:
         return "%d %sarguments" % (n, non_keyword_s)
 
+def _values_equal(a, b):
+    # Compare recorded arguments; unlike ==, this gives a single True or
+    # False for numpy arrays, and doesn't raise exceptions
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+
+    if isinstance(a, (list, tuple)):
+        if len(a) != len(b):
+            return False
+        for x, y in zip(a, b):
+            if not _values_equal(x, y):
+                return False
+        return True
+    elif isinstance(a, dict):
+        if len(a) != len(b):
+            return False
+        for k, v in a.iteritems():
+            if not k in b or not _values_equal(v, b[k]):
+                return False
+        return True
+
+    try:
+        result = a == b
+        if isinstance(result, bool):
+            return result
+        # An array comparing element-by-element
+        return a.shape == b.shape and bool(result.all())
+    except Exception:
+        return False
+
+_DIGEST_BY_VALUE = (type(None), bool, int, long, float, complex, str, unicode)
+
+def _update_digest(digest, value, mapped_files):
+    # Feed a recorded argument into a hash object. Values other than simple
+    # immutable values and arrays are identified by id(), so the caller must
+    # keep the recorded object alive as long as the digest is used. The names
+    # of the files of memory-mapped arrays are added to mapped_files.
+    t = type(value)
+    if t in _DIGEST_BY_VALUE:
+        digest.update("%s:%r;" % (t.__name__, value))
+    elif t in (list, tuple):
+        digest.update("%s:%d[" % (t.__name__, len(value)))
+        for item in value:
+            _update_digest(digest, item, mapped_files)
+        digest.update("]")
+    elif t is dict:
+        digest.update("dict:%d{" % len(value))
+        for k in sorted(value.iterkeys(), key=repr):
+            _update_digest(digest, k, mapped_files)
+            _update_digest(digest, value[k], mapped_files)
+        digest.update("}")
+    elif hasattr(value, 'dtype') and hasattr(value, 'shape') and hasattr(value, 'tostring'):
+        # A numpy array; hash the contents without copying if we can
+        digest.update("array:%s:%r:" % (value.dtype.str, value.shape))
+        filename = getattr(value, 'filename', None)
+        if filename is not None:
+            # A memory-mapped array; identify it by the file and the position within
+            # the mapping rather than reading what might be a huge file. Since the
+            # file can change, it is also checked each time; see _calls_digest()
+            digest.update("mmap:%s:%d:%r;" % (filename, value.__array_interface__['data'][0], value.strides))
+            mapped_files.append(filename)
+        else:
+            try:
+                digest.update(buffer(value))
+            except (TypeError, ValueError):
+                digest.update(value.tostring())
+    else:
+        digest.update("%s:%d;" % (t.__name__, id(value)))
+
+class _CallLog(object):
+    # A persistent list of recorded calls. Appending returns a new log that
+    # shares all the calls of the old log, which is left unchanged, so copying
+    # a RecordedObject takes constant time no matter how many calls have been
+    # recorded on it.
+
+    __slots__ = ('call', 'previous', 'length', 'digest', 'mapped_files', '__weakref__')
+
+    def __init__(self, call=None, previous=None):
+        self.call = call
+        self.previous = previous
+        if previous is None:
+            self.length = 0
+        else:
+            self.length = previous.length + 1
+        # Hash object for the calls up to and including this one, and the files
+        # of the memory-mapped arrays in them, computed when first needed; see
+        # get_digest()
+        self.digest = None
+        self.mapped_files = ()
+
+    def append(self, call):
+        return _CallLog(call, self)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        calls = []
+        log = self
+        while log.previous is not None:
+            calls.append(log.call)
+            log = log.previous
+        calls.reverse()
+
+        return iter(calls)
+
+    def get_digest(self):
+        # Since the digest is kept on the log, it is shared by all the objects
+        # with these calls, and computing it for a log that extends another
+        # only needs to hash the new calls. The returned hash object must not
+        # be modified.
+        if self.digest is None:
+            pending = []
+            log = self
+            while log.digest is None and log.previous is not None:
+                pending.append(log)
+                log = log.previous
+            if log.digest is None:
+                log.digest = hashlib.sha1()
+
+            digest = log.digest
+            mapped_files = log.mapped_files
+            for log in reversed(pending):
+                digest = digest.copy()
+                new_files = []
+                _update_digest(digest, log.call, new_files)
+                for filename in new_files:
+                    if not filename in mapped_files:
+                        mapped_files += (filename,)
+                log.mapped_files = mapped_files
+                log.digest = digest
+
+        return self.digest
+
+_EMPTY_LOG = _CallLog()
+
 class RecordedObject(object):
     """
     A RecordedObject is a proxy for another object that Reinteract can't copy
@@ -60,25 +200,117 @@ class RecordedObject(object):
     subclasses by implementing a C{_check_} method for a given call. For
     example, to add argument checking for the C{plot} method, you would
     add the C{_check_plot} method to your subclass.
+
+    When replaying with C{compact=True}, runs of consecutive calls to the same
+    method can be combined into fewer calls, if the subclass implements a
+    C{_compact_} method for it. For example, C{_compact_plot} would be called
+    with a list of C{(args, kwargs)} for consecutive C{plot} calls, and return
+    a list of C{(args, kwargs)} for the calls to make instead.
     """
     def __init__(self):
-        self._recreation_calls = []
+        self._recreation_calls = _EMPTY_LOG
 
-    def _replay(self, target):
+    def _replay(self, target, transform=None, compact=False):
         # At any point in time, an object's state can be recreated by
-        # _replay()ing the calls recorded on it.
-        for (call, args, kwargs) in self._recreation_calls:
+        # _replay()ing the calls recorded on it. If transform is specified,
+        # it is called as transform(call, args, kwargs) for each call and
+        # returns the (args, kwargs) to use instead, for example to replay
+        # with a reduced version of some data. If compact is True, calls
+        # are combined with the subclass's _compact_ methods, if any.
+        if compact:
+            calls = self._compacted_calls()
+        else:
+            calls = self._recreation_calls
+
+        for (call, args, kwargs) in calls:
+            if transform is not None:
+                args, kwargs = transform(call, args, kwargs)
             func = getattr(target, call)
             try:
                 func(*args, **kwargs)
             except Exception, e:
                 raise ReplayException(e, (call, args, kwargs))
 
+    def _compacted_calls(self):
+        calls = []
+        run = []
+        for call in self._recreation_calls:
+            if run and call[0] != run[0][0]:
+                calls.extend(self.__compact_run(run))
+                run = []
+            run.append(call)
+        if run:
+            calls.extend(self.__compact_run(run))
+
+        return calls
+
+    def __compact_run(self, run):
+        compact = getattr(self, '_compact_' + run[0][0], None)
+        if compact is None or len(run) == 1:
+            return run
+
+        name = run[0][0]
+        return [(name, args, kwargs) for args, kwargs in compact([(args, kwargs) for _, args, kwargs in run])]
+
     def __copy__(self):
         new = self.__class__()
-        new._recreation_calls = copy.copy(self._recreation_calls)
+        new._recreation_calls = self._recreation_calls
         return new
 
+    def _calls_digest(self, compute=True):
+        """
+        Get a string that identifies the calls recorded on this object, for use
+        as a cache key. Objects with the same calls generally have the same digest.
+        The digest can depend on the identity of arguments, so it is only
+        meaningful as long as the recorded calls are kept alive; see
+        L{_calls_ref}.
+
+        Computing the digest hashes the contents of the arrays passed in the
+        calls, which can take a long time for big arrays; if C{compute} is
+        False and the digest hasn't been computed yet, None is returned instead.
+        """
+        log = self._recreation_calls
+        if not compute and log.digest is None:
+            return None
+
+        digest = log.get_digest()
+        if log.mapped_files:
+            # The contents of memory-mapped arrays aren't hashed, so include
+            # the current modification time and size of their files
+            digest = digest.copy()
+            for filename in log.mapped_files:
+                try:
+                    st = os.stat(filename)
+                    digest.update("file:%s:%r:%d;" % (filename, st.st_mtime, st.st_size))
+                except OSError:
+                    digest.update("file:%s;" % filename)
+
+        return digest.hexdigest()
+
+    def _calls_ref(self):
+        """
+        Get a weak reference to the calls recorded on this object. While the
+        reference is alive, the digest from L{_calls_digest} and the id() of
+        the referenced object stay valid.
+        """
+        return weakref.ref(self._recreation_calls)
+
+    def _same_calls(self, other):
+        """
+        Check whether C{other} has recorded the same calls as this object, so
+        that replaying either of them gives the same result.
+        """
+        if self._recreation_calls is other._recreation_calls:
+            return True
+        if len(self._recreation_calls) != len(other._recreation_calls):
+            return False
+
+        for call, other_call in zip(self._recreation_calls, other._recreation_calls):
+            if not _values_equal(call, other_call):
+                return False
+
+        return True
+
     def _check_call(self, name, args, kwargs, spec):
         # This tries to duplicate some of python's argument checking logic
         num_args      = len(spec[0]) if spec[0] else 0
@@ -150,7 +382,7 @@ class RecordedObject(object):
 
             def record(self, *args, **kwargs):
                 func(self, name, args, kwargs, spec)
-                self._recreation_calls.append((name, args, kwargs))
+                self._recreation_calls = self._recreation_calls.append((name, args, kwargs))
             return record
 
         whitelist = (d for d in dir(baseclass) if attr_filter(baseclass, d))
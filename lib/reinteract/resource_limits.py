@@ -0,0 +1,222 @@
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+import ctypes
+import os
+import sys
+import thread
+import time
+
+#
+# Limits on the resources that a statement can use while executing. The
+# limits are enforced by a watchdog in ThreadExecutor, which interrupts the
+# statement when one of them is exceeded.
+#
+# Where we can, CPU time is measured for the thread executing the statement.
+# Otherwise, and always for memory, we can only measure the process as a
+# whole, which includes any other statements executing at the same time, so
+# those limits are only checked while no others are; see ResourceUsage.check().
+#
+
+def get_cpu_time():
+    # Returns the CPU time used by the process so far, in seconds
+    user, system = os.times()[0:2]
+    return user + system
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+_pthread_getcpuclockid = None
+_clock_gettime = None
+if sys.platform.startswith('linux'):
+    try:
+        _pthread_getcpuclockid = ctypes.CDLL("libpthread.so.0").pthread_getcpuclockid
+        _clock_gettime = ctypes.CDLL("librt.so.1").clock_gettime
+    except (OSError, AttributeError):
+        _pthread_getcpuclockid = None
+
+def get_thread_cpu_time(ident):
+    # Returns the CPU time used so far by the thread with the given
+    # thread.get_ident(), in seconds, or None if we don't know how to
+    # find it on this platform. The thread must still be running.
+    if _pthread_getcpuclockid is None:
+        return None
+
+    clock = ctypes.c_int()
+    if _pthread_getcpuclockid(ctypes.c_ulong(ident), ctypes.byref(clock)) != 0:
+        return None
+
+    ts = _timespec()
+    if _clock_gettime(clock, ctypes.byref(ts)) != 0:
+        return None
+
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError):
+    _PAGE_SIZE = None
+
+def get_rss():
+    # Returns the resident memory of the process in bytes, or None if we
+    # don't know how to find it on this platform
+    if _PAGE_SIZE is None:
+        return None
+
+    try:
+        f = open('/proc/self/statm')
+    except IOError:
+        return None
+
+    try:
+        return int(f.read().split()[1]) * _PAGE_SIZE
+    finally:
+        f.close()
+
+def format_size(size):
+    if size >= 1024 * 1024 * 1024:
+        return "%.1fGB" % (size / (1024. * 1024 * 1024))
+    elif size >= 1024 * 1024:
+        return "%.1fMB" % (size / (1024. * 1024))
+    else:
+        return "%.1fKB" % (size / 1024.)
+
+class ResourceLimits(object):
+    """Limits on the resources a statement can use while executing"""
+
+    def __init__(self, wall_time=None, cpu_time=None, memory=None):
+        """Initialize the ResourceLimits object
+
+        @param wall_time: the longest a statement can run, in seconds, or None
+        @param cpu_time: the most CPU time, in seconds, that a statement can use, or None
+        @param memory: the most that a statement can increase the memory of the process, in bytes, or None
+
+        """
+
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.memory = memory
+
+    def is_unlimited(self):
+        return self.wall_time is None and self.cpu_time is None and self.memory is None
+
+    def start(self):
+        """Start measuring the resources used by a statement; must be called
+        in the thread that executes the statement
+
+        @returns: a ResourceUsage object
+
+        """
+
+        return ResourceUsage(self)
+
+class ResourceUsage(object):
+    """Resources used by a statement since it started executing"""
+
+    def __init__(self, limits):
+        self.limits = limits
+
+        self.start_time = time.time()
+        self.thread_ident = thread.get_ident()
+        self.start_cpu_time = get_thread_cpu_time(self.thread_ident)
+        #: if True, CPU time is measured for the process rather than for the thread
+        self.process_cpu_time = self.start_cpu_time is None
+        if self.process_cpu_time:
+            self.start_cpu_time = get_cpu_time()
+        if limits.memory is not None:
+            self.start_rss = get_rss()
+        else:
+            self.start_rss = None
+
+    def check(self, others_running=False):
+        """Check the resources used against the limits
+
+        @param others_running: True if other statements are executing at the same
+          time; then limits that are only measured for the process as a whole
+          aren't checked, since we can't tell what this statement used
+        @returns: a message describing the exceeded limit, or None
+
+        """
+
+        limits = self.limits
+
+        if limits.wall_time is not None:
+            elapsed = time.time() - self.start_time
+            if elapsed > limits.wall_time:
+                return "Time limit exceeded: ran for more than %g seconds" % limits.wall_time
+
+        if limits.cpu_time is not None:
+            if self.process_cpu_time:
+                used = None if others_running else get_cpu_time() - self.start_cpu_time
+            else:
+                cpu_time = get_thread_cpu_time(self.thread_ident)
+                used = None if cpu_time is None else cpu_time - self.start_cpu_time
+            if used is not None and used > limits.cpu_time:
+                return "CPU time limit exceeded: used more than %g seconds of CPU time" % limits.cpu_time
+
+        if limits.memory is not None and self.start_rss is not None and not others_running:
+            rss = get_rss()
+            if rss is not None and rss - self.start_rss > limits.memory:
+                return "Memory limit exceeded: memory use grew by more than %s" % format_size(limits.memory)
+
+        return None
+
+####################################################################################
+
+if __name__ == "__main__":
+    def expect(result, expected):
+        if result != expected:
+            print "Got %r, expected %r" % (result, expected)
+
+    expect(ResourceLimits().is_unlimited(), True)
+    expect(ResourceLimits(memory=1).is_unlimited(), False)
+
+    usage = ResourceLimits(wall_time=10, cpu_time=10, memory=1024 * 1024 * 1024).start()
+    expect(usage.check(), None)
+
+    usage = ResourceLimits(wall_time=0.01).start()
+    time.sleep(0.02)
+    expect(usage.check(), "Time limit exceeded: ran for more than 0.01 seconds")
+
+    usage = ResourceLimits(cpu_time=0.01).start()
+    start = time.time()
+    while usage.check() is None and time.time() < start + 5:
+        pass
+    expect(usage.check(), "CPU time limit exceeded: used more than 0.01 seconds of CPU time")
+
+    # If the CPU time of the thread stops being available, it's unknown
+    if not usage.process_cpu_time:
+        real_get_thread_cpu_time = get_thread_cpu_time
+        get_thread_cpu_time = lambda ident: None
+        expect(usage.check(), None)
+        get_thread_cpu_time = real_get_thread_cpu_time
+
+    # CPU time used by other threads doesn't count against the limit
+    import threading
+    usage = []
+    done = threading.Event()
+    def run_idle():
+        usage.append(ResourceLimits(cpu_time=0.01).start())
+        done.wait(5)
+    idle = threading.Thread(target=run_idle)
+    idle.start()
+    while not usage:
+        time.sleep(0.01)
+    start = time.time()
+    while time.time() < start + 0.1:
+        pass
+    if not usage[0].process_cpu_time:
+        expect(usage[0].check(), None)
+    expect(usage[0].check(others_running=True), None)
+    done.set()
+    idle.join()
+
+    if get_rss() is not None:
+        usage = ResourceLimits(memory=10 * 1024 * 1024).start()
+        data = 'x' * (20 * 1024 * 1024)
+        expect(usage.check(), "Memory limit exceeded: memory use grew by more than 10.0MB")
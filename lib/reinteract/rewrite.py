@@ -18,6 +18,10 @@ TEXT_TRANSFORMS = (
      r'\1with __reinteract_builder()\2:'),
     (re.compile(r'^(\s*)build\s+([^\r\n]*?)((?:\s+as\s+[a-zA-Z_][a-zA-Z_0-9]*\s*)?):', re.MULTILINE),
      r'\1with __reinteract_builder(\2)\3:'),
+    # 'profile:' has to be followed by a newline or a comment, so that we don't
+    # match a key in a dictionary display continued over multiple lines
+    (re.compile(r'^(\s*)profile\s*:(?=[ \t]*(?:#.*)?$)', re.MULTILINE),
+     r'\1with __reinteract_profiler():'),
 )
 
 class UnsupportedSyntaxError(Exception):
@@ -99,10 +103,25 @@ class _ScopeMixin(object):
 # the moment.
 
 class _ScopeBindingVisitor(ast.NodeVisitor, _ScopeMixin):
+    def __init__(self):
+        super(_ScopeBindingVisitor, self).__init__()
+
+        # Names bound at the top level of the statement, and whether the
+        # statement uses yield at the top level (see _make_task())
+        self.top_level_names = set()
+        self.top_level_yield = False
+
+        # Whether the statement binds names we can't know about, with
+        # 'from ... import *' or 'exec'. (Assigning to global variables from
+        # functions isn't supported, see _Transformer.handle_assign_to_name())
+        self.unknown_names = False
+
     def bind_name(self, name, binding):
         if self.scope:
             if not (name in self.scope._bindings and self.scope._bindings[name] == NAME_GLOBAL):
                 self.scope._bindings[name] = binding
+        else:
+            self.top_level_names.add(name)
 
     def bind_args(self, args):
         self.bind_arg_tuple(args.args)
@@ -144,6 +163,10 @@ class _ScopeBindingVisitor(ast.NodeVisitor, _ScopeMixin):
         self.generic_visit(node)
         self.pop_scope()
 
+    def visit_Exec(self, node):
+        self.unknown_names = True
+        self.generic_visit(node)
+
     def visit_Global(self, node):
         for name in node.names:
             self.bind_name(name, NAME_GLOBAL)
@@ -153,7 +176,8 @@ class _ScopeBindingVisitor(ast.NodeVisitor, _ScopeMixin):
             if alias.asname:
                 asname = alias.asname
             else:
-                asname = alias.name
+                # 'import a.b' binds a
+                asname = alias.name.split('.')[0]
 
             self.bind_name(asname, NAME_LOCAL)
 
@@ -162,6 +186,7 @@ class _ScopeBindingVisitor(ast.NodeVisitor, _ScopeMixin):
             if alias.name == '*':
                 # This might overwrite a variable and make an apparent mutation not
                 # a mutation, but that's pretty weird, just ignore
+                self.unknown_names = True
                 continue
 
             if alias.asname:
@@ -178,9 +203,14 @@ class _ScopeBindingVisitor(ast.NodeVisitor, _ScopeMixin):
         self.pop_scope()
 
     def visit_Name(self, node):
-        if isinstance(node.ctx, ast.Store):
+        if isinstance(node.ctx, ast.Store) or isinstance(node.ctx, ast.Del):
             self.bind_name(node.id, NAME_LOCAL)
 
+    def visit_Yield(self, node):
+        if self.scope is None:
+            self.top_level_yield = True
+        self.generic_visit(node)
+
 # Method names that are considered not to be getters. The Python
 # standard library contains methods called isfoo() and getfoo()
 # (though not hasfoo()) so we don't for a word boundary. It could
@@ -461,10 +491,11 @@ class _Transformer(ast.NodeTransformer, _ScopeMixin):
         return node
 
     def visit_With(self, node):
+        # 'build' and 'profile' output the value of the 'with' statement after the block
         if (self.scope is None and
             isinstance(node.context_expr, ast.Call) and
             isinstance(node.context_expr.func, ast.Name) and
-            node.context_expr.func.id == '__reinteract_builder'):
+            node.context_expr.func.id in ('__reinteract_builder', '__reinteract_profiler')):
 
             if node.optional_vars:
                 var = node.optional_vars.id
@@ -565,6 +596,27 @@ class Imports:
 
         return result
 
+    def get_imported_modules(self):
+        """Get the modules imported by the statement
+
+        @returns: a list of (module_name, fromlist) tuples. fromlist is None for
+          'import <module_name>' and the list of imported names for
+          'from <module_name> import <names>'. Imports from __future__ are omitted.
+
+        """
+
+        result = []
+
+        for imp in self.imports:
+            if isinstance(imp, ast.ImportFrom):
+                if imp.module != '__future__':
+                    result.append((imp.module, [alias.name for alias in imp.names]))
+            elif isinstance(imp, ast.Import):
+                for alias in imp.names:
+                    result.append((alias.name, None))
+
+        return result
+
     def module_is_referenced(self, module_name):
         prefix = module_name + "."
 
@@ -749,6 +801,42 @@ class _MutationCollector(ast.NodeVisitor):
     def visit_Str(self, node):
         return '"..."', False
 
+######################################################################
+# Statements that use yield at the top level
+#
+# A statement like:
+#
+#  a, b = yield fetch_a, fetch_b
+#
+# can't be compiled as is, since yield is only allowed inside a function,
+# so we compile it as the definition of a generator function, which the
+# Statement then runs as a task. To keep assignments going to the scope
+# of the statement, the names bound at the top level are declared global
+# in the function.
+
+def _make_task(module, task_func_name, names):
+    for node in ast.walk(module):
+        if isinstance(node, ast.ImportFrom) and any(alias.name == '*' for alias in node.names):
+            raise UnsupportedSyntaxError("'from ... import *' can't be used in a statement that uses yield",
+                                         node.lineno)
+
+    # 'from __future__ import' has to stay at the start of the module
+    body = list(module.body)
+    future_imports = []
+    while len(body) > 0 and isinstance(body[0], ast.ImportFrom) and body[0].module == '__future__':
+        future_imports.append(body.pop(0))
+
+    if len(names) > 0:
+        body.insert(0, ast.Global(names=sorted(names), lineno=1, col_offset=0))
+
+    func = ast.FunctionDef(name=task_func_name,
+                           args=ast.arguments(args=[], vararg=None, kwarg=None, defaults=[]),
+                           body=body,
+                           decorator_list=[],
+                           lineno=1, col_offset=0)
+
+    return ast.Module(body=future_imports + [func])
+
 ######################################################################
 
 class Rewriter:
@@ -787,7 +875,30 @@ class Rewriter:
 
         return self.imports
 
-    def rewrite_and_compile(self, output_func_name=None, print_func_name=None, copy_func_name="__copy", statement_name="<statement>"):
+    def is_task(self):
+        """
+        Return True if the statement uses yield at the top level, and was compiled
+        as a generator function. Must be called after rewrite_and_compile().
+
+        """
+
+        return self.task
+
+    def get_bound_names(self):
+        """
+        Return the names that the statement might bind or rebind in the global
+        scope, including variables that are copied because they might be
+        mutated. Must be called after rewrite_and_compile().
+
+        @returns: a set of names, or None if the statement can bind names
+          that can't be determined from the code ('from ... import *', 'exec')
+
+        """
+
+        return self.bound_names
+
+    def rewrite_and_compile(self, output_func_name=None, print_func_name=None, copy_func_name="__copy", statement_name="<statement>",
+                            task_func_name=None):
         """
         Compiles the parse tree into code, while rewriting the parse tree according to the
         output_func_name and print_func_name arguments.
@@ -817,10 +928,15 @@ class Rewriter:
         @param statement_name: the __name of the Statment being compiled.
             Defaults to "<statement>".
 
+        @param task_func_name: if the code uses yield at the top level, it is compiled
+            as the definition of a generator function with this name. If None, such
+            code is a SyntaxError, as usual.
+
         @returns: a tuple of the compiled code followed by a list of mutations
         """
 
-        _ScopeBindingVisitor().visit(self.nodes)
+        bindings = _ScopeBindingVisitor()
+        bindings.visit(self.nodes)
 
         transformer = _Transformer(output_func_name=output_func_name,
                                    print_func_name=print_func_name,
@@ -828,6 +944,11 @@ class Rewriter:
                                    future_features=self.future_features)
 
         rewritten = transformer.process(self.nodes)
+
+        self.task = task_func_name is not None and bindings.top_level_yield
+        if self.task:
+            rewritten = _make_task(rewritten, task_func_name, bindings.top_level_names)
+
         ast.fix_missing_locations(rewritten)
 
         self.imports = transformer.imports
@@ -840,6 +961,12 @@ class Rewriter:
         compiled = compile(rewritten, statement_name, 'exec', flags=compile_flags)
         mutated = transformer.mutated.mutated if transformer.mutated else ()
 
+        if bindings.unknown_names:
+            self.bound_names = None
+        else:
+            self.bound_names = set(bindings.top_level_names)
+            self.bound_names.update(root for root, description, copy_code in mutated)
+
         return (compiled, mutated)
 
 ##################################################
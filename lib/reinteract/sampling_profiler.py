@@ -0,0 +1,389 @@
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+import re
+import sys
+import thread
+import threading
+import time
+
+import gtk
+import pango
+
+from custom_result import CustomResult, ResultWidget
+
+#
+# The 'profile:' keyword runs the block under it with a sampling profiler:
+#
+#  profile:
+#      do_something_slow()
+#
+# Rather than tracing every call, which slows the code down considerably, a
+# separate thread looks at the stack of the thread running the block every
+# SAMPLE_INTERVAL seconds. The number of samples in which a function was on
+# the stack is proportional to the time spent in it. The result is shown as
+# a flame graph: each function is a box as wide as the time spent in it,
+# with the functions it called below it.
+#
+
+# How often we sample the stack of the profiled thread, in seconds
+SAMPLE_INTERVAL = 0.005
+
+# Size of the flame graph in a worksheet, in pixels
+FLAME_GRAPH_WIDTH = 600
+# Rows deeper than this aren't shown
+MAX_DEPTH = 30
+# Boxes narrower than this (in pixels) aren't drawn
+MIN_BOX_WIDTH = 2
+# Boxes narrower than this (in pixels) don't get a label
+MIN_LABEL_WIDTH = 24
+
+# Font size when printing, in points
+PRINT_FONT_SIZE = 7
+
+_STATEMENT_NAME_RE = re.compile(r'<statement\d+>')
+
+class ProfileNode(object):
+    """A function in the call tree of a profile"""
+
+    def __init__(self, name, filename, lineno, parent=None):
+        self.name = name
+        self.filename = filename
+        self.lineno = lineno
+        self.parent = parent
+
+        #: the number of samples where the function was running or calling another function
+        self.count = 0
+        #: the number of samples where the function itself was running
+        self.self_count = 0
+
+        self.children = {}
+
+    def get_child(self, code):
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        child = self.children.get(key)
+        if child is None:
+            filename = _STATEMENT_NAME_RE.sub('<statement>', code.co_filename)
+            child = self.children[key] = ProfileNode(code.co_name, filename, code.co_firstlineno, self)
+
+        return child
+
+    def get_sorted_children(self):
+        """Get the functions called from this function, most expensive first"""
+        return sorted(self.children.itervalues(), key=lambda node: node.count, reverse=True)
+
+    def get_depth(self, limit):
+        """Get the number of levels of the tree under and including this node, up to limit"""
+        if limit <= 1 or len(self.children) == 0:
+            return 1
+        else:
+            return 1 + max(child.get_depth(limit - 1) for child in self.children.itervalues())
+
+class _Sampler(object):
+    def __init__(self, thread_id, base_frame, root):
+        self.thread_id = thread_id
+        self.base_frame = base_frame
+        self.root = root
+
+        self.stopped = False
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped:
+                time.sleep(SAMPLE_INTERVAL)
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is not None:
+                    self.__add_sample(frame)
+        finally:
+            self.done.set()
+
+    def __add_sample(self, frame):
+        # Only the part of the stack called from the profiled block counts;
+        # if the block isn't on the stack at all (the thread is still
+        # entering the block, say), we ignore the sample
+        frames = []
+        while frame is not None and frame is not self.base_frame:
+            frames.append(frame)
+            frame = frame.f_back
+
+        if frame is None:
+            return
+
+        # Or if the block is done, and we are waiting for the sampler to stop
+        if len(frames) > 0 and frames[-1].f_code is _EXIT_CODE:
+            return
+
+        node = self.root
+        node.count += 1
+        for frame in reversed(frames):
+            node = node.get_child(frame.f_code)
+            node.count += 1
+        node.self_count += 1
+
+class SamplingProfiler(object):
+    """Context manager that profiles the code run inside it
+
+    The value of the 'with' statement is a ProfileResult, which is filled
+    in when the block exits.
+
+    """
+
+    def __init__(self):
+        self.result = None
+        self.__sampler = None
+
+    def __enter__(self):
+        self.result = ProfileResult()
+
+        # The frame of the code containing the 'with' statement
+        base_frame = sys._getframe(1)
+
+        self.__sampler = _Sampler(thread.get_ident(), base_frame, self.result.root)
+        self.__start_time = time.time()
+        thread.start_new_thread(self.__sampler.run, ())
+
+        return self.result
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.__sampler.stopped = True
+        self.__sampler.done.wait()
+        self.__sampler = None
+
+        self.result.elapsed = time.time() - self.__start_time
+
+_EXIT_CODE = SamplingProfiler.__exit__.im_func.func_code
+
+##################################################################################
+
+def _box_color(node):
+    # Warm colors, varying with the name of the function so that adjacent
+    # boxes can be told apart, but the same function always gets the same color
+    h = hash(node.name) & 0xffff
+    return (0.9 + 0.1 * (h & 0xff) / 255., 0.35 + 0.45 * (h >> 8) / 255., 0.2)
+
+def _format_percent(node, total):
+    return "%.1f%%" % (100. * node.count / total)
+
+def _draw_flame_graph(cr, root, width, row_height, font):
+    """Draw the call tree under root as a flame graph, with root at the top"""
+
+    total = root.count
+    if total == 0:
+        return
+
+    layout = cr.create_layout()
+    layout.set_font_description(font)
+    layout.set_ellipsize(pango.ELLIPSIZE_END)
+
+    def draw_node(node, x, box_width, depth):
+        y = depth * row_height
+
+        cr.rectangle(x + 0.5, y + 0.5, box_width - 1, row_height - 1)
+        cr.set_source_rgb(*_box_color(node))
+        cr.fill_preserve()
+        cr.set_source_rgb(1, 1, 1)
+        cr.set_line_width(1)
+        cr.stroke()
+
+        if box_width >= MIN_LABEL_WIDTH:
+            layout.set_text("%s (%s)" % (node.name, _format_percent(node, total)))
+            layout.set_width(int(pango.SCALE * (box_width - 4)))
+            _, text_height = layout.get_pixel_size()
+            cr.set_source_rgb(0, 0, 0)
+            cr.move_to(x + 2, y + (row_height - text_height) / 2.)
+            cr.show_layout(layout)
+
+        if depth + 1 >= MAX_DEPTH:
+            return
+
+        child_x = x
+        for child in node.get_sorted_children():
+            child_width = box_width * child.count / node.count
+            if child_width < MIN_BOX_WIDTH:
+                break
+            draw_node(child, child_x, child_width, depth + 1)
+            child_x += child_width
+
+    draw_node(root, 0, float(width), 0)
+
+def _get_row_height(context, font):
+    metrics = context.get_metrics(font)
+    return (metrics.get_ascent() + metrics.get_descent()) / pango.SCALE + 4
+
+class ProfileResult(CustomResult):
+    """The result of profiling a block of code with the 'profile:' keyword"""
+
+    def __init__(self):
+        #: the root of the call tree; the code in the profiled block
+        self.root = ProfileNode('<profile>', '<statement>', 0)
+        #: the time spent running the block, in seconds
+        self.elapsed = None
+
+    def create_widget(self):
+        return _FlameGraphWidget(self)
+
+    def print_result(self, print_context, render):
+        font = pango.FontDescription("Sans %d" % PRINT_FONT_SIZE)
+        row_height = _get_row_height(print_context.create_pango_context(), font)
+        height = row_height * self.root.get_depth(MAX_DEPTH)
+
+        if render:
+            cr = print_context.get_cairo_context()
+            _draw_flame_graph(cr, self.root, print_context.get_width(), row_height, font)
+
+        return height
+
+    def __repr__(self):
+        if self.elapsed is None:
+            return "<ProfileResult (running)>"
+        else:
+            return "<ProfileResult %.2fs, %d samples>" % (self.elapsed, self.root.count)
+
+class _FlameGraphWidget(ResultWidget):
+    __gsignals__ = {
+        'button-press-event': 'override',
+        'expose-event': 'override',
+    }
+
+    def __init__(self, result):
+        ResultWidget.__init__(self)
+
+        self.add_events(gtk.gdk.BUTTON_PRESS_MASK)
+
+        self.result = result
+        # Clicking on a box zooms in to show the call tree under it;
+        # clicking on the top box zooms back out
+        self.zoomed = result.root
+        self.font = None
+        self.row_height = 0
+
+        self.set_has_tooltip(True)
+        self.connect('query-tooltip', self.on_query_tooltip)
+
+    def sync_style(self, style):
+        self.font = style.font_desc
+        self.row_height = _get_row_height(self.get_pango_context(), self.font)
+        self.queue_resize()
+
+    def do_size_request(self, requisition):
+        requisition.width = FLAME_GRAPH_WIDTH
+        if self.result.root.count == 0:
+            requisition.height = 0
+        else:
+            requisition.height = self.row_height * self.zoomed.get_depth(MAX_DEPTH)
+
+    def do_expose_event(self, event):
+        if self.font is None:
+            return False
+
+        cr = self.window.cairo_create()
+        _draw_flame_graph(cr, self.zoomed, self.allocation.width, self.row_height, self.font)
+
+        return False
+
+    def __find_node(self, x, y):
+        # Find the box drawn at x, y, following the layout of _draw_flame_graph
+        if self.row_height == 0 or self.zoomed.count == 0:
+            return None
+
+        depth = int(y // self.row_height)
+        node = self.zoomed
+        node_x = 0.
+        node_width = float(self.allocation.width)
+        for i in xrange(depth):
+            child_x = node_x
+            for child in node.get_sorted_children():
+                child_width = node_width * child.count / node.count
+                if child_width < MIN_BOX_WIDTH:
+                    return None
+                if x < child_x + child_width:
+                    break
+                child_x += child_width
+            else:
+                return None
+
+            node, node_x, node_width = child, child_x, child_width
+
+        if x < node_x or x >= node_x + node_width:
+            return None
+
+        return node
+
+    def on_query_tooltip(self, widget, x, y, keyboard_mode, tooltip):
+        if keyboard_mode:
+            return False
+
+        node = self.__find_node(x, y)
+        if node is None:
+            return False
+
+        total = self.result.root.count
+        text = "%s\n%s:%d\n%s of samples, %s in the function itself" % (
+            node.name, node.filename, node.lineno,
+            _format_percent(node, total), "%.1f%%" % (100. * node.self_count / total))
+        tooltip.set_text(text)
+
+        return True
+
+    def do_button_press_event(self, event):
+        if event.button != 1 or event.type != gtk.gdk.BUTTON_PRESS:
+            return False
+
+        node = self.__find_node(event.x, event.y)
+        if node is None:
+            return True
+
+        if node is self.zoomed:
+            if node.parent is not None:
+                self.zoomed = node.parent
+        else:
+            self.zoomed = node
+
+        self.queue_resize()
+        self.queue_draw()
+
+        return True
+
+####################################################################################
+
+if __name__ == "__main__":
+    def expect(result, expected):
+        if result != expected:
+            print "Got %r, expected %r" % (result, expected)
+
+    def spin(seconds):
+        start = time.time()
+        while time.time() < start + seconds:
+            pass
+
+    def outer():
+        spin(0.1)
+        inner()
+
+    def inner():
+        spin(0.3)
+
+    profiler = SamplingProfiler()
+    with profiler as result:
+        outer()
+
+    root = result.root
+    expect([child.name for child in root.get_sorted_children()], ['outer'])
+    outer_node = root.get_sorted_children()[0]
+    inner_node = [child for child in outer_node.get_sorted_children() if child.name == 'inner'][0]
+    expect(outer_node.parent, root)
+    expect(root.count >= outer_node.count >= inner_node.count, True)
+    # About three quarters of the time is spent in inner(); leave lots of slop
+    # for a loaded machine
+    fraction = float(inner_node.count) / outer_node.count
+    if not 0.5 < fraction < 0.95:
+        print "inner() had %.2f of the samples, expected about 0.75" % fraction
+    expect(root.get_depth(MAX_DEPTH) >= 3, True)
+    expect(root.get_depth(2), 2)
+    expect(result.elapsed >= 0.4, True)
@@ -8,6 +8,7 @@
 
 from __future__ import with_statement
 
+import gio
 import gobject
 import gtk
 import logging
@@ -19,7 +20,7 @@ from destroyable import Destroyable
 import doc_format
 from notebook import HelpResult
 import reunicode
-from statement import WarningResult
+from statement import OmittedOutputResult, TruncatedResult, WarningResult
 from style import DEFAULT_STYLE
 from worksheet import Worksheet, NEW_LINE_RE
 
@@ -46,6 +47,24 @@ class _RevalidateIters:
             _copy_iter(iter, self.buffer.get_iter_at_mark(mark))
             self.buffer.delete_mark(mark)
 
+# Text of the link after a truncated result that shows more of it
+EXPAND_TEXT = "[Show more]"
+
+# Text of the link after omitted output that opens the complete output
+OPEN_OUTPUT_TEXT = "[Open complete output]"
+
+# Inline results of a chunk that are longer than RESULT_COLLAPSE_LINES lines
+# are shown collapsed: only the first RESULT_PREVIEW_LINES lines are inserted
+# into the buffer, followed by a link to show more. Once the user has clicked
+# the link, further results are inserted RESULT_PAGE_LINES lines at a time
+# as the user scrolls to the end of what has been inserted.
+RESULT_COLLAPSE_LINES = 100
+RESULT_PREVIEW_LINES = 20
+RESULT_PAGE_LINES = 200
+
+# Text of the link after collapsed results
+SHOW_MORE_TEXT = "[Show more - %d lines]"
+
 ADJUST_BEFORE = 0
 ADJUST_AFTER = 1
 ADJUST_NONE = 2
@@ -73,6 +92,46 @@ def _backward_line(iter):
     iter.backward_line()
     return iter.get_line() != line
 
+def _count_result_lines(results):
+    # Results other than text are counted as a single line
+    lines = 0
+    for result in results:
+        if isinstance(result, basestring):
+            lines += result.count("\n") + 1
+        else:
+            lines += 1
+
+    return lines
+
+def _results_equivalent(a, b):
+    # Check whether two results would be displayed identically, so that
+    # what is displayed for a can be kept to display b
+    if type(a) is not type(b):
+        return False
+
+    if isinstance(a, basestring):
+        if isinstance(a, OmittedOutputResult) and (a.filename is None) != (b.filename is None):
+            return False
+        return a == b
+    elif isinstance(a, WarningResult):
+        return a.message == b.message
+    elif isinstance(a, HelpResult):
+        return a.arg is b.arg
+    elif isinstance(a, CustomResult):
+        return a.is_equivalent(b)
+    else:
+        return False
+
+def _all_results_equivalent(a, b):
+    if len(a) != len(b):
+        return False
+
+    for x, y in zip(a, b):
+        if not _results_equivalent(x, y):
+            return False
+
+    return True
+
 ####################################################################
 
 class ShellBuffer(Destroyable, gtk.TextBuffer):
@@ -122,6 +181,16 @@ class ShellBuffer(Destroyable, gtk.TextBuffer):
 
         self.__bold_tag = self.create_tag(weight=pango.WEIGHT_BOLD)
 
+        self.__expand_tag = self.create_tag(foreground="blue", underline=pango.UNDERLINE_SINGLE)
+        self.__expand_tag.connect('event', self.on_expand_tag_event)
+        self.__open_output_tag = self.create_tag(foreground="blue", underline=pango.UNDERLINE_SINGLE)
+        self.__open_output_tag.connect('event', self.on_open_output_tag_event)
+        self.__more_tag = self.create_tag(foreground="blue", underline=pango.UNDERLINE_SINGLE)
+        self.__more_tag.connect('event', self.on_more_tag_event)
+
+        # Chunks with results shown collapsed that the user has clicked to see more of
+        self.__expanded_chunks = set()
+
         self.__fontify_tags = {}
         for subject in style.specs:
             if isinstance(subject, int): # A token type
@@ -153,19 +222,15 @@ class ShellBuffer(Destroyable, gtk.TextBuffer):
     def __end_modification(self):
         self.__in_modification_count -= 1
 
-    def __insert_results(self, chunk):
-        if not isinstance(chunk, StatementChunk):
-            return
-
-        if chunk.results_start_mark or chunk.sidebar_results:
-            raise RuntimeError("__insert_results called when we already have results")
-
-        if (chunk.results is None or len(chunk.results) == 0) and chunk.error_message is None:
-            return
+    def __split_results(self, chunk):
+        # Returns a tuple of (inline_results, sidebar_results) for the chunk
 
         if chunk.error_message:
             inline_results = [ chunk.error_message ]
             sidebar_results = None
+        elif chunk.results is None:
+            inline_results = []
+            sidebar_results = None
         else:
             inline_results = []
             sidebar_results = []
@@ -180,10 +245,27 @@ class ShellBuffer(Destroyable, gtk.TextBuffer):
                 else:
                     inline_results.append(result)
 
+        return inline_results, sidebar_results
+
+    def __insert_results(self, chunk):
+        if not isinstance(chunk, StatementChunk):
+            return
+
+        if chunk.results_start_mark or chunk.sidebar_results:
+            raise RuntimeError("__insert_results called when we already have results")
+
+        if (chunk.results is None or len(chunk.results) == 0) and chunk.error_message is None:
+            return
+
+        inline_results, sidebar_results = self.__split_results(chunk)
+
         if sidebar_results:
             chunk.sidebar_results = sidebar_results
             self.emit("add-sidebar-results", chunk)
 
+        self.__insert_inline_results(chunk, inline_results)
+
+    def __insert_inline_results(self, chunk, inline_results):
         if not inline_results:
             return
 
@@ -204,38 +286,19 @@ class ShellBuffer(Destroyable, gtk.TextBuffer):
 
         chunk.results_start_mark = self.create_mark(None, location, True)
         chunk.results_start_mark.source = chunk
+        chunk.inline_results = inline_results
+        chunk.inline_results_error = chunk.error_message is not None
 
-        first = True
-        for result in inline_results:
-            if not first:
-                self.insert(location, "\n")
-            first = False
-
-            if isinstance(result, basestring):
-                self.insert(location, result)
-            elif isinstance(result, WarningResult):
-                start_mark = self.create_mark(None, location, True)
-                self.insert(location, result.message)
-                start = self.get_iter_at_mark(start_mark)
-                self.delete_mark(start_mark)
-                self.apply_tag(self.__warning_tag, start, location)
-            elif isinstance(result, HelpResult):
-                start_mark = self.create_mark(None, location, True)
-                doc_format.insert_docs(self, location, result.arg, self.__bold_tag)
-                start = self.get_iter_at_mark(start_mark)
-                self.delete_mark(start_mark)
-                self.apply_tag(self.__help_tag, start, location)
-            elif isinstance(result, CustomResult):
-                anchor = self.create_child_anchor(location)
-                self.emit("add-custom-result", result, anchor)
-                location = self.get_iter_at_child_anchor(anchor)
-                location.forward_char() # Skip over child
+        # Large results are shown collapsed; see __insert_result_items()
+        total_lines = _count_result_lines(inline_results)
+        if total_lines > RESULT_COLLAPSE_LINES:
+            max_lines = RESULT_PREVIEW_LINES
+        else:
+            max_lines = None
+        pending = [(result, 0, None) for result in inline_results]
+        location = self.__insert_result_items(chunk, location, pending, total_lines, max_lines, first=True)
 
-        start = self.get_iter_at_mark(chunk.results_start_mark)
-        self.apply_tag(self.__result_tag, start, location)
-        self.apply_tag(self.__whole_buffer_tag, start, location)
-        if chunk.error_message:
-            self.apply_tag(self.__error_tag, start, location)
+        self.__apply_result_tags(chunk, self.get_iter_at_mark(chunk.results_start_mark), location)
         chunk.results_end_mark = self.create_mark(None, location, True)
         chunk.results_start_mark.source = chunk
 
@@ -248,6 +311,251 @@ class ShellBuffer(Destroyable, gtk.TextBuffer):
         if chunk.pixels_below != 0:
             self.__reset_last_line_tag(chunk)
 
+    def __insert_result_items(self, chunk, location, pending, pending_lines, max_lines, first):
+        # Insert the results in pending, a list of (result, lines_to_skip, result_lines),
+        # at location until we've inserted max_lines lines. result_lines is the text
+        # of a result split into lines, once we've split it, so that showing a large
+        # result a page at a time doesn't split the whole thing for each page.
+        # pending_lines is the total number of lines in pending.
+        #
+        # If results remain, a link to show more is inserted, and the remaining results
+        # are stored in chunk.pending_results, and the number of lines in them in
+        # chunk.pending_lines. Returns the location after the inserted text.
+
+        lines = 0
+        i = 0
+        while i < len(pending):
+            if max_lines is not None and lines >= max_lines:
+                break
+
+            result, skip, result_lines = pending[i]
+            i += 1
+
+            if not first:
+                self.insert(location, "\n")
+            first = False
+
+            if skip == 0:
+                chunk.result_marks.append(self.create_mark(None, location, True))
+
+            if isinstance(result, basestring) and (skip > 0 or max_lines is not None):
+                if result_lines is None:
+                    result_lines = result.split("\n")
+                if max_lines is not None and len(result_lines) - skip > max_lines - lines:
+                    # Split the result, and insert the rest later
+                    count = max_lines - lines
+                    self.insert(location, "\n".join(result_lines[skip:skip + count]))
+                    lines += count
+                    i -= 1
+                    pending[i] = (result, skip + count, result_lines)
+                    break
+
+                location = self.__insert_result_item(location, result, "\n".join(result_lines[skip:]))
+                lines += len(result_lines) - skip
+            else:
+                location = self.__insert_result_item(location, result)
+                lines += _count_result_lines((result,))
+
+        if i < len(pending):
+            chunk.pending_results = pending[i:]
+            chunk.pending_lines = pending_lines - lines
+            self.insert(location, "\n")
+            if chunk.more_results_mark is None:
+                chunk.more_results_mark = self.create_mark(None, location, True)
+            else:
+                self.move_mark(chunk.more_results_mark, location)
+            self.insert_with_tags(location,
+                                  SHOW_MORE_TEXT % chunk.pending_lines,
+                                  self.__more_tag)
+        else:
+            chunk.pending_results = None
+            if chunk.more_results_mark is not None:
+                self.delete_mark(chunk.more_results_mark)
+                chunk.more_results_mark = None
+            self.__expanded_chunks.discard(chunk)
+
+        return location
+
+    def __insert_result_item(self, location, result, text=None):
+        # Insert a single result at location, returning the location after the
+        # result. For a text result, text is the part of the result to insert,
+        # if not the whole thing.
+
+        if isinstance(result, basestring):
+            if text is None:
+                text = result
+            self.insert(location, text)
+            if isinstance(result, TruncatedResult):
+                self.insert(location, " ")
+                self.insert_with_tags(location, EXPAND_TEXT, self.__expand_tag)
+            elif isinstance(result, OmittedOutputResult) and result.filename is not None:
+                self.insert(location, " ")
+                self.insert_with_tags(location, OPEN_OUTPUT_TEXT, self.__open_output_tag)
+        elif isinstance(result, WarningResult):
+            start_mark = self.create_mark(None, location, True)
+            self.insert(location, result.message)
+            start = self.get_iter_at_mark(start_mark)
+            self.delete_mark(start_mark)
+            self.apply_tag(self.__warning_tag, start, location)
+        elif isinstance(result, HelpResult):
+            start_mark = self.create_mark(None, location, True)
+            doc_format.insert_docs(self, location, result.arg, self.__bold_tag)
+            start = self.get_iter_at_mark(start_mark)
+            self.delete_mark(start_mark)
+            self.apply_tag(self.__help_tag, start, location)
+        elif isinstance(result, CustomResult):
+            anchor = self.create_child_anchor(location)
+            self.emit("add-custom-result", result, anchor)
+            location = self.get_iter_at_child_anchor(anchor)
+            location.forward_char() # Skip over child
+
+        return location
+
+    def __apply_result_tags(self, chunk, start, end):
+        self.apply_tag(self.__result_tag, start, end)
+        self.apply_tag(self.__whole_buffer_tag, start, end)
+        if chunk.error_message:
+            self.apply_tag(self.__error_tag, start, end)
+
+    def __update_results(self, chunk):
+        # Update the results shown for the chunk to match chunk.results and
+        # chunk.error_message. Rather than deleting all the old results and
+        # inserting the new ones, we compare the old and new results item by item,
+        # and only replace the items that have changed, so unchanged text stays in
+        # place and widgets for unchanged custom results aren't recreated.
+
+        if not isinstance(chunk, StatementChunk):
+            return
+
+        inline_results, sidebar_results = self.__split_results(chunk)
+
+        if not _all_results_equivalent(chunk.sidebar_results or [], sidebar_results or []):
+            self.__delete_sidebar_results(chunk)
+            if sidebar_results:
+                chunk.sidebar_results = sidebar_results
+                self.emit("add-sidebar-results", chunk)
+        elif sidebar_results:
+            for old, new in zip(chunk.sidebar_results, sidebar_results):
+                self.__keep_result(chunk, old, new)
+
+        old_results = chunk.inline_results
+        if (chunk.results_start_mark is None or not inline_results or
+            chunk.pending_results is not None or
+            chunk.inline_results_error != (chunk.error_message is not None) or
+            _count_result_lines(inline_results) > RESULT_COLLAPSE_LINES):
+            self.__delete_inline_results(chunk)
+            self.__insert_inline_results(chunk, inline_results)
+            return
+
+        self.__begin_modification()
+
+        marks = chunk.result_marks
+        for i in xrange(min(len(old_results), len(inline_results))):
+            if _results_equivalent(old_results[i], inline_results[i]):
+                self.__keep_result(chunk, old_results[i], inline_results[i])
+                inline_results[i] = old_results[i]
+                continue
+
+            start = self.get_iter_at_mark(marks[i])
+            if i + 1 < len(marks):
+                end = self.get_iter_at_mark(marks[i + 1])
+                end.backward_char() # Newline between results
+            else:
+                end = self.get_iter_at_mark(chunk.results_end_mark)
+            self.delete(start, end)
+
+            location = self.__insert_result_item(start, inline_results[i])
+            self.__apply_result_tags(chunk, self.get_iter_at_mark(marks[i]), location)
+            if i + 1 == len(marks):
+                self.move_mark(chunk.results_end_mark, location)
+
+        if len(inline_results) < len(old_results):
+            start = self.get_iter_at_mark(marks[len(inline_results)])
+            start.backward_char() # Newline before the first deleted result
+            self.delete(start, self.get_iter_at_mark(chunk.results_end_mark))
+            for mark in marks[len(inline_results):]:
+                self.delete_mark(mark)
+            del marks[len(inline_results):]
+            self.move_mark(chunk.results_end_mark, start)
+        elif len(inline_results) > len(old_results):
+            location = self.get_iter_at_mark(chunk.results_end_mark)
+            start_mark = self.create_mark(None, location, True)
+            for result in inline_results[len(old_results):]:
+                self.insert(location, "\n")
+                marks.append(self.create_mark(None, location, True))
+                location = self.__insert_result_item(location, result)
+            self.__apply_result_tags(chunk, self.get_iter_at_mark(start_mark), location)
+            self.delete_mark(start_mark)
+            self.move_mark(chunk.results_end_mark, location)
+
+        chunk.inline_results = inline_results
+
+        self.__end_modification()
+
+        self.__adjust_status_tags(chunk)
+        if chunk.pixels_below != 0:
+            self.__reset_last_line_tag(chunk)
+
+    def __keep_result(self, chunk, old, new):
+        # When an equivalent result is kept, what is displayed (for a custom
+        # result, the widget) still refers to the old result; put it back in
+        # chunk.results in place of the new one so the two agree
+        if old is new or not isinstance(old, CustomResult):
+            return
+
+        for i, result in enumerate(chunk.results):
+            if result is new:
+                chunk.results[i] = old
+                break
+
+    def show_more_results(self, chunk):
+        """Insert the next page of results for a chunk with results shown collapsed"""
+
+        if not (isinstance(chunk, StatementChunk) and chunk.pending_results):
+            return
+
+        self.__begin_modification()
+
+        # Replace the newline and link at the end of the results
+        start = self.get_iter_at_mark(chunk.more_results_mark)
+        start.backward_char()
+        end = self.get_iter_at_mark(chunk.results_end_mark)
+        self.delete(start, end)
+
+        page_start = self.create_mark(None, start, True)
+        location = self.__insert_result_items(chunk, start, chunk.pending_results, chunk.pending_lines,
+                                              RESULT_PAGE_LINES, first=False)
+
+        self.__apply_result_tags(chunk, self.get_iter_at_mark(page_start), location)
+        self.delete_mark(page_start)
+        self.move_mark(chunk.results_end_mark, location)
+
+        self.__end_modification()
+
+        self.__adjust_status_tags(chunk)
+        if chunk.pixels_below != 0:
+            self.__reset_last_line_tag(chunk)
+
+    def get_expanded_chunks(self):
+        """Get the chunks with collapsed results that the user has started to expand.
+        More results should be inserted with show_more_results() as the end of the
+        results so far (chunk.more_results_mark) is scrolled into view."""
+
+        return list(self.__expanded_chunks)
+
+    def __expand_result(self, chunk, n):
+        # Replace the n'th truncated inline result of chunk with a longer version
+        for i, result in enumerate(chunk.results):
+            if isinstance(result, TruncatedResult):
+                if n == 0:
+                    expanded = chunk in self.__expanded_chunks
+                    chunk.results[i] = result.expand()
+                    self.__update_results(chunk)
+                    if expanded and chunk.pending_results:
+                        self.__expanded_chunks.add(chunk)
+                    return
+                n -= 1
+
     def __delete_results_marks(self, chunk):
         if not (isinstance(chunk, StatementChunk) and chunk.results_start_mark):
             return
@@ -257,6 +565,17 @@ class ShellBuffer(Destroyable, gtk.TextBuffer):
         chunk.results_start_mark = None
         chunk.results_end_mark = None
 
+        if chunk.more_results_mark is not None:
+            self.delete_mark(chunk.more_results_mark)
+            chunk.more_results_mark = None
+        chunk.pending_results = None
+        self.__expanded_chunks.discard(chunk)
+
+        for mark in chunk.result_marks:
+            self.delete_mark(mark)
+        chunk.result_marks = []
+        chunk.inline_results = None
+
     def __delete_inline_results(self, chunk):
         if not (isinstance(chunk, StatementChunk) and chunk.results_start_mark):
             return
@@ -617,6 +936,11 @@ class ShellBuffer(Destroyable, gtk.TextBuffer):
         chunk.pixels_above = chunk.pixels_below = 0
         chunk.results_start_mark = None
         chunk.results_end_mark = None
+        chunk.more_results_mark = None
+        chunk.pending_results = None
+        chunk.result_marks = []
+        chunk.inline_results = None
+        chunk.inline_results_error = False
         chunk.sidebar_results = None
         self.on_chunk_changed(worksheet, chunk, range(0, chunk.end - chunk.start))
 
@@ -687,10 +1011,63 @@ class ShellBuffer(Destroyable, gtk.TextBuffer):
             end = self.pos_to_iter(chunk.start + chunk.error_line - 1, -1)
             self.apply_tag(self.__error_line_tag, start, end)
 
+    def __find_link(self, tag, event, iter):
+        # Find the chunk with a link that was clicked, and the index of the link among
+        # the links for the same tag in its results. Returns (None, None) if the event
+        # isn't a click on a link
+
+        if event.type != gtk.gdk.BUTTON_RELEASE or event.button != 1:
+            return None, None
+
+        for chunk in self.worksheet.iterate_chunks():
+            if isinstance(chunk, StatementChunk) and chunk.results_start_mark is not None:
+                start = self.get_iter_at_mark(chunk.results_start_mark)
+                end = self.get_iter_at_mark(chunk.results_end_mark)
+                if start.compare(iter) <= 0 and iter.compare(end) <= 0:
+                    break
+        else:
+            return None, None
+
+        n = -1
+        while start.forward_to_tag_toggle(tag) and start.compare(iter) <= 0:
+            if start.begins_tag(tag):
+                n += 1
+
+        if n < 0:
+            return None, None
+
+        return chunk, n
+
+    def on_expand_tag_event(self, tag, view, event, iter):
+        chunk, n = self.__find_link(tag, event, iter)
+        if chunk is None:
+            return False
+
+        self.__expand_result(chunk, n)
+        return True
+
+    def on_more_tag_event(self, tag, view, event, iter):
+        chunk, n = self.__find_link(tag, event, iter)
+        if chunk is None:
+            return False
+
+        self.__expanded_chunks.add(chunk)
+        self.show_more_results(chunk)
+        return True
+
+    def on_open_output_tag_event(self, tag, view, event, iter):
+        chunk, n = self.__find_link(tag, event, iter)
+        if chunk is None:
+            return False
+
+        results = [r for r in chunk.results if isinstance(r, OmittedOutputResult) and r.filename is not None]
+        from application import application
+        application.show_uri(gio.File(results[n].filename).get_uri())
+        return True
+
     def on_chunk_results_changed(self, worksheet, chunk):
         _debug("...chunk %s results changed", chunk);
-        self.__delete_results(chunk)
-        self.__insert_results(chunk)
+        self.__update_results(chunk)
 
     def on_place_cursor(self, worksheet, line, offset):
         self.place_cursor(self.pos_to_iter(line, offset))
@@ -13,18 +13,34 @@
 import glib
 import gobject
 import gtk
+import math
 import re
 from shell_buffer import ShellBuffer, ADJUST_NONE, ADJUST_BEFORE, ADJUST_AFTER
 from chunks import StatementChunk, CommentChunk, BlankChunk
 from completion_popup import CompletionPopup
 from doc_popup import DocPopup
 from global_settings import global_settings
+from lookup_thread import TIMED_OUT
 from notebook import NotebookFile
+from resource_limits import format_size
 import sanitize_textview_ipc
 from sidebar import Sidebar
 
 LEFT_MARGIN_WIDTH = 10
 
+# Statements that took longer than HEAT_MIN_TIME seconds to execute get a
+# "heat" indicator in the left margin, going from yellow to red at
+# HEAT_MAX_TIME seconds
+HEAT_MIN_TIME = 0.1
+HEAT_MAX_TIME = 10.
+HEAT_WIDTH = 4
+
+# Number of chunks listed in the summary of slowest chunks shown as
+# a tooltip for the left margin
+SLOWEST_CHUNKS_COUNT = 5
+# Number of variables listed with the memory a chunk keeps alive
+LARGEST_BINDINGS_COUNT = 5
+
 ALL_WHITESPACE_RE = re.compile("^\s*$")
 
 # We depend on knowing what priorities GDK and GTK+ use to hook in and
@@ -36,6 +52,35 @@ PRIORITY_SIDEBAR_BEFORE_RESIZE = glib.PRIORITY_HIGH_IDLE + 9
 # GTK_TEXT_VIEW_PRIORITY_VALIDATE  = GDK_PRIORITY_REDRAW + 5
 PRIORITY_SIDEBAR_AFTER_VALIDATE = glib.PRIORITY_HIGH_IDLE + 26
 PRIORITY_SCROLL_RESULT_ONSCREEN = glib.PRIORITY_HIGH_IDLE + 27
+# Inserting more of a collapsed result is done after the text view is
+# validated, so that we know what is visible
+PRIORITY_LOAD_RESULTS = glib.PRIORITY_HIGH_IDLE + 28
+
+def _format_time(seconds):
+    if seconds < 1:
+        return "%.0fms" % (seconds * 1000)
+    else:
+        return "%.2fs" % seconds
+
+def _format_stats(stats):
+    lines = ["Executed in %s (%s of CPU time)" % (_format_time(stats.wall_time), _format_time(stats.cpu_time))]
+    if stats.copy_time >= 0.001:
+        lines.append("Copying modified variables: %s" % _format_time(stats.copy_time))
+    # This is for the whole process, so can include other worksheets calculating
+    if stats.memory_delta is not None:
+        if stats.memory_delta < 0:
+            lines.append("Process memory: -%s" % format_size(- stats.memory_delta))
+        else:
+            lines.append("Process memory: +%s" % format_size(stats.memory_delta))
+
+    return "\n".join(lines)
+
+def _format_memory(memory):
+    lines = ["Keeps alive: %s" % format_size(memory.total)]
+    for binding in memory.bindings[0:LARGEST_BINDINGS_COUNT]:
+        lines.append("    %s (%s): %s" % (binding.name, binding.type_name, format_size(binding.size)))
+
+    return "\n".join(lines)
 
 class ShellView(gtk.TextView):
     __gsignals__ = {}
@@ -85,6 +130,8 @@ class ShellView(gtk.TextView):
         self.__doc_popup = DocPopup()
         self.__mouse_over_object = None
         self.__mouse_over_timeout = None
+        self.__mouse_over_lookup = None
+        self.__mouse_over_position = None
 
         self.__mouse_over_start = buf.create_mark(None, buf.get_start_iter(), True)
 
@@ -96,6 +143,7 @@ class ShellView(gtk.TextView):
         self.__scroll_to_result = False
         self.__scroll_to = buf.create_mark(None, buf.get_start_iter(), True)
         self.__scroll_idle = None
+        self.__load_results_idle = None
 
         self.__update_sidebar_positions_idle = 0
         self.__pixels_below_buffer = 0
@@ -103,6 +151,10 @@ class ShellView(gtk.TextView):
 
         self.connect('destroy', self.on_destroy)
 
+        if not self.edit_only:
+            self.set_has_tooltip(True)
+            self.connect('query-tooltip', self.on_query_tooltip)
+
     def __get_worksheet_line_yrange(self, line):
         buffer_line = self.get_buffer().pos_to_iter(line)
         return self.get_line_yrange(buffer_line)
@@ -186,6 +238,7 @@ class ShellView(gtk.TextView):
             self.__watch_window.raise_()
 
     def on_destroy(self, obj):
+        self.__cancel_mouse_over_lookup()
         self.__completion_popup.destroy()
         self.__completion_popup = None
         self.__doc_popup.destroy()
@@ -193,6 +246,8 @@ class ShellView(gtk.TextView):
 
         if self.__scroll_idle is not None:
             glib.source_remove(self.__scroll_idle)
+        if self.__load_results_idle is not None:
+            glib.source_remove(self.__load_results_idle)
 
     def do_unrealize(self):
         self.__watch_window.set_user_data(None)
@@ -215,6 +270,21 @@ class ShellView(gtk.TextView):
 
         return self.get_buffer().worksheet.iterate_chunks(start_line, end_line + 1)
 
+    def __paint_heat(self, cr, chunk):
+        wall_time = chunk.stats.wall_time
+        if wall_time < HEAT_MIN_TIME:
+            return
+
+        heat = math.log(wall_time / HEAT_MIN_TIME) / math.log(HEAT_MAX_TIME / HEAT_MIN_TIME)
+        heat = min(heat, 1.)
+
+        chunk_y, chunk_height = self.__get_chunk_yrange(chunk)
+        _, window_y = self.buffer_to_window_coords(gtk.TEXT_WINDOW_LEFT, 0, chunk_y)
+
+        cr.rectangle(1, window_y + 1, HEAT_WIDTH, chunk_height - 2)
+        cr.set_source_rgb(1, 1 - heat, 0)
+        cr.fill()
+
     def __expose_window_left(self, event):
         cr = event.window.cairo_create()
 
@@ -231,6 +301,9 @@ class ShellView(gtk.TextView):
                 else:
                     self.paint_chunk(cr, event.area, chunk, (0, 0, 1), (0, 0, 0.5))
 
+                if chunk.stats is not None and not chunk.executing:
+                    self.__paint_heat(cr, chunk)
+
     def __draw_rect_outline(self, event, rect):
         if (rect.y + rect.height <= event.area.y or rect.y >= event.area.y + event.area.height):
             return
@@ -486,6 +559,37 @@ class ShellView(gtk.TextView):
                 self.__expose_pair_location(event)
             if buf.get_has_selection():
                 self.__expose_padding_areas(event)
+            if not self.edit_only:
+                self.__queue_load_results()
+
+        return False
+
+    def __queue_load_results(self):
+        if self.__load_results_idle is not None:
+            return
+
+        for chunk in self.get_buffer().get_expanded_chunks():
+            if chunk.pending_results:
+                self.__load_results_idle = glib.idle_add(self.__load_results,
+                                                         priority=PRIORITY_LOAD_RESULTS)
+                return
+
+    def __load_results(self):
+        # When the user has asked to see more of a collapsed result, insert the
+        # rest of it a page at a time as the end of what we've inserted becomes
+        # visible. Inserting text causes a new expose, so we'll get called again
+        # if another page is needed.
+        self.__load_results_idle = None
+
+        buf = self.get_buffer()
+        visible = self.get_visible_rect()
+        for chunk in buf.get_expanded_chunks():
+            if not chunk.pending_results:
+                continue
+
+            y, _ = self.get_line_yrange(buf.get_iter_at_mark(chunk.more_results_mark))
+            if visible.y <= y < visible.y + visible.height:
+                buf.show_more_results(chunk)
 
         return False
 
@@ -658,6 +762,36 @@ class ShellView(gtk.TextView):
             else:
                 event.x -= LEFT_MARGIN_WIDTH
 
+    def on_query_tooltip(self, view, x, y, keyboard_mode, tooltip):
+        # Hovering over the left margin shows how long the statement took to
+        # execute and the memory it keeps alive, and a summary of the slowest
+        # statements in the worksheet
+        if keyboard_mode or x >= LEFT_MARGIN_WIDTH:
+            return False
+
+        _, buffer_y = self.window_to_buffer_coords(gtk.TEXT_WINDOW_WIDGET, x, y)
+        line = self.__get_worksheet_line_at_y(buffer_y, adjust=ADJUST_BEFORE)
+
+        worksheet = self.get_buffer().worksheet
+        chunk = worksheet.get_chunk(line)
+        if not isinstance(chunk, StatementChunk) or chunk.stats is None or chunk.executing:
+            return False
+
+        lines = [_format_stats(chunk.stats)]
+        if chunk.memory is not None and chunk.memory.bindings:
+            lines.append(_format_memory(chunk.memory))
+        lines += ["", "Slowest statements:"]
+        for slow_chunk in worksheet.get_slowest_chunks(SLOWEST_CHUNKS_COUNT):
+            lines.append("    Line %d: %s" % (slow_chunk.start + 1, _format_time(slow_chunk.stats.wall_time)))
+        tooltip.set_text("\n".join(lines))
+
+        # So that we get asked again when the pointer moves to another chunk
+        chunk_y, chunk_height = self.__get_chunk_yrange(chunk, include_padding=True, include_results=True)
+        _, widget_y = self.buffer_to_window_coords(gtk.TEXT_WINDOW_WIDGET, 0, chunk_y)
+        tooltip.set_tip_area(gtk.gdk.Rectangle(0, widget_y, LEFT_MARGIN_WIDTH, chunk_height))
+
+        return True
+
     def do_button_press_event(self, event):
         self.__rewrite_window(event)
 
@@ -823,6 +957,38 @@ class ShellView(gtk.TextView):
             self.__mouse_over_timeout = None
             
         self.__mouse_over_object = None
+
+    def __cancel_mouse_over_lookup(self):
+        if self.__mouse_over_lookup is not None:
+            self.__mouse_over_lookup.cancel()
+            self.__mouse_over_lookup = None
+
+        self.__mouse_over_position = None
+
+    def __on_mouse_over_lookup_done(self, result):
+        self.__mouse_over_lookup = None
+        if self.__doc_popup.focused:
+            return
+
+        # There's nothing to show for an object we couldn't look up in time
+        if result is TIMED_OUT:
+            result = (None, None, None, None, None)
+
+        obj, start_line, start_offset, _,_ = result
+        if not obj is self.__mouse_over_object:
+            self.__stop_mouse_over()
+            self.__doc_popup.popdown()
+            if obj is not None:
+                buf = self.get_buffer()
+                start = buf.pos_to_iter(start_line, start_offset)
+                buf.move_mark(self.__mouse_over_start, start)
+
+                self.__mouse_over_object = obj
+                try:
+                    timeout = self.get_settings().get_property('gtk-tooltip-timeout')
+                except TypeError: # GTK+ < 2.12
+                    timeout = 500
+                self.__mouse_over_timeout = glib.timeout_add(timeout, self.__show_mouse_over)
         
     def do_motion_notify_event(self, event):
         # Successful mousing-over depends on knowing the types of symbols so doing the
@@ -833,28 +999,22 @@ class ShellView(gtk.TextView):
             x, y = self.window_to_buffer_coords(gtk.TEXT_WINDOW_TEXT, int(event.x), int(event.y))
             iter, _ = self.get_iter_at_position(x, y)
             line, offset = buf.iter_to_pos(iter, adjust=ADJUST_NONE)
-            if line is not None:
-                obj, start_line, start_offset, _,_ = buf.worksheet.get_object_at_location(line, offset)
-            else:
-                obj = None
 
-            if not obj is self.__mouse_over_object:
-                self.__stop_mouse_over()
-                self.__doc_popup.popdown()
-                if obj is not None:
-                    start = buf.pos_to_iter(start_line, start_offset)
-                    buf.move_mark(self.__mouse_over_start, start)
-
-                    self.__mouse_over_object = obj
-                    try:
-                        timeout = self.get_settings().get_property('gtk-tooltip-timeout')
-                    except TypeError: # GTK+ < 2.12
-                        timeout = 500
-                    self.__mouse_over_timeout = glib.timeout_add(timeout, self.__show_mouse_over)
+            # Looking up the object calls into user code, so it's done in a separate
+            # thread; a lookup that is still pending when the mouse moves on is dropped
+            if (line, offset) != self.__mouse_over_position:
+                self.__cancel_mouse_over_lookup()
+                self.__mouse_over_position = (line, offset)
+                if line is not None:
+                    self.__mouse_over_lookup = buf.worksheet.get_object_at_location_async(line, offset,
+                                                                                          self.__on_mouse_over_lookup_done)
+                else:
+                    self.__on_mouse_over_lookup_done((None, None, None, None, None))
                 
         return gtk.TextView.do_motion_notify_event(self, event)
 
     def do_leave_notify_event(self, event):
+        self.__cancel_mouse_over_lookup()
         self.__stop_mouse_over()
         if not self.__doc_popup.focused:
             self.__doc_popup.popdown()
@@ -977,10 +1137,13 @@ class ShellView(gtk.TextView):
         self.set_cursor_visible(worksheet.state != NotebookFile.EXECUTING)
 
     def on_after_insert_text(self, buf, location, text, len):
+        # A pending lookup would give us positions in the old text
+        self.__cancel_mouse_over_lookup()
         if buf.worksheet.in_user_action() and not buf.in_modification():
             self.__inserted_in_user_action = True
 
     def on_after_delete_range(self, buf, start, end):
+        self.__cancel_mouse_over_lookup()
         if buf.worksheet.in_user_action() and not buf.in_modification():
             self.__deleted_in_user_action = True
 
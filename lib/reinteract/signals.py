@@ -16,6 +16,10 @@ Purpose:  Support multi-threading and functional objects
           Code implementation advancment
 """
 
+#--------------------------------------------------------------------------------------
+from collections import deque
+
+
 #--------------------------------------------------------------------------------------
 class _Lock :
     #--------------------------------------------------------------------------------------
@@ -55,16 +59,21 @@ class _WeakMethod :
 
     #--------------------------------------------------------------------------------------
     def __call__( self, *args, **kwargs ) :
-        if not self : 
+        an_object = self.c()
+        if an_object is None : 
             return
 
-        self.f( self.c(), *args, **kwargs )
+        self.f( an_object, *args, **kwargs )
         pass
 
+    #--------------------------------------------------------------------------------------
+    def bind( self ) :
+        return ( self.c, self.f )
+
     #--------------------------------------------------------------------------------------
     def __eq__( self, the_weak_method ) :
-        return self.f == the_weak_method.im_func and \
-            self.c() == the_weak_method.im_self
+        return self.f == getattr( the_weak_method, 'im_func', None ) and \
+            self.c() == getattr( the_weak_method, 'im_self', None )
 
     #--------------------------------------------------------------------------------------
     def __nonzero__( self ) :
@@ -84,15 +93,23 @@ class _WeakObject :
 
     #--------------------------------------------------------------------------------------
     def __call__( self, *args, **kwargs ) :
-        if not self : 
+        an_object = self._engine()
+        if an_object is None : 
             return
 
-        self._engine()( *args, **kwargs )
+        an_object( *args, **kwargs )
         pass
 
+    #--------------------------------------------------------------------------------------
+    def bind( self ) :
+        return ( self._engine, None )
+
     #--------------------------------------------------------------------------------------
     def __eq__( self, the_other ) :
-        return self._engine() == the_other._engine()
+        if isinstance( the_other, _WeakObject ) :
+            return self._engine() == the_other._engine()
+
+        return self._engine() is the_other
 
     #--------------------------------------------------------------------------------------
     def __nonzero__( self ) :
@@ -102,6 +119,41 @@ class _WeakObject :
     pass
 
 
+#--------------------------------------------------------------------------------------
+def _bind( the_slot ) :
+    # Returns a ( weak reference or None, function or None ) pair, see Signal._emit()
+    if isinstance( the_slot, ( _WeakMethod, _WeakObject ) ) :
+        return the_slot.bind()
+
+    return ( None, the_slot )
+
+
+#--------------------------------------------------------------------------------------
+def _same_emission( the_emission, the_other ) :
+    # Emissions are considered the same if they are of the same signal and pass
+    # the same objects; comparing with == could be expensive or even fail
+    a_signal, an_args, a_kwargs = the_emission
+    an_other_signal, an_other_args, an_other_kwargs = the_other
+
+    if a_signal is not an_other_signal :
+        return False
+
+    if len( an_args ) != len( an_other_args ) or len( a_kwargs ) != len( an_other_kwargs ) :
+        return False
+
+    for an_arg, an_other_arg in zip( an_args, an_other_args ) :
+        if an_arg is not an_other_arg :
+            return False
+        pass
+
+    for a_key, a_value in a_kwargs.iteritems() :
+        if an_other_kwargs.get( a_key, _same_emission ) is not a_value :
+            return False
+        pass
+
+    return True
+
+
 #--------------------------------------------------------------------------------------
 class Signal( object ) :
     """
@@ -115,29 +167,72 @@ class Signal( object ) :
     slot is a member of a class, Signal will automatically detect when
     the method's class instance has been deleted and remove it from 
     its list of connected slots.
+
+    Emission doesn't take the lock: it goes over a cached tuple of bound
+    slots, which is only rebuilt after connect() or disconnect().
+
+    A signal can be part of a SignalGroup, which holds its emissions
+    during bulk operations.
     """
     #--------------------------------------------------------------------------------------
     def __init__( self, the_threadsafe = True ) :
         self._lock = _Lock( the_threadsafe )
         self._slots = []
+        self._bound_slots = None
+        self._group = None
         pass
 
     #--------------------------------------------------------------------------------------
     def __call__( self, *args, **kwargs ) :
-        with self._lock :
-            an_iter_slots = self._slots[ : ]
+        a_group = self._group
+        if a_group is not None and a_group._queue( self, args, kwargs ) :
+            return
+
+        self._emit( args, kwargs )
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def _emit( self, args, kwargs ) :
+        a_bound_slots = self._bound_slots
+        if a_bound_slots is None :
+            a_bound_slots = self._bind_slots()
             pass
 
-        a_slots = []
-        for a_slot in an_iter_slots :
-            if a_slot :
-                a_slot( *args, **kwargs )
-                a_slots.append( a_slot )
+        a_dead = False
+        for a_ref, a_function in a_bound_slots :
+            if a_ref is None :
+                a_function( *args, **kwargs )
+                continue
+
+            an_object = a_ref()
+            if an_object is None :
+                a_dead = True
+            elif a_function is None :
+                an_object( *args, **kwargs )
+            else :
+                a_function( an_object, *args, **kwargs )
                 pass
             pass
 
+        if a_dead :
+            self._remove_dead()
+            pass
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def _bind_slots( self ) :
         with self._lock :
-            self._slots = a_slots
+            a_bound_slots = tuple( [ _bind( a_slot ) for a_slot in self._slots ] )
+            self._bound_slots = a_bound_slots
+            pass
+
+        return a_bound_slots
+
+    #--------------------------------------------------------------------------------------
+    def _remove_dead( self ) :
+        with self._lock :
+            self._slots = [ a_slot for a_slot in self._slots if a_slot ]
+            self._bound_slots = None
             pass
         pass
 
@@ -148,29 +243,38 @@ class Signal( object ) :
         with self._lock :
             import inspect
             if inspect.isfunction( the_slot ) :
-                self._slots.append( the_slot )
+                a_slot = the_slot
             elif inspect.ismethod( the_slot ) :
-                self._slots.append( _WeakMethod( the_slot ) )
+                a_slot = _WeakMethod( the_slot )
             else:
-                self._slots.append( _WeakObject( the_slot ) )
+                a_slot = _WeakObject( the_slot )
                 pass
+
+            # Copy rather than modify, an emission may be looking at the list
+            self._slots = self._slots + [ a_slot ]
+            self._bound_slots = None
             pass
         pass
 
     #--------------------------------------------------------------------------------------
     def disconnect( self, the_slot ) :
         with self._lock :
+            a_slots = self._slots[ : ]
             try :
-                self._slots.remove( the_slot )
+                a_slots.remove( the_slot )
             except :
-                pass
+                return
+
+            self._slots = a_slots
+            self._bound_slots = None
             pass
         pass
 
     #--------------------------------------------------------------------------------------
     def disconnectAll( self ) :
         with self._lock :
-            del self._slots[ : ]
+            self._slots = []
+            self._bound_slots = None
             pass
         pass
 
@@ -178,6 +282,119 @@ class Signal( object ) :
     pass
 
 
+#--------------------------------------------------------------------------------------
+class SignalGroup( object ) :
+    """
+    Holds the emissions of several signals together during a bulk operation.
+    Between hold() and the matching flush(), emissions of the signals in the
+    group are put in a single queue, in the order they were made, and the last
+    flush() delivers them in that order. Emissions made while the queue is
+    being delivered go on the end of the queue, so they are still delivered
+    in order.
+
+    An emission that is identical to the one queued right before it (the same
+    signal, passing the same objects) is dropped. So only signals where
+    repeating an emission right away has no further effect, like ones
+    reporting a changed state, should be put in a group, not ones that
+    describe an incremental change, like an insertion of text.
+
+    A group can also be used as
+
+        with a_group :
+            ... bulk operation ...
+    """
+    #--------------------------------------------------------------------------------------
+    def __init__( self, *the_signals ) :
+        self._lock = _Lock( True )
+        self._hold_count = 0
+        self._flushing = False
+        self._emissions = deque()
+
+        for a_signal in the_signals :
+            if a_signal._group is not None :
+                raise ValueError( "Signal is already part of a SignalGroup" )
+
+            a_signal._group = self
+            pass
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def _queue( self, the_signal, args, kwargs ) :
+        # Returns True if the emission was queued (or dropped), rather than
+        # needing to be delivered now
+        if self._hold_count == 0 and not self._flushing :
+            return False
+
+        with self._lock :
+            if self._hold_count == 0 and not self._flushing :
+                return False
+
+            an_emission = ( the_signal, args, kwargs )
+            if len( self._emissions ) == 0 or not _same_emission( self._emissions[ -1 ], an_emission ) :
+                self._emissions.append( an_emission )
+                pass
+            pass
+
+        return True
+
+    #--------------------------------------------------------------------------------------
+    def hold( self ) :
+        """
+        Queue emissions until the matching flush()
+        """
+        with self._lock :
+            self._hold_count += 1
+            pass
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def flush( self ) :
+        """
+        Undo a hold(); after the last one, deliver the queued emissions
+        """
+        with self._lock :
+            self._hold_count -= 1
+            if self._hold_count > 0 or self._flushing :
+                return
+
+            self._flushing = True
+            pass
+
+        try :
+            while True :
+                with self._lock :
+                    if len( self._emissions ) == 0 :
+                        break
+
+                    a_signal, args, kwargs = self._emissions.popleft()
+                    pass
+
+                a_signal._emit( args, kwargs )
+                pass
+        finally :
+            with self._lock :
+                # If a slot raised an exception, the rest are dropped, as when
+                # it happens during an emission that isn't held
+                self._emissions.clear()
+                self._flushing = False
+                pass
+            pass
+        pass
+
+    #--------------------------------------------------------------------------------------
+    def __enter__( self ) :
+        self.hold()
+        return self
+
+    #--------------------------------------------------------------------------------------
+    def __exit__( self, exc_type, exc_value, exc_tb ) :
+        self.flush()
+        return False
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
 #--------------------------------------------------------------------------------------
 class Append :
     #--------------------------------------------------------------------------------------
@@ -6,25 +6,509 @@
 #
 ########################################################################
 
+from collections import deque
 import copy
 import pkgutil
+import thread
 import threading
 import traceback
 import sys
 import re
+import time
+import types
 
+from bounded_repr import bounded_repr
 from custom_result import CustomResult
+from memory_accounting import measure_scope_memory
 import notebook
 from notebook import HelpResult
+from resource_limits import get_cpu_time, get_rss, get_thread_cpu_time
 from rewrite import Rewriter, UnsupportedSyntaxError
 import reunicode
 from stdout_capture import StdoutCapture
+from tokenized_statement import invalidate_scope_indexes
+
+# Each time the user asks to see more of a truncated result, the limits
+# on its length are multiplied by this factor
+EXPAND_FACTOR = 4
+
+# If a statement prints more than STDOUT_HEAD_LINES + STDOUT_TAIL_LINES
+# lines, only the first STDOUT_HEAD_LINES and the last STDOUT_TAIL_LINES
+# are kept as results; the complete output is written to a file in the
+# notebook's cache directory
+STDOUT_HEAD_LINES = 1000
+STDOUT_TAIL_LINES = 1000
+
+# While a task statement (see below) waits for the functions it yielded,
+# it wakes up this often (in seconds) so that it can be interrupted
+TASK_POLL_INTERVAL = 0.05
+
+# The functions yielded by task statements are called in a pool of at most
+# this many threads, shared by all statements; functions yielded beyond that
+# wait for a thread to become free
+MAX_TASK_THREADS = 8
+
+def _coerce_to_unicode(s):
+    # Make sure we have a unicode object with only safe characters
+    if not isinstance(s, basestring):
+        s = str(s)
+
+    if isinstance(s, str):
+        s = reunicode.decode(s, escape=True)
+    elif isinstance(s, unicode):
+        s = reunicode.escape_unsafe(s)
+
+    return s
+
+def _format_result(obj, scale=1):
+    text, truncated = bounded_repr(obj, scale)
+    text = _coerce_to_unicode(text)
+    if truncated:
+        return TruncatedResult(text, obj, scale)
+    else:
+        return text
+
+# A statement that uses yield at the top level is run as a task. The value
+# yielded is a function taking no arguments, or a list or tuple of such
+# functions; they are called concurrently in the threads of _task_pool, and
+# the task is resumed with the return value (or list of return values) once
+# they are all done. So:
+#
+#   a, b = yield fetch_a, fetch_b
+#
+# waits for two slow operations concurrently rather than one after the other.
+# If one of the functions raises an exception, the exception is raised from
+# the yield. Output printed by the functions isn't captured.
+#
+# If the statement is interrupted, functions that haven't started yet are
+# cancelled. Ones that are running can't be stopped, so they are left to
+# finish on their own, and Statement.orphaned_calls says how many there were.
+# They don't count against MAX_TASK_THREADS while they are running, so calls
+# that never return can't use up the pool for every other task.
+
+class _TaskCall(object):
+    # A function yielded by a task, queued with _TaskPool.submit()
+
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+
+    def __init__(self, func, on_done):
+        self.func = func
+        # Called from the pool thread as on_done(call) once the function returns
+        self.on_done = on_done
+        self.state = _TaskCall.QUEUED
+        self.orphaned = False
+        self.result = None
+        self.error = None
+
+class _TaskPool(object):
+    # Threads calling the functions yielded by tasks; like ExecutionScheduler,
+    # threads are started as needed, up to a maximum, and reused. Threads
+    # running orphaned calls (see orphan()) aren't counted against the
+    # maximum; like the extra thread of ExecutionScheduler, a thread beyond
+    # the maximum exits once its call returns.
+
+    def __init__(self, max_threads):
+        self.max_threads = max_threads
+        self.__condition = threading.Condition(thread.allocate_lock())
+        self.__queue = deque()
+        self.__idle_threads = 0
+        self.__thread_count = 0
+        self.__orphaned_count = 0
+
+    def __start_call(self):
+        # Must be called with the lock held; get a thread to call the next queued function
+        if self.__idle_threads > 0:
+            self.__condition.notify()
+        elif self.__thread_count - self.__orphaned_count < self.max_threads:
+            self.__thread_count += 1
+            thread.start_new_thread(self.__run_thread, ())
+
+    def submit(self, call):
+        self.__condition.acquire()
+        try:
+            self.__queue.append(call)
+            self.__start_call()
+        finally:
+            self.__condition.release()
+
+    def cancel(self, call):
+        # Returns True if the call was removed from the queue before it started
+        self.__condition.acquire()
+        try:
+            if call.state != _TaskCall.QUEUED:
+                return False
+            self.__queue.remove(call)
+            call.state = _TaskCall.DONE
+            return True
+        finally:
+            self.__condition.release()
+
+    def orphan(self, call):
+        # Returns True if the call was running; its thread is then replaced
+        # for the rest of the queue until the call returns
+        self.__condition.acquire()
+        try:
+            if call.state != _TaskCall.RUNNING:
+                return False
+            call.orphaned = True
+            self.__orphaned_count += 1
+            if self.__queue:
+                self.__start_call()
+            return True
+        finally:
+            self.__condition.release()
+
+    def __run_thread(self):
+        while True:
+            self.__condition.acquire()
+            try:
+                while not self.__queue:
+                    self.__idle_threads += 1
+                    self.__condition.wait()
+                    self.__idle_threads -= 1
+
+                call = self.__queue.popleft()
+                call.state = _TaskCall.RUNNING
+            finally:
+                self.__condition.release()
+
+            try:
+                call.result = call.func()
+            except:
+                call.error = sys.exc_info()
+
+            self.__condition.acquire()
+            try:
+                call.state = _TaskCall.DONE
+                exiting = False
+                if call.orphaned:
+                    self.__orphaned_count -= 1
+                    if self.__thread_count - self.__orphaned_count > self.max_threads:
+                        # Another thread took this one's place
+                        self.__thread_count -= 1
+                        exiting = True
+            finally:
+                self.__condition.release()
+
+            call.on_done(call)
+
+            if exiting:
+                return
+
+_task_pool = _TaskPool(MAX_TASK_THREADS)
+
+def _call_concurrently(funcs):
+    for func in funcs:
+        if not callable(func):
+            raise TypeError("yield in a statement needs a function or a list of functions, not %r" % (func,))
+
+    condition = threading.Condition(thread.allocate_lock())
+    remaining = [len(funcs)]
+
+    def on_done(call):
+        condition.acquire()
+        try:
+            remaining[0] -= 1
+            condition.notify()
+        finally:
+            condition.release()
+
+    calls = [_TaskCall(func, on_done) for func in funcs]
+    for call in calls:
+        _task_pool.submit(call)
+
+    try:
+        condition.acquire()
+        try:
+            while remaining[0] > 0:
+                condition.wait(TASK_POLL_INTERVAL)
+        finally:
+            condition.release()
+    except KeyboardInterrupt:
+        # Cancel everything before orphaning, so that the threads replacing
+        # the orphaned ones don't start any of our calls
+        running = [call for call in calls if not _task_pool.cancel(call)]
+        orphaned = 0
+        for call in running:
+            if _task_pool.orphan(call):
+                orphaned += 1
+
+        statement = Statement.get_current()
+        if statement is not None:
+            statement.orphaned_calls += orphaned
+        raise
+
+    for call in calls:
+        if call.error is not None:
+            raise call.error[0], call.error[1], call.error[2]
+
+    return [call.result for call in calls]
+
+def _run_task(task):
+    value = None
+    error = None
+    while True:
+        try:
+            if error is not None:
+                waiting = task.throw(*error)
+            else:
+                waiting = task.send(value)
+        except StopIteration:
+            return
+
+        value = None
+        error = None
+        try:
+            if isinstance(waiting, (list, tuple)):
+                value = _call_concurrently(waiting)
+            else:
+                value = _call_concurrently([waiting])[0]
+        except KeyboardInterrupt:
+            raise
+        except:
+            error = sys.exc_info()
+
+# Marks a name that wasn't bound before a statement executed, see SharedScope
+_UNBOUND = object()
+
+class SharedScope(object):
+    """A scope that a run of statements executes in one after another
+
+    Normally each statement executes in its own copy of the scope of the
+    statement before it, so that its result scope is left as it was when it
+    finished. For a run of statements that only bind names (see
+    Statement.can_share_scope()), it's enough to record the values of the
+    names that each statement binds before it executes; then the statements
+    can all execute in a single copy, and the result scope of a statement
+    other than the last is only worked out if it is asked for, by undoing
+    the bindings of the statements after it.
+
+    """
+
+    def __init__(self):
+        #: the scope that the statements execute in, or None before the first one does
+        self.scope = None
+        self.__statements = []
+        # For each statement, a dictionary of the names it binds to their
+        # values before it executed, or _UNBOUND
+        self.__old_values = []
+
+    def _begin(self, statement, parent_scope, names):
+        # Called by a statement starting to execute in the scope; returns the
+        # scope and the old values of the names
+        if self.scope is None:
+            self.scope = copy.copy(parent_scope)
+
+        scope = self.scope
+        old_values = dict((name, scope.get(name, _UNBOUND)) for name in names)
+        self.__statements.append(statement)
+        self.__old_values.append(old_values)
+
+        return scope, old_values
+
+    def finish(self):
+        """End the run of statements. The last statement, if it succeeded, keeps
+        the scope as its result scope; the other statements that succeeded get
+        theirs when it is first asked for."""
+
+        last = len(self.__statements) - 1
+        for i, statement in enumerate(self.__statements):
+            if i == last or statement.state != Statement.EXECUTE_SUCCESS:
+                continue
+            statement._set_shared_scope(self, i)
+
+        # Don't keep the statements alive once they are replaced
+        self.__statements = None
+
+    def _get_result_scope(self, index):
+        scope = copy.copy(self.scope)
+        for old_values in reversed(self.__old_values[index + 1:]):
+            for name, value in old_values.iteritems():
+                if value is _UNBOUND:
+                    scope.pop(name, None)
+                else:
+                    scope[name] = value
+
+        return scope
+
+class _ParentScope(object):
+    # The scope a statement executing in a SharedScope started with, as far as
+    # measure_scope_memory() needs it
+
+    def __init__(self, scope, old_values):
+        self.scope = scope
+        self.old_values = old_values
+
+    def get(self, name, default=None):
+        value = self.old_values.get(name, self)
+        if value is self:
+            return self.scope.get(name, default)
+        elif value is _UNBOUND:
+            return default
+        else:
+            return value
+
+    def itervalues(self):
+        old_values = self.old_values
+        for name, value in self.scope.iteritems():
+            if name not in old_values:
+                yield value
+        for value in old_values.itervalues():
+            if value is not _UNBOUND:
+                yield value
+
+class ExecutionStats(object):
+    """Measurements of one execution of a statement"""
+
+    def __init__(self, wall_time, cpu_time, memory_delta, copy_time):
+        #: time taken, in seconds
+        self.wall_time = wall_time
+        #: CPU time used by the thread executing the statement, in seconds; where
+        #: that can't be measured, by the process as a whole
+        self.cpu_time = cpu_time
+        #: change in the resident memory of the process as a whole, in bytes, or
+        #: None if unknown; this includes anything else running at the same time
+        self.memory_delta = memory_delta
+        #: time spent copying variables that the statement modifies, in seconds
+        self.copy_time = copy_time
 
 class WarningResult(object):
     def __init__(self, message):
         self.message = message
+
+class OmittedOutputResult(unicode):
+    """Placeholder for lines of output that were omitted from the results.
+
+    If not None, the filename attribute is the path to a file holding the
+    complete output of the statement.
+
+    """
+
+    def __new__(cls, count, filename):
+        result = unicode.__new__(cls, u"... %d lines omitted ..." % count)
+        result.count = count
+        result.filename = filename
+
+        return result
+
+class _StdoutCollector(object):
+    # Collects what a statement prints as lines in its results. Once the
+    # statement has printed STDOUT_HEAD_LINES lines, the following lines are
+    # kept in a ring buffer and only added to the results when flush() is
+    # called, and the complete output is written to a spill file.
+
+    def __init__(self, results, notebook):
+        self.results = results
+        self.notebook = notebook
+
+        self.pieces = [] # Pieces of the current incomplete line
+        self.head = []
+        self.tail = None
+        self.omitted = 0
+
+        self.spill = None
+        self.spill_filename = None
+
+    def write(self, s):
+        if not "\n" in s:
+            if s != '':
+                self.pieces.append(s)
+            return
+
+        lines = s.split("\n")
+        if self.pieces:
+            self.pieces.append(lines[0])
+            lines[0] = u"".join(self.pieces)
+            self.pieces = []
+
+        if lines[-1] != '':
+            self.pieces.append(lines[-1])
+
+        for line in lines[:-1]:
+            self.__add_line(line)
+
+    def __add_line(self, line):
+        if len(self.head) < STDOUT_HEAD_LINES:
+            self.head.append(line)
+            self.results.append(line)
+            return
+
+        if self.tail is None:
+            self.tail = deque()
+            self.__open_spill()
+
+        if len(self.tail) == STDOUT_TAIL_LINES:
+            self.tail.popleft()
+            self.omitted += 1
+        self.tail.append(line)
+
+        if self.spill is not None:
+            self.spill.write(line.encode("UTF-8"))
+            self.spill.write("\n")
+
+    def __open_spill(self):
+        try:
+            self.spill, self.spill_filename = self.notebook.create_cache_file(prefix="output-", suffix=".txt")
+        except (IOError, OSError):
+            return
+
+        for line in self.head:
+            self.spill.write(line.encode("UTF-8"))
+            self.spill.write("\n")
+
+    def flush(self):
+        """Add the lines in the ring buffer to the results"""
+
+        if not self.tail:
+            return
+
+        if self.omitted > 0:
+            self.results.append(OmittedOutputResult(self.omitted, self.spill_filename))
+            self.omitted = 0
+
+        self.results.extend(self.tail)
+        self.tail.clear()
+
+    def finish(self):
+        """Add any remaining output to the results"""
+
+        if self.pieces:
+            line = u"".join(self.pieces)
+            self.pieces = []
+            self.__add_line(line)
+
+        self.flush()
+        self.close()
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+class TruncatedResult(unicode):
+    """The representation of an output object that was too long to show completely.
+
+    This is a string, so can be used like any other text result, but
+    also keeps a reference to the object so that more of it can be shown.
+
+    """
+
+    def __new__(cls, text, obj, scale):
+        result = unicode.__new__(cls, text)
+        result.obj = obj
+        result.scale = scale
+
+        return result
+
+    def expand(self):
+        """Return a longer representation of the object, either another TruncatedResult or,
+        if the entire representation fits, a plain unicode string"""
+
+        return _format_result(self.obj, self.scale * EXPAND_FACTOR)
     
-class Statement:
+class Statement(object):
     """
 
     Class that wraps a section of Python code for compilation and execution. (The section
@@ -39,6 +523,7 @@ class Statement:
     EXECUTE_SUCCESS = 4
     EXECUTE_ERROR = 5
     INTERRUPTED = 6
+    LIMIT_EXCEEDED = 7
 
     __local = threading.local()
 
@@ -58,10 +543,23 @@ class Statement:
         #: names imported from __future__. Used when compiling subsequent statements
         self.future_features = None
 
-        #: scope at the end of successful execution
+        self.__shared_scope = None
+        self.__shared_scope_index = None
         self.result_scope = None
         #: list of results from the statement. Set after successful execution
         self.results = None
+        #: ExecutionStats for the last execution of the statement, or None
+        self.stats = None
+        #: ScopeMemory describing the memory that result_scope keeps alive. Set after
+        #: successful execution
+        self.memory = None
+        #: number of functions yielded by the statement that were still running when
+        #: it was interrupted; they are left to finish in the background
+        self.orphaned_calls = 0
+
+        #: a ResourceLimits object for the execution of the statement; if None, the limits
+        #: of the executor apply
+        self.limits = None
 
         #: error_message: error message in case of compilation or execution error
         self.error_message = None
@@ -71,16 +569,39 @@ class Statement:
         self.error_offset = None
 
         self.__compiled = None
+        self.__is_task = False
+        self.__bound_names = None
         self.__parent_future_features = None
 
         self.set_parent(parent)
 
-        self.__stdout_buffer = None
+        self.__stdout = None
         self.__capture = None
+        # File with the complete output of the last execution, see _StdoutCollector
+        self.__spill_filename = None
 
         self.__name = '<statement%i>' % self.__class__.__counter
         Statement.__counter += 1
 
+    def __get_result_scope(self):
+        if self.__shared_scope is not None:
+            self.__result_scope = self.__shared_scope._get_result_scope(self.__shared_scope_index)
+            self.__shared_scope = None
+        return self.__result_scope
+
+    def __set_result_scope(self, scope):
+        self.__result_scope = scope
+        self.__shared_scope = None
+
+    #: scope at the end of successful execution
+    result_scope = property(__get_result_scope, __set_result_scope)
+
+    def _set_shared_scope(self, shared_scope, index):
+        # Called by SharedScope.finish()
+        self.__result_scope = None
+        self.__shared_scope = shared_scope
+        self.__shared_scope_index = index
+
     def set_parent(self, parent):
         """Set the parent statement for this statement.
 
@@ -117,8 +638,14 @@ class Statement:
             rewriter = Rewriter(self.__text, future_features=self.__parent_future_features)
             self.__compiled, self.__mutated = rewriter.rewrite_and_compile(output_func_name='reinteract_output',
                                                                            copy_func_name="__reinteract_copy",
-                                                                           statement_name=self.__name)
+                                                                           statement_name=self.__name,
+                                                                           task_func_name='__reinteract_task')
             self.imports = rewriter.get_imports()
+            self.__is_task = rewriter.is_task()
+            self.__bound_names = rewriter.get_bound_names()
+            if self.__bound_names is not None:
+                # Expression statements bind '_'
+                self.__bound_names.add('_')
         except SyntaxError, e:
             self.error_message = e.msg
             self.error_line = e.lineno
@@ -152,18 +679,6 @@ class Statement:
         self.state = Statement.COMPILE_SUCCESS
         return True
 
-    def __coerce_to_unicode(self, s):
-        # Make sure we have a unicode object with only safe characters
-        if not isinstance(s, basestring):
-            s = str(s)
-
-        if isinstance(s, str):
-            s = reunicode.decode(s, escape=True)
-        elif isinstance(s, unicode):
-            s = reunicode.escape_unsafe(s)
-
-        return s
-
     def do_output(self, *args):
         """Called by execution of statements with non-None output (see L{Rewriter})"""
 
@@ -179,36 +694,39 @@ class Statement:
                     arg = wrapped
                     break
 
+            # Keep the order of output and results
+            self.__stdout.flush()
+
             if isinstance(arg, CustomResult) or isinstance(arg, HelpResult):
                 self.results.append(arg)
             else:
-                self.results.append(self.__coerce_to_unicode(repr(arg)))
+                self.results.append(_format_result(arg))
 
             self.result_scope['_'] = args[0]
         else:
-            self.results.append(self.__coerce_to_unicode(repr(args)))
+            self.__stdout.flush()
+            self.results.append(_format_result(args))
             self.result_scope['_'] = args
 
     def __stdout_write(self, s):
-        s = self.__coerce_to_unicode(s)
+        self.__stdout.write(_coerce_to_unicode(s))
 
-        if self.__stdout_buffer is None:
-            self.__stdout_buffer = s
-        else:
-            self.__stdout_buffer += s
+    def can_share_scope(self):
+        """Check whether the statement can execute in a SharedScope: it must only
+        bind names, not modify objects in place, and not define functions or
+        classes, which would see the names bound by later statements in the
+        scope. Must be called after compile()."""
 
-        pos = 0
-        while True:
-            next = self.__stdout_buffer.find("\n", pos)
-            if next < 0:
-                break
-            self.results.append(self.__stdout_buffer[pos:next])
-            pos = next + 1
-            
-        if pos > 0:
-            self.__stdout_buffer = self.__stdout_buffer[pos:]
-
-    def before_execute(self):
+        if self.__bound_names is None or self.__mutated or self.__is_task:
+            return False
+
+        for const in self.__compiled.co_consts:
+            if isinstance(const, types.CodeType):
+                return False
+
+        return True
+
+    def before_execute(self, capture=True):
         """Set up for execution
 
         Although before_execute() and after_execute() are automatically called when
@@ -219,14 +737,22 @@ class Statement:
         provisions the operation of execute() can be interrupted at any point and
         the statement will be left in a sane state.
 
+        @param capture: if False, the output of the statement isn't captured here;
+          the caller must have pushed a capture from create_batch_capture()
+
         """
         assert self.state != Statement.NEW and self.state != Statement.COMPILE_ERROR
         self.state = Statement.EXECUTING
+        self.stats = None
+        self.memory = None
+        self.orphaned_calls = 0
+        self.release_output()
 
         self.__worksheet.global_scope['__reinteract_statement'] = self
         Statement.__local.current = self
-        self.__capture = StdoutCapture(self.__stdout_write)
-        self.__capture.push()
+        if capture:
+            self.__capture = StdoutCapture(self.__stdout_write)
+            self.__capture.push()
 
     def after_execute(self):
         """Do cleanup tasks after execution
@@ -240,11 +766,20 @@ class Statement:
             self.results = None
             self.result_scope = None
 
+        invalidate_scope_indexes()
+
         self.__worksheet.global_scope['__reinteract_statement'] = None
         Statement.__local.current = None
-        self.__stdout_buffer = None
-        self.__capture.pop()
-        self.__capture = None
+        if self.__stdout is not None:
+            self.__stdout.close()
+            self.__spill_filename = self.__stdout.spill_filename
+            self.__stdout = None
+        if self.results is None:
+            # The output went along with the results
+            self.release_output()
+        if self.__capture is not None:
+            self.__capture.pop()
+            self.__capture = None
 
     def __get_module_filename(self, m):
         filename = m.__file__
@@ -269,16 +804,27 @@ class Statement:
 
         return (formatted + last_line).rstrip()
 
-    def __do_execute(self):
+    def __do_execute(self, shared_scope):
         root_scope = self.__worksheet.global_scope
         if self.__parent:
-            scope = copy.copy(self.__parent.result_scope)
+            parent_scope = self.__parent.result_scope
         else:
-            scope = copy.copy(root_scope)
+            parent_scope = root_scope
+        if shared_scope is not None:
+            scope, old_values = shared_scope._begin(self, parent_scope, self.__bound_names)
+            parent_scope = _ParentScope(scope, old_values)
+        else:
+            scope = copy.copy(parent_scope)
 
         self.results = []
         self.result_scope = scope
-        self.__stdout_buffer = None
+        self.__stdout = _StdoutCollector(self.results, self.__worksheet.notebook)
+
+        start_time = time.time()
+        thread_ident = thread.get_ident()
+        start_thread_cpu_time = get_thread_cpu_time(thread_ident)
+        start_cpu_time = get_cpu_time()
+        start_rss = get_rss()
 
         for root, description, copy_code in self.__mutated:
             try:
@@ -289,10 +835,27 @@ class Statement:
             except:
                 self.results.append(WarningResult("'%s' apparently modified, but can't copy it" % description))
 
+        copy_time = time.time() - start_time
+
         try:
-            exec self.__compiled in scope, scope
-            if self.__stdout_buffer is not None and self.__stdout_buffer != '':
-                self.results.append(self.__stdout_buffer)
+            try:
+                exec self.__compiled in scope, scope
+                if self.__is_task:
+                    _run_task(scope.pop('__reinteract_task')())
+            finally:
+                rss = get_rss()
+                if start_rss is not None and rss is not None:
+                    memory_delta = rss - start_rss
+                else:
+                    memory_delta = None
+                thread_cpu_time = get_thread_cpu_time(thread_ident)
+                if start_thread_cpu_time is not None and thread_cpu_time is not None:
+                    cpu_time = thread_cpu_time - start_thread_cpu_time
+                else:
+                    cpu_time = get_cpu_time() - start_cpu_time
+                self.stats = ExecutionStats(time.time() - start_time, cpu_time,
+                                            memory_delta, copy_time)
+            self.__stdout.finish()
             self.state = Statement.EXECUTE_SUCCESS
         except KeyboardInterrupt, e:
             raise e
@@ -332,24 +895,60 @@ class Statement:
 
             self.state = Statement.EXECUTE_ERROR
 
+        if self.state == Statement.EXECUTE_SUCCESS:
+            # The estimate is just for information, so a problem measuring it
+            # mustn't make the statement fail
+            try:
+                self.memory = measure_scope_memory(scope, parent_scope, self.__bound_names)
+            except Exception:
+                self.memory = None
+
         return self.state == Statement.EXECUTE_SUCCESS
 
-    def execute(self):
-        """Execute the statement"""
+    def execute(self, shared_scope=None):
+        """Execute the statement
+
+        @param shared_scope: a SharedScope to execute the statement in, or None to
+          execute it in a copy of the result scope of its parent. Only statements
+          for which can_share_scope() is True can use a SharedScope.
+
+        """
         was_in_execute = self.state == Statement.EXECUTING
         if not was_in_execute:
             self.before_execute()
         try:
-            return self.__do_execute()
+            return self.__do_execute(shared_scope)
         finally:
             if not was_in_execute:
                 self.after_execute()
 
+    def release_output(self):
+        """Delete the file holding the complete output of the last execution, if
+        there is one. This is done automatically when the statement executes again
+        or fails; call it when the results of the statement are no longer shown."""
+
+        if self.__spill_filename is not None:
+            self.__worksheet.notebook.remove_cache_file(self.__spill_filename)
+            self.__spill_filename = None
+
     def mark_for_execute(self):
         """Mark a statement that executed succesfully as needing execution again"""
         if self.state != Statement.NEW and self.state != Statement.COMPILE_ERROR:
             self.state = Statement.COMPILE_SUCCESS
 
+    @classmethod
+    def create_batch_capture(cls):
+        """Create a StdoutCapture that sends output to the statement executing in the
+        current thread. This allows a series of statements executed one after another
+        to share a single capture rather than each pushing its own; see before_execute()."""
+
+        def write(s):
+            current = cls.get_current()
+            if current is not None and current.__stdout is not None:
+                current.__stdout_write(s)
+
+        return StdoutCapture(write)
+
     @classmethod
     def get_current(self):
         """Gets the currently executing statement, if any. If no statement is
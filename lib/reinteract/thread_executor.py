@@ -11,10 +11,33 @@ import ctypes
 import signal
 import sys
 import thread
+import time
 
-from statement import Statement
+from statement import SharedScope, Statement
 from event_loop import eventLoop
 
+# How often (in seconds) the watchdog checks the resources used by the
+# executing statement when there are limits set
+WATCHDOG_INTERVAL = 0.1
+
+# In batched mode (see ThreadExecutor.run()), the main thread is told about
+# the statements that have completed once per this many statements
+BATCH_SIZE = 100
+
+# Number of executors executing statements at the moment; some resource
+# limits can't be checked when there is more than one, see ResourceUsage.check()
+_running_lock = thread.allocate_lock()
+_running_count = 0
+
+def _add_running(delta):
+    global _running_count
+
+    _running_lock.acquire()
+    try:
+        _running_count += delta
+    finally:
+        _running_lock.release()
+
 #
 # The primary means we use to interrupt a running thread is a Python facility
 # to set an exception asynchronously on another thread. To keep it out of
@@ -74,10 +97,13 @@ class ThreadExecutor(object):
      -  B{sig_complete}(executor): emitted when the executor is done with all processing
 
     """
-    def __init__(self, parent_statement=None, event_loop=eventLoop()):
+    def __init__(self, parent_statement=None, event_loop=None, limits=None, batched=False):
         """Initialize the ThreadExecutor object
 
         @param parent_statement: prievous statement defining the execution environment for the first statement
+        @param event_loop: event loop that signals are emitted from; defaults to eventLoop()
+        @param limits: a ResourceLimits object for statements that don't have their own limits, or None
+        @param batched: if True, execute the statements in batched mode; see run()
 
         """
         import signals
@@ -89,11 +115,22 @@ class ThreadExecutor(object):
         self.statements = []
         self.lock = thread.allocate_lock()
 
+        if event_loop is None:
+            event_loop = eventLoop()
+
         self.event_loop = event_loop
+        self.limits = limits
+        self.batched = batched
         self.last_complete = -1
         self.last_signalled = -1
         self.complete = False
         self.interrupted = False
+        self.tid = None
+
+        # The ResourceUsage of the executing statement, if it has limits, and
+        # the message if the watchdog interrupted it for exceeding them
+        self.__usage = None
+        self.__limit_message = None
 
     def destroy(self):
         self.sig_statement_executing.disconnectAll()
@@ -124,7 +161,7 @@ class ThreadExecutor(object):
         self.event_loop.cache_event(self.__run_idle)
         
     def __run_thread(self):
-        # The patten used twice here of:
+        # The patten used here and in the functions we call of:
         #
         #  try:
         #      # do something with lock not held
@@ -139,27 +176,11 @@ class ThreadExecutor(object):
         # held. Given those assumptions, we can be sure that the finishing steps
         # will be run and they won't be interrupted.
         #
-        statement = None
         try:
-            for i, statement in enumerate(self.statements):
-                self.lock.acquire()
-                statement.before_execute()
-                self.__queue_idle()
-                try:
-                    self.lock.release()
-                    statement.execute()
-                    self.lock.acquire()
-                except:
-                    self.lock.acquire()
-                finally:
-                    statement.after_execute()
-                    result_state = statement.state
-                    self.last_complete = i;
-                    self.__queue_idle()
-                    self.lock.release()
-
-                    if result_state != Statement.EXECUTE_SUCCESS:
-                        break
+            if self.__use_batches:
+                self.__execute_batched()
+            else:
+                self.__execute_statements()
 
             self.lock.acquire()
         except KeyboardInterrupt, e:
@@ -173,6 +194,116 @@ class ThreadExecutor(object):
             self.__queue_idle()
             self.lock.release()
 
+    def __execute_statements(self):
+        for i, statement in enumerate(self.statements):
+            self.lock.acquire()
+            statement.before_execute()
+            limits = self.__get_limits(statement)
+            if limits is not None:
+                self.__usage = limits.start()
+            self.__queue_idle()
+            try:
+                self.lock.release()
+                statement.execute()
+                self.lock.acquire()
+            except:
+                self.lock.acquire()
+            finally:
+                statement.after_execute()
+                self.__usage = None
+                if self.__limit_message is not None:
+                    # Even if the statement caught the interruption and finished
+                    # on its own, it exceeded its limits
+                    statement.state = Statement.LIMIT_EXCEEDED
+                    statement.error_message = self.__limit_message
+                    statement.results = None
+                    statement.result_scope = None
+                    statement.memory = None
+                    statement.release_output()
+                result_state = statement.state
+                self.last_complete = i;
+                self.__queue_idle()
+                self.lock.release()
+
+                if result_state != Statement.EXECUTE_SUCCESS:
+                    break
+
+    def __execute_batched(self):
+        # Like __execute_statements(), but the statements share one capture of
+        # their output, the main thread is told about them once per batch of
+        # BATCH_SIZE statements, and runs of statements that can share a scope
+        # execute in one SharedScope rather than each copying the scope of the
+        # statement before it. A SharedScope is finished before the statements
+        # executed in it are reported as complete, so that their result scopes
+        # are ready.
+        capture = Statement.create_batch_capture()
+        capture.push()
+        try:
+            shared_scope = None
+            self.lock.acquire()
+            try:
+                self.__queue_idle()
+                for i, statement in enumerate(self.statements):
+                    if not statement.can_share_scope():
+                        if shared_scope is not None:
+                            shared_scope.finish()
+                            shared_scope = None
+                    elif shared_scope is None:
+                        shared_scope = SharedScope()
+
+                    statement.before_execute(capture=False)
+                    try:
+                        self.lock.release()
+                        statement.execute(shared_scope)
+                        self.lock.acquire()
+                    except:
+                        self.lock.acquire()
+                    finally:
+                        statement.after_execute()
+
+                    if statement.state != Statement.EXECUTE_SUCCESS:
+                        break
+
+                    if (i + 1) % BATCH_SIZE == 0:
+                        if shared_scope is not None:
+                            shared_scope.finish()
+                            shared_scope = None
+                        self.last_complete = i
+                        self.__queue_idle()
+            finally:
+                if shared_scope is not None:
+                    shared_scope.finish()
+                self.lock.release()
+        finally:
+            capture.pop()
+
+    def __get_limits(self, statement):
+        limits = statement.limits
+        if limits is None:
+            limits = self.limits
+        if limits is None or limits.is_unlimited():
+            return None
+
+        return limits
+
+    def __run_watchdog(self):
+        while True:
+            time.sleep(WATCHDOG_INTERVAL)
+
+            self.lock.acquire()
+            try:
+                if self.complete or self.interrupted:
+                    return
+
+                if self.__usage is not None:
+                    message = self.__usage.check(others_running=_running_count > 1)
+                    if message is not None:
+                        self.__limit_message = message
+                        self.__interrupt()
+                        return
+            finally:
+                self.lock.release()
+
     def add_statement(self, statement):
         """Add a statement to the list of statements that the executor will execute."""
 
@@ -205,8 +336,77 @@ class ThreadExecutor(object):
         return success
 
     def execute(self):
-        """Execute the statements of the executor asynchronously in a thread."""
-        self.tid = thread.start_new_thread(self.__run_thread, ())
+        """Execute the statements of the executor asynchronously in a thread.
+
+        If any of the statements have resource limits, a watchdog thread checks
+        the resources used by the executing statement, and interrupts it if it
+        exceeds them. The statement is then left with a state of
+        Statement.LIMIT_EXCEEDED and an error message saying which limit it
+        exceeded, even if it caught the interruption and finished on its own.
+
+        """
+
+        thread.start_new_thread(self.run, ())
+
+    def run(self):
+        """Execute the statements of the executor synchronously in the calling thread.
+
+        This is an alternative to execute() for running executors in threads that
+        are reused, like those of an ExecutionScheduler; the signals are emitted
+        from the event loop as usual, so the calling thread must not be the one
+        running the event loop.
+
+        If interrupt() was called before run(), no statements are executed;
+        the first statement is left as Statement.INTERRUPTED as if it had been
+        interrupted as soon as it started. Since no user code is run then, it's
+        fine to call run() from any thread to finish off an executor that was
+        interrupted before it was started.
+
+        In batched mode, the per-statement overhead is cut down, which matters
+        when there are many statements that each execute quickly: there is one
+        capture of the output for all of them, ::sig_statement_executing and
+        ::sig_statement_complete are emitted once per BATCH_SIZE statements, and
+        runs of statements that only bind names execute in a single copy of the
+        scope (see SharedScope). Resource limits are checked per statement, so
+        if any statement has limits, the statements are executed one by one
+        even in batched mode.
+
+        """
+
+        have_limits = any(self.__get_limits(statement) is not None for statement in self.statements)
+        self.__use_batches = self.batched and not have_limits
+
+        # The lock keeps the watchdog and interrupt() from looking at self.tid before it is set
+        self.lock.acquire()
+        try:
+            self.tid = thread.get_ident()
+            interrupted = self.interrupted
+            if have_limits and not interrupted:
+                thread.start_new_thread(self.__run_watchdog, ())
+        finally:
+            self.lock.release()
+
+        if interrupted:
+            self.lock.acquire()
+            try:
+                statement = self.statements[0]
+                statement.before_execute()
+                statement.after_execute()
+                self.complete = True
+                self.last_complete = len(self.statements) - 1
+                self.__queue_idle()
+            finally:
+                self.lock.release()
+        else:
+            _add_running(1)
+            try:
+                self.__run_thread()
+            finally:
+                _add_running(-1)
+
+            # An interruption that came in just as we finished might still be
+            # pending; it must not hit whatever the thread does next
+            _PyThreadState_SetAsyncExc(ctypes.c_ulong(self.tid), None)
 
     def interrupt(self):
         """Interrupts the execution of the executor if possible.
@@ -229,11 +429,19 @@ class ThreadExecutor(object):
         # protect against sending the KeyboardInterrupt exception more than once
         self.lock.acquire()
         if not self.complete and not self.interrupted:
-            self.interrupted = True
-            _PyThreadState_SetAsyncExc(ctypes.c_ulong(self.tid), ctypes.py_object(KeyboardInterrupt))
-            if _pthread_kill is not None:
-                # We assume that sizeof(pthread_t) == sizeof(long); this is true for GNU libc anyways
-                _pthread_kill(ctypes.c_long(self.tid), ctypes.c_int(signal.SIGUSR1))
+            if self.tid is None:
+                # Not started yet; run() will notice
+                self.interrupted = True
+            else:
+                self.__interrupt()
         self.lock.release()
 
+    def __interrupt(self):
+        # Must be called with the lock held
+        self.interrupted = True
+        _PyThreadState_SetAsyncExc(ctypes.c_ulong(self.tid), ctypes.py_object(KeyboardInterrupt))
+        if _pthread_kill is not None:
+            # We assume that sizeof(pthread_t) == sizeof(long); this is true for GNU libc anyways
+            _pthread_kill(ctypes.c_long(self.tid), ctypes.c_int(signal.SIGUSR1))
+
 ######################################################################
@@ -6,7 +6,10 @@
 #
 ########################################################################
 
+import bisect
 import inspect
+import thread
+import weakref
 from retokenize import *
 
 # These are keywords where completion doesn't make sense afterwords, for
@@ -43,6 +46,178 @@ KEYWORD_PREFIXES = get_prefixes([
         'pass', 'print', 'raise', 'return', 'try', 'with', 'while', 'yield'
 ])
 
+def _completion_sort_key(name):
+    # Sort completions with _ and __ names at the end
+    if name.startswith("__"):
+        return 2, name
+    elif name.startswith("_"):
+        return 1, name
+    else:
+        return 0, name
+
+def _get_scope_builtins(scope):
+    builtins = scope.get('__builtins__')
+    if builtins is None:
+        return {}
+    elif isinstance(builtins, dict):
+        return builtins
+    else:
+        return builtins.__dict__
+
+class _ScopeIndex(object):
+    # Sorted index of the names in a scope and its builtins, for quickly finding
+    # all the names with a given prefix. Scopes can have thousands of names
+    # (after 'from numpy import *'), so we don't want to list and sort them
+    # on every key stroke.
+    #
+    # We keep the names in three sorted lists, which, concatenated, give the order
+    # of _completion_sort_key(). Each list can then be bisected for a prefix.
+
+    def __init__(self, scope, builtins):
+        self.groups = ([], [], [])
+        for name in scope:
+            self.groups[_completion_sort_key(name)[0]].append(name)
+        for name in builtins:
+            if not name in scope:
+                self.groups[_completion_sort_key(name)[0]].append(name)
+        for group in self.groups:
+            group.sort()
+
+        # (prefix, result) of the last find(); kept as a single tuple so that
+        # lookups from different threads never see a mismatched pair
+        self.last = (None, None)
+
+    def find(self, prefix):
+        # As the user keeps typing, narrow down the previous result rather than
+        # searching again
+        last_prefix, last_result = self.last
+        if last_prefix and prefix.startswith(last_prefix):
+            result = [name for name in last_result if name.startswith(prefix)]
+        else:
+            result = []
+            for group in self.groups:
+                i = bisect.bisect_left(group, prefix)
+                while i < len(group) and group[i].startswith(prefix):
+                    result.append(group[i])
+                    i += 1
+
+        self.last = (prefix, result)
+
+        return result
+
+# Number of scopes that we keep indexes for
+_MAX_CACHED_SCOPE_INDEXES = 4
+
+# List of (id(scope), version, index), most recently used first. Scopes keep
+# the values of a worksheet alive, so we don't hold references to them, and
+# dictionaries can't be weakly referenced, so we go by the id() instead.
+_scope_indexes = []
+
+# Scopes are only modified when statements execute, and that also creates
+# the new scopes that might reuse the id() of a freed one, so we bump this
+# for each statement executed
+_scope_generation = 0
+
+# The last completion against the attributes of an object:
+# (object_ref, id(object), generation, prefix, [(name, object_completed_to)])
+# If the user keeps typing, we narrow down this list rather than calling dir()
+# and getattr() again. object_ref is a weak reference to the object, or None
+# if it can't be weakly referenced.
+_last_attribute_completion = None
+
+# Completions are looked up both in the main thread and in the LookupThread,
+# so this protects _scope_indexes and _last_attribute_completion
+_cache_lock = thread.allocate_lock()
+
+def invalidate_scope_indexes():
+    """Forget the indexes of scopes and the attribute completions built so far,
+    since executing a statement may have changed any of them"""
+
+    global _scope_generation, _last_attribute_completion
+
+    _cache_lock.acquire()
+    try:
+        _scope_generation += 1
+        _last_attribute_completion = None
+    finally:
+        _cache_lock.release()
+
+def _get_scope_index(scope):
+    builtins = _get_scope_builtins(scope)
+
+    # Scopes modified other than by a statement (like the global scope of a
+    # worksheet) mostly get names added, so we also go by the number of names
+    version = (_scope_generation, len(scope), len(builtins))
+    scope_id = id(scope)
+
+    _cache_lock.acquire()
+    try:
+        for i, (cached_id, cached_version, index) in enumerate(_scope_indexes):
+            if cached_id == scope_id:
+                del _scope_indexes[i]
+                if cached_version == version:
+                    _scope_indexes.insert(0, (scope_id, version, index))
+                    return index
+                break
+    finally:
+        _cache_lock.release()
+
+    index = _ScopeIndex(scope, builtins)
+
+    _cache_lock.acquire()
+    try:
+        _scope_indexes.insert(0, (scope_id, version, index))
+        del _scope_indexes[_MAX_CACHED_SCOPE_INDEXES:]
+    finally:
+        _cache_lock.release()
+
+    return index
+
+def _get_last_attribute_completion(object, prefix):
+    # Return the completions of the last attribute completion if it was for
+    # object and a prefix of prefix, otherwise None
+    _cache_lock.acquire()
+    try:
+        last = _last_attribute_completion
+    finally:
+        _cache_lock.release()
+
+    if last is None:
+        return None
+
+    last_ref, last_id, last_generation, last_prefix, last_completions = last
+    if last_id != id(object) or last_generation != _scope_generation:
+        return None
+    # Without a weak reference, the id() might be that of an object that
+    # has been freed since, but only if it was created while completing,
+    # like the value of a property; those are close enough
+    if last_ref is not None and last_ref() is not object:
+        return None
+    if not prefix.startswith(last_prefix):
+        return None
+
+    return last_completions
+
+def _set_last_attribute_completion(object, prefix, completions):
+    global _last_attribute_completion
+
+    try:
+        object_ref = weakref.ref(object)
+    except TypeError:
+        object_ref = None
+
+    _cache_lock.acquire()
+    try:
+        _last_attribute_completion = (object_ref, id(object), _scope_generation, prefix, completions)
+    finally:
+        _cache_lock.release()
+
+def _lookup_in_scope(scope, name):
+    try:
+        return scope[name]
+    except KeyError:
+        return _get_scope_builtins(scope).get(name)
+
 class _TokenIter(object):
     def __init__(self, statement, line, i):
         self.statement = statement
@@ -95,6 +270,17 @@ class TokenizedStatement(object):
         self.tokens = []
         self.stacks = []
 
+    def copy(self):
+        """Return a copy of the statement that isn't affected by later calls to set_lines()"""
+
+        result = TokenizedStatement()
+        # set_lines() replaces these lists rather than modifying them, so sharing is safe
+        result.lines = self.lines
+        result.tokens = self.tokens
+        result.stacks = self.stacks
+
+        return result
+
     def set_lines(self, lines):
         """Set the lines in the Tokenized statement
 
@@ -356,52 +542,45 @@ class TokenizedStatement(object):
 
         return obj
                 
-    def __sort_completions(self, completions):
-        # Sort a set of completions with _ and __ names at the end.
-        # (modifies completions and then returns it for convenience)
-        
-        def compare_completions(a, b):
-            n_a = a[0]
-            n_b = b[0]
-
-            if n_a.startswith("__") and not n_b.startswith("__"):
-                return 1
-            elif n_b.startswith("__") and not n_a.startswith("__"):
-                return -1
-            elif n_a.startswith("_") and not n_b.startswith("_"):
-                return 1
-            elif n_b.startswith("_") and not n_a.startswith("_"):
-                return -1
-            else:
-                return cmp(n_a, n_b)
+    def __find_attribute_completions(self, object, to_complete):
+        last_completions = _get_last_attribute_completion(object, to_complete)
+        if last_completions is not None:
+            completions = [(completion, object_completed_to) for completion, object_completed_to in last_completions
+                           if completion.startswith(to_complete)]
+            _set_last_attribute_completion(object, to_complete, completions)
+            return completions
+
+        completions = []
+        for completion in dir(object):
+            if completion.startswith(to_complete):
+
+                if inspect.ismodule(object):
+                    object_completed_to = getattr(object, completion, None)
+                # We special case these because obj.__class__.__module__/__doc__
+                # are also a strings, not a method/property
+                elif completion != '__module__' and completion != '__doc__':
+                    # Using the attribute of the class over the attribute of
+                    # the object gives us better docs on properties
+                    try:
+                        klass = getattr(object, '__class__')
+                        object_completed_to = getattr(klass, completion)
+                    except AttributeError:
+                        object_completed_to = getattr(object, completion)
+                else:
+                    object_completed_to = None
 
-        completions.sort(compare_completions)
-        
-        return completions
+                completions.append((completion, object_completed_to))
 
-    def __list_scope(self, scope):
-        # List possible completions given a scope directionary
-        
-        possible = scope.items()
-        if '__builtins__' in scope:
-            builtins = scope['__builtins__']
-            if not isinstance(builtins, dict):
-                builtins = dir(builtins)
-                
-            for k in builtins:
-                if not k in scope:
-                    possible.append((k, builtins[k]))
+        completions.sort(key=lambda c: _completion_sort_key(c[0]))
+        _set_last_attribute_completion(object, to_complete, completions)
+
+        return completions
 
-        return possible
-    
     def __find_no_symbol_completions(self, scope):
         # Return the completions to offer when we don't have a start at a symbol
-        
-        result = []
-        for completion, obj in self.__list_scope(scope):
-            result.append((completion, completion, obj))
 
-        return self.__sort_completions(result)
+        return [(completion, completion, _lookup_in_scope(scope, completion))
+                for completion in _get_scope_index(scope).find('')]
     
     def find_completions(self, line, index, scope, min_length=0):
         """Returns a list of possible completions at the given line and index.
@@ -497,35 +676,13 @@ class TokenizedStatement(object):
 
         # Then we complete the last element of the name path against what we resolved
         # to, or against the scope (if there was just one name)
-        result = []
-        
         to_complete = names[-1]
         if object is None:
-            for completion, obj in self.__list_scope(scope):
-                if completion.startswith(to_complete):
-                    result.append((completion, completion[len(to_complete):], obj))
+            return [(completion, completion[len(to_complete):], _lookup_in_scope(scope, completion))
+                    for completion in _get_scope_index(scope).find(to_complete)]
         else:
-            for completion in dir(object):
-                if completion.startswith(to_complete):
-
-                    if inspect.ismodule(object):
-                        object_completed_to = getattr(object, completion, None)
-                    # We special case these because obj.__class__.__module__/__doc__
-                    # are also a strings, not a method/property
-                    elif completion != '__module__' and completion != '__doc__':
-                        # Using the attribute of the class over the attribute of
-                        # the object gives us better docs on properties
-                        try:
-                            klass = getattr(object, '__class__')
-                            object_completed_to = getattr(klass, completion)
-                        except AttributeError:
-                            object_completed_to = getattr(object, completion)
-                    else:
-                        object_completed_to = None
-                        
-                    result.append((completion, completion[len(to_complete):], object_completed_to))
-
-        return self.__sort_completions(result)
+            return [(completion, completion[len(to_complete):], object_completed_to)
+                    for completion, object_completed_to in self.__find_attribute_completions(object, to_complete)]
             
     def get_object_at_location(self, line, index, scope, result_scope=None, include_adjacent=False):
         """Find the object at a particular location within the statement.
@@ -844,8 +1001,43 @@ if __name__ == '__main__':
     test_completion("for a in", []) # Don't complete to 'indecent', syntax doesn't allow it
     test_completion("in", [], min_length=2) # Don't complete to 'indecent', because we have a keyword prefix
 
+    # Adding names to the scope updates the cached index of the scope
+    scope['abcde'] = 5
+    test_completion("ab", ['abcd', 'abcde'])
+    test_completion("abcd", ['abcd', 'abcde'])
+    test_completion("abcde", ['abcde'])
+    del scope['abcde']
+    test_completion("ab", ['abcd'])
+
+    # As does a change that keeps the number of names, once a statement executes
+    scope['abxyz'] = scope.pop('abcd')
+    invalidate_scope_indexes()
+    test_completion("ab", ['abxyz'])
+    scope['abcd'] = scope.pop('abxyz')
+    invalidate_scope_indexes()
+    test_completion("ab", ['abcd'])
+
     test_multiline_completion(["(obj.", "m"], 1, 0, ['method', '__doc__', '__module__'])
     test_multiline_completion(["(obj.", "m"], 1, 1, ['method'])
+
+    # Attribute completions are looked up again once a statement executes, and
+    # the last one doesn't keep the object alive
+    import gc
+    class Changing(object):
+        pass
+    changing = Changing()
+    changing.xa = 1
+    scope['changing'] = changing
+    test_completion("changing.x", ['xa'])
+    changing.xb = 2
+    invalidate_scope_indexes()
+    test_completion("changing.x", ['xa', 'xb'])
+    changing_ref = weakref.ref(changing)
+    del scope['changing'], changing
+    gc.collect()
+    if changing_ref() is not None:
+        print "Last attribute completion kept the object alive"
+        failed = True
     
     ### Tests of get_object_at_location()
 
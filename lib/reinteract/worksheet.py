@@ -11,11 +11,16 @@
 import os
 import re
 from StringIO import StringIO
+import thread
 
 from change_range import ChangeRange
 from chunks import *
+from execution_scheduler import ExecutionJob, executionScheduler
+from lookup_thread import LookupThread
 from notebook import Notebook, NotebookFile
+from retokenize import TOKEN_KEYWORD, TOKEN_NAME
 import reunicode
+from rewrite import Rewriter
 from statement import Statement
 from thread_executor import ThreadExecutor
 from undo_stack import UndoStack, InsertOp, DeleteOp
@@ -42,6 +47,10 @@ DECORATOR = 4
 
 NEW_LINE_RE = re.compile(r'\n|\r|\r\n')
 
+# When calculating at least this many statements, they are executed in
+# batched mode; see ThreadExecutor.run()
+BATCH_STATEMENTS = 50
+
 def calc_line_class(text):
     if BLANK_RE.match(text):
         return BLANK
@@ -54,6 +63,33 @@ def calc_line_class(text):
     else:
         return STATEMENT_START
 
+def _prefetch_imports(notebook, texts):
+    # Compile each statement to find its imports and import any global modules.
+    # We use a Rewriter directly rather than the Statement objects of the chunks
+    # since this is normally run in a thread, and those belong to the main thread.
+    future_features = None
+    for text in texts:
+        try:
+            rewriter = Rewriter(text, future_features=future_features)
+            rewriter.rewrite_and_compile()
+        except Exception:
+            # Compilation errors will be reported when the worksheet is calculated
+            continue
+
+        imports = rewriter.get_imports()
+        if imports is None:
+            continue
+
+        new_features = imports.get_future_features()
+        if new_features:
+            merged = set(new_features)
+            if future_features:
+                merged.update(future_features)
+            future_features = sorted(merged)
+
+        for name, fromlist in imports.get_imported_modules():
+            notebook.prefetch_import(name, fromlist)
+
 def order_positions(start_line, start_offset, end_line, end_offset):
     if start_line > end_line or (start_line == end_line and start_offset > end_offset):
         t = end_line
@@ -113,6 +149,18 @@ class Worksheet(object):
         self.__state = NotebookFile.EXECUTE_SUCCESS
         self.sig_state = signals.Signal()
 
+        # While changes are frozen, the chunk-* signals and state are held, and
+        # delivered in order when they thaw. text-*, lines-* and place-cursor
+        # describe incremental changes that listeners must apply immediately,
+        # and code-modified is expected to show up as soon as the user types,
+        # so they aren't held.
+        self.__held_signals = signals.SignalGroup(self.sig_chunk_inserted,
+                                                  self.sig_chunk_changed,
+                                                  self.sig_chunk_deleted,
+                                                  self.sig_chunk_status_changed,
+                                                  self.sig_chunk_results_changed,
+                                                  self.sig_state)
+
         self.global_scope = {}
         notebook.setup_globals(self.global_scope)
         exec _DEFINE_GLOBALS in self.global_scope
@@ -136,14 +184,36 @@ class Worksheet(object):
 
         self.__undo_stack = UndoStack(self)
         self.__executor = None
+        self.__job = None
+        self.__lookup_thread = None
+
+        #: the ExecutionScheduler that the calculations of the worksheet are queued with
+        self.scheduler = executionScheduler()
+
+        #: a ResourceLimits object for the statements of the worksheet, or None;
+        #: defaults to the limits set for the notebook, see NotebookInfo.limits.
+        #: A statement that exceeds them is interrupted, ending up in the
+        #: Statement.LIMIT_EXCEEDED state.
+        if notebook.info is not None:
+            self.limits = notebook.info.limits
+        else:
+            self.limits = None
 
         notebook._add_worksheet(self)
 
     def destroy(self):
         if self.__executor:
-            # Interruption is handled at a higher level
+            # Interruption is handled at a higher level, but there's no point
+            # in a calculation that hasn't started yet
+            if self.__job.state == ExecutionJob.QUEUED:
+                self.__job.cancel()
             self.__executor.destroy()
 
+        self.scheduler.forget(self)
+
+        if self.__lookup_thread:
+            self.__lookup_thread.destroy()
+
         if self.__file:
             self.__file.worksheet = None
             self.__file.modified = False
@@ -189,14 +259,125 @@ class Worksheet(object):
                 yield chunk
             prev_chunk = chunk
 
+    def get_slowest_chunks(self, count=10):
+        """Get the statement chunks that took longest the last time they were executed
+
+        @param count: the maximum number of chunks to return
+        @returns: a list of StatementChunk, slowest first
+
+        """
+
+        chunks = [chunk for chunk in self.iterate_chunks()
+                  if isinstance(chunk, StatementChunk) and chunk.stats is not None]
+        chunks.sort(key=lambda chunk: chunk.stats.wall_time, reverse=True)
+
+        return chunks[0:count]
+
+    def get_largest_bindings(self, count=None):
+        """Get the variables that keep the most memory alive
+
+        Each statement chunk that executed successfully keeps alive the values of the
+        variables that it bound or rebound; see L{memory_accounting}.
+
+        @param count: the maximum number of bindings to return, or None for all
+        @returns: a list of (StatementChunk, BindingMemory), largest first
+
+        """
+
+        bindings = [(chunk, binding) for chunk in self.iterate_chunks()
+                    if isinstance(chunk, StatementChunk) and chunk.memory is not None
+                    for binding in chunk.memory.bindings]
+        bindings.sort(key=lambda item: item[1].size, reverse=True)
+
+        if count is not None:
+            bindings = bindings[0:count]
+
+        return bindings
+
+    def get_wait_time(self):
+        """Get how long the calculation of the worksheet waited for a thread to run in
+
+        @returns: the time in seconds that the current calculation has waited so far,
+          if it is still queued, otherwise how long the last calculation waited
+          before starting, or None if the worksheet hasn't been calculated
+
+        """
+
+        return self.scheduler.get_wait_time(self)
+
+    def __chunk_references_name(self, chunk, name):
+        # Returns (references, deferred): whether the chunk refers to name, and whether
+        # any reference comes after a def or lambda, so that it might only be looked up
+        # when the function is called
+        references = False
+        in_function = False
+        tokenized = chunk.tokenized
+        for line, text in enumerate(tokenized.lines):
+            for token_type, start, end, _ in tokenized.get_tokens(line):
+                if token_type == TOKEN_KEYWORD and text[start:end] in ('def', 'lambda'):
+                    in_function = True
+                elif token_type == TOKEN_NAME and text[start:end] == name:
+                    if in_function:
+                        return True, True
+                    references = True
+
+        return references, False
+
+    def drop_binding(self, chunk, name):
+        """Stop a variable bound by a chunk from being kept alive by later statements
+
+        A 'del' statement for the variable is inserted after the last statement that
+        refers to it, so the statements after that no longer keep its value alive.
+
+        @param chunk: the StatementChunk binding the variable
+        @param name: the name of the variable
+        @returns: True if a statement was inserted. False if the variable can't be
+          dropped early: a later statement that uses the variable also rebinds it,
+          or a function refers to it, so that it might be used whenever the function
+          is called.
+
+        """
+
+        if self.state == NotebookFile.EXECUTING:
+            return False
+
+        # A function looks up the variable when it is called, wherever it is defined
+        for other in self.iterate_chunks():
+            if isinstance(other, StatementChunk) and self.__chunk_references_name(other, name)[1]:
+                return False
+
+        last_use = chunk
+        for later in self.iterate_chunks(chunk.end):
+            if not isinstance(later, StatementChunk):
+                continue
+
+            references = self.__chunk_references_name(later, name)[0]
+            if later.memory is not None and any(binding.name == name for binding in later.memory.bindings):
+                # The value doesn't go past the statement that rebinds the variable
+                if references:
+                    return False
+                break
+
+            if references:
+                last_use = later
+
+        line = last_use.end - 1
+        self.begin_user_action()
+        self.insert(line, len(self.get_line(line)), "\ndel %s" % name)
+        self.end_user_action()
+
+        return True
+
     def __freeze_changes(self):
         self.__freeze_changes_count += 1
+        self.__held_signals.hold()
 
     def __thaw_changes(self):
         self.__freeze_changes_count -= 1
         if self.__freeze_changes_count == 0:
             self.rescan()
             self.__emit_chunk_changes()
+        self.__held_signals.flush()
 
     def __emit_chunk_changes(self):
         deleted_chunks = self.__deleted_chunks
@@ -207,6 +388,8 @@ class Worksheet(object):
 
         for chunk in deleted_chunks:
             self.sig_chunk_deleted( self, chunk )
+            if isinstance(chunk, StatementChunk) and chunk.statement is not None:
+                chunk.statement.release_output()
 
         for chunk in sorted(changed_chunks, lambda a, b: cmp(a.start,b.start)):
             if chunk.newly_inserted:
@@ -654,7 +837,7 @@ class Worksheet(object):
             if isinstance(chunk, StatementChunk):
                 if chunk.needs_compile or chunk.needs_execute:
                     if not executor:
-                        executor = ThreadExecutor(parent)
+                        executor = ThreadExecutor(parent, limits=self.limits)
 
                 if executor:
                     statement = chunk.get_clean_statement(self)
@@ -673,7 +856,8 @@ class Worksheet(object):
             def on_statement_execution_state_changed(executor, statement):
                 if (statement.state == Statement.COMPILE_ERROR or
                     statement.state == Statement.EXECUTE_ERROR or
-                    statement.state == Statement.INTERRUPTED):
+                    statement.state == Statement.INTERRUPTED or
+                    statement.state == Statement.LIMIT_EXCEEDED):
                     self.__executor_error = True
 
                 statement.chunk.update_statement()
@@ -688,6 +872,7 @@ class Worksheet(object):
             def on_complete(executor):
                 self.__executor.destroy()
                 self.__executor = None
+                self.__job = None
                 if self.__executor_error:
                     self.__set_state(NotebookFile.ERROR)
                 elif more_statements:
@@ -704,8 +889,9 @@ class Worksheet(object):
             executor.sig_statement_complete.connect(on_statement_execution_state_changed)
             executor.sig_complete.connect(on_complete)
 
+            executor.batched = len(executor.statements) >= BATCH_STATEMENTS
             if executor.compile():
-                executor.execute()
+                self.__job = self.scheduler.submit(executor, self)
                 if wait:
                     loop.run()
         else:
@@ -718,7 +904,30 @@ class Worksheet(object):
 
     def interrupt(self):
         if self.state == NotebookFile.EXECUTING:
-            self.__executor.interrupt()
+            self.__job.cancel()
+
+    def prefetch_imports(self, wait=False):
+        """Import the global modules imported by the worksheet ahead of time
+
+        The statements of the worksheet are compiled in a background thread and
+        the global (not notebook-local) modules that they import are imported.
+        A subsequent calculation then doesn't have to wait for slow imports; if
+        it starts before prefetching is done, imports of modules that are
+        still being loaded wait for the loading to finish.
+
+        @param wait: if True, prefetch synchronously instead of in a thread
+
+        """
+
+        texts = [chunk.tokenized.get_text() for chunk in self.iterate_chunks()
+                 if isinstance(chunk, StatementChunk)]
+        if len(texts) == 0:
+            return
+
+        if wait:
+            _prefetch_imports(self.notebook, texts)
+        else:
+            thread.start_new_thread(_prefetch_imports, (self.notebook, texts))
 
     def __get_completion_scope(self, chunk):
         # Get the scope that we should use for completions for a given chunk; we
@@ -740,6 +949,28 @@ class Worksheet(object):
 
         return self.global_scope
 
+    def __prepare_find_completions(self, line, offset, min_length):
+        # Returns a function that does the work of find_completions() using a
+        # snapshot of the current state, so that it can be called from another thread
+
+        chunk = self.__chunks[line]
+        if not isinstance(chunk, StatementChunk) and not isinstance(chunk, BlankChunk):
+            return lambda: []
+
+        scope = self.__get_completion_scope(chunk)
+
+        if isinstance(chunk, StatementChunk):
+            tokenized = chunk.tokenized.copy()
+            line -= chunk.start
+        else:
+            # A BlankChunk Create a dummy TokenizedStatement to get the completions
+            # appropriate for the start of a line
+            tokenized = TokenizedStatement()
+            tokenized.set_lines([''])
+            line = offset = 0
+
+        return lambda: tokenized.find_completions(line, offset, scope, min_length=min_length)
+
     def find_completions(self, line, offset, min_length=0):
         """Returns a list of possible completions at the given position.
 
@@ -754,23 +985,54 @@ class Worksheet(object):
 
         """
 
+        return self.__prepare_find_completions(line, offset, min_length)()
+
+    def find_completions_async(self, line, offset, callback, min_length=0):
+        """Like find_completions(), but find the completions in a separate thread
+
+        Finding completions calls dir() and getattr() on user objects,
+        which can be arbitrarily slow, so the GUI uses this variant.
+
+        @param callback: called in the main thread with the list of completions
+        @returns: a request object; call cancel() on it if the result is no longer wanted.
+           If the completions can't be found before a deadline, the callback is called
+           with lookup_thread.TIMED_OUT instead.
+
+        """
+
+        return self.__get_lookup_thread().run(self.__prepare_find_completions(line, offset, min_length),
+                                              callback)
+
+    def __prepare_get_object_at_location(self, line, offset, include_adjacent):
+        # Like __prepare_find_completions()
+
         chunk = self.__chunks[line]
-        if not isinstance(chunk, StatementChunk) and not isinstance(chunk, BlankChunk):
-            return []
+        if not isinstance(chunk, StatementChunk):
+            return lambda: (None, None, None, None, None)
+
+        if chunk.statement is not None and chunk.statement.result_scope is not None:
+            result_scope = chunk.statement.result_scope
+        else:
+            result_scope = None
 
+        tokenized = chunk.tokenized.copy()
+        chunk_start = chunk.start
         scope = self.__get_completion_scope(chunk)
 
-        if isinstance(chunk, StatementChunk):
-            return chunk.tokenized.find_completions(line - chunk.start,
-                                                    offset,
-                                                    scope,
-                                                    min_length=min_length)
-        else:
-            # A BlankChunk Create a dummy TokenizedStatement to get the completions
-            # appropriate for the start of a line
-            ts = TokenizedStatement()
-            ts.set_lines([''])
-            return ts.find_completions(0, 0, scope, min_length=min_length)
+        def lookup():
+            obj, start_line, start_index, end_line, end_index = \
+                tokenized.get_object_at_location(line - chunk_start, offset,
+                                                 scope, result_scope, include_adjacent)
+
+            if obj is None:
+                return None, None, None, None, None
+
+            start_line += chunk_start
+            end_line += chunk_start
+
+            return obj, start_line, start_index, end_line, end_index
+
+        return lookup
 
     def get_object_at_location(self, line, offset, include_adjacent=False):
         """Find the object at a particular location within the worksheet
@@ -783,27 +1045,26 @@ class Worksheet(object):
 
         """
 
-        chunk = self.__chunks[line]
-        if not isinstance(chunk, StatementChunk):
-            return None, None, None, None, None
+        return self.__prepare_get_object_at_location(line, offset, include_adjacent)()
 
-        if chunk.statement is not None and chunk.statement.result_scope is not None:
-            result_scope = chunk.statement.result_scope
-        else:
-            result_scope = None
+    def get_object_at_location_async(self, line, offset, callback, include_adjacent=False):
+        """Like get_object_at_location(), but do the lookup in a separate thread
 
-        obj, start_line, start_index, end_line, end_index = \
-            chunk.tokenized.get_object_at_location(line - chunk.start, offset,
-                                                   self.__get_completion_scope(chunk),
-                                                   result_scope, include_adjacent)
+        @param callback: called in the main thread with the tuple that get_object_at_location() returns
+        @returns: a request object; call cancel() on it if the result is no longer wanted.
+           If the lookup doesn't finish before a deadline, the callback is called
+           with lookup_thread.TIMED_OUT instead.
+
+        """
 
-        if obj is None:
-            return None, None, None, None, None
+        return self.__get_lookup_thread().run(self.__prepare_get_object_at_location(line, offset, include_adjacent),
+                                              callback)
 
-        start_line += chunk.start
-        end_line += chunk.start
+    def __get_lookup_thread(self):
+        if self.__lookup_thread is None:
+            self.__lookup_thread = LookupThread()
 
-        return obj, start_line, start_index, end_line, end_index
+        return self.__lookup_thread
 
     def __do_clear(self):
         self.delete_range(0, 0, len(self.__lines) - 1, len(self.__lines[len(self.__lines) - 1]));
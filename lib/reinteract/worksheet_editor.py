@@ -131,6 +131,8 @@ class WorksheetEditor(Editor):
         sidebar_width = self.config_state.get_sidebar_width()
         if sidebar_width >= 0:
             self.widget.sidebar_width = sidebar_width
+        if global_settings.prefetch_imports:
+            self.buf.worksheet.prefetch_imports()
 
     def calculate(self, end_at_insert=False):
         self.view.calculate(end_at_insert)
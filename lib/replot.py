@@ -9,13 +9,20 @@
 ########################################################################
 
 import cairo
+import gobject
 import pango
 import gtk
 import matplotlib
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_cairo import RendererCairo, FigureCanvasCairo
+import math
 import numpy
+import os
+import thread
+import threading
+import weakref
 
+from reinteract.event_loop import eventLoop
 from reinteract.recorded_object import RecordedObject, default_filter
 import reinteract.custom_result as custom_result
 
@@ -23,6 +30,41 @@ DEFAULT_FIGURE_WIDTH = 6
 DEFAULT_FIGURE_HEIGHT = 4.5
 DEFAULT_ASPECT_RATIO = DEFAULT_FIGURE_WIDTH / DEFAULT_FIGURE_HEIGHT
 
+# While the sidebar is being resized, plots in it are shown by scaling the
+# old image, and only rendered again once the width has stayed the same for
+# this long (in milliseconds)
+RESIZE_RENDER_DELAY = 200
+
+# Maximum memory (in bytes, approximately) used by _figure_cache
+MAX_FIGURE_CACHE_SIZE = 64 * 1024 * 1024
+
+# Estimate of the memory used by a replayed figure, not counting the data
+FIGURE_SIZE_ESTIMATE = 256 * 1024
+
+# Size and resolution that plots are printed at
+PRINT_FIGURE_WIDTH = 6
+PRINT_FIGURE_HEIGHT = 4.5
+PRINT_DPI = 72
+
+# Lines with more than this many points are drawn with only the points that
+# can be distinguished at the width the plot is drawn at; see _decimate_lines()
+DECIMATE_MIN_POINTS = 10000
+
+# Images at least twice as big in each direction as the size they are drawn
+# at are drawn from a reduced version; see _ImagePyramid. When reducing,
+# this many rows of the original are processed at a time, so that memory
+# use for memory-mapped images is bounded.
+REDUCE_STRIP_ROWS = 256
+
+# Maximum memory (in bytes, approximately) used by the reduced images in
+# _pyramid_cache
+MAX_PYRAMID_CACHE_SIZE = 64 * 1024 * 1024
+
+# Printers have a much higher resolution than PRINT_DPI; when printing, keep
+# this many times as much detail in reduced lines and images as when drawing
+# to the screen
+PRINT_DETAIL_SCALE = 4
+
 class _PlotResultCanvas(FigureCanvasCairo):
     def draw_event(*args):
         # Since we never change anything about the figure, the only time we
@@ -30,12 +72,372 @@ class _PlotResultCanvas(FigureCanvasCairo):
         # ourselves
         pass
 
+class _FigureCache(object):
+    # Least-recently-used cache of rendered surfaces and replayed figures, shared
+    # between all plots, so that a plot that is displayed, printed, or exported
+    # repeatedly isn't replayed and drawn each time. The cache is accessed from
+    # both the main thread and the render thread.
+    #
+    # Entries only hold a weak reference to the recorded calls of the result,
+    # so the size of an entry is just the size of the value; once the calls
+    # are freed, the ids in the key might be reused, so the entry is dropped.
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.__lock = thread.allocate_lock()
+        self.__entries = {} # key => [calls_ref, value, size, serial]
+        self.__serial = 0
+        self.__size = 0
+
+    def lookup(self, key):
+        self.__lock.acquire()
+        try:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            if entry[0]() is None:
+                del self.__entries[key]
+                self.__size -= entry[2]
+                return None
+
+            self.__serial += 1
+            entry[3] = self.__serial
+            return entry[1]
+        finally:
+            self.__lock.release()
+
+    def store(self, key, result, value, size):
+        # The key must be made with result._calls_digest() or the id() of
+        # result._recreation_calls
+        if size > self.max_size:
+            return
+
+        self.__lock.acquire()
+        try:
+            old = self.__entries.get(key)
+            if old is not None:
+                self.__size -= old[2]
+
+            self.__serial += 1
+            self.__entries[key] = [result._calls_ref(), value, size, self.__serial]
+            self.__size += size
+
+            if self.__size > self.max_size:
+                # Evict entries for freed calls, then least recently used entries,
+                # until we are well under the limit, so we don't have to sort on
+                # every store
+                by_age = sorted(self.__entries.iteritems(), key=lambda (k, e): (e[0]() is not None, e[3]))
+                for k, e in by_age:
+                    if self.__size <= self.max_size * 3 / 4:
+                        break
+                    del self.__entries[k]
+                    self.__size -= e[2]
+        finally:
+            self.__lock.release()
+
+_figure_cache = _FigureCache(MAX_FIGURE_CACHE_SIZE)
+
+def _estimate_figure_size(result):
+    size = FIGURE_SIZE_ESTIMATE
+    for call, args, kwargs in result._recreation_calls:
+        for arg in args:
+            size += getattr(arg, 'nbytes', 0)
+
+    return size
+
+def _surface_key(result, figsize, dpi, width, height, font_size, compute=True):
+    # Computing the digest can take a long time for big plots, so in the main
+    # thread, we pass compute=False, and get None if it isn't known yet
+    digest = result._calls_digest(compute)
+    if digest is None:
+        return None
+
+    return ('surface', digest, result.decimate, figsize, dpi, width, height, font_size)
+
+def _envelope_indices(y, start, stop, buckets):
+    # Get the indices of the end points of y[start:stop], and of the minimum and
+    # maximum within each of buckets equal parts of it, in order
+    n = stop - start
+    size = int(math.ceil(float(n) / buckets))
+    full = n // size * size
+
+    parts = [numpy.array([start, stop - 1])]
+    if full > 0:
+        blocks = y[start:start + full].reshape(-1, size)
+        offsets = numpy.arange(start, start + full, size)
+        parts.append(blocks.argmin(axis=1) + offsets)
+        parts.append(blocks.argmax(axis=1) + offsets)
+    if full < n:
+        tail = y[start + full:stop]
+        parts.append(numpy.array([start + full + tail.argmin(), start + full + tail.argmax()]))
+
+    return numpy.unique(numpy.concatenate(parts))
+
+def _decimate_lines(axes, width):
+    # Replace the data of lines with a huge number of points by the minimum and
+    # maximum within each column of pixels, which draws the same but much faster.
+    # This is done after replaying, so the view limits have already been computed
+    # from the full data, and the data shown depends on the final limits; the
+    # recorded calls keep the full data for saving.
+
+    buckets = max(int(width), 1)
+    xmin, xmax = sorted(axes.get_xlim())
+
+    for line in axes.get_lines():
+        # With markers, every point is visible, not just the envelope
+        if line.get_marker() not in (None, 'None', '', ' ') or line.get_linestyle() in (None, 'None', '', ' '):
+            continue
+
+        x = line.get_xdata(orig=True)
+        y = line.get_ydata(orig=True)
+        if isinstance(x, numpy.ma.MaskedArray) or isinstance(y, numpy.ma.MaskedArray):
+            continue
+        x = numpy.asarray(x)
+        y = numpy.asarray(y)
+        if x.ndim != 1 or x.shape != y.shape or len(y) < max(DECIMATE_MIN_POINTS, 2 * buckets):
+            continue
+
+        start, stop = 0, len(x)
+        if numpy.all(x[1:] >= x[:-1]):
+            # Sorted x values; only the part within the view limits needs to be drawn
+            start = max(numpy.searchsorted(x, xmin, 'left') - 1, 0)
+            stop = min(numpy.searchsorted(x, xmax, 'right') + 1, len(x))
+            if stop - start <= 2 * buckets:
+                line.set_data(x[start:stop], y[start:stop])
+                continue
+
+        indices = _envelope_indices(y, start, stop, buckets)
+        line.set_data(x[indices], y[indices])
+
+def _reduce_image(image):
+    # Reduce an image to half the size in each direction. Numeric images are
+    # reduced by averaging 2x2 blocks, other images by taking every other pixel.
+    if image.dtype.kind not in 'iuf':
+        return numpy.ascontiguousarray(image[::2, ::2])
+
+    rows = image.shape[0] // 2 * 2
+    cols = image.shape[1] // 2 * 2
+    result = numpy.empty((rows // 2, cols // 2) + image.shape[2:], dtype=image.dtype)
+
+    for start in xrange(0, rows, REDUCE_STRIP_ROWS):
+        end = min(start + REDUCE_STRIP_ROWS, rows)
+        strip = numpy.asarray(image[start:end, :cols], dtype=numpy.float64)
+        blocks = strip.reshape(((end - start) // 2, 2, cols // 2, 2) + image.shape[2:])
+        mean = blocks.mean(axis=3).mean(axis=1)
+        if image.dtype.kind != 'f':
+            mean = numpy.rint(mean)
+        result[start // 2:end // 2] = mean
+
+    return result
+
+class _ImagePyramid(object):
+    # Versions of an image reduced by successive factors of two, computed
+    # when first needed. The pyramid doesn't reference the image itself, so
+    # it is passed to get_level(). Used from both the main thread and the
+    # render thread.
+
+    def __init__(self):
+        self.levels = []
+        # Total bytes of the reduced versions
+        self.size = 0
+        self.lock = thread.allocate_lock()
+
+    def get_level(self, image, width, height):
+        # Get the smallest level that is at least width x height
+        self.lock.acquire()
+        try:
+            level = image
+            i = 0
+            while True:
+                rows, cols = level.shape[:2]
+                if rows // 2 < height or cols // 2 < width:
+                    return level
+
+                if i == len(self.levels):
+                    self.levels.append(_reduce_image(level))
+                    self.size += self.levels[i].nbytes
+                level = self.levels[i]
+                i += 1
+        finally:
+            self.lock.release()
+
+class _PyramidCache(object):
+    # The _ImagePyramid for each image passed to imshow(), shared between all
+    # plots. Pyramids are found by the id() of the image, with a weak reference
+    # to check that it is still the same image, so images aren't kept alive by
+    # their pyramids. When the reduced images take up too much memory, the
+    # least recently used pyramids are dropped.
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.__lock = thread.allocate_lock()
+        self.__entries = {} # id(image) => [image_ref, file_version, pyramid, serial]
+        self.__serial = 0
+
+    def get_level(self, image, width, height):
+        # The contents of a memory-mapped image change along with its file
+        filename = getattr(image, 'filename', None)
+        file_version = None
+        if filename is not None:
+            try:
+                st = os.stat(filename)
+                file_version = (st.st_mtime, st.st_size)
+            except OSError:
+                pass
+
+        self.__lock.acquire()
+        try:
+            entry = self.__entries.get(id(image))
+            if entry is None or entry[0]() is not image or entry[1] != file_version:
+                entry = self.__entries[id(image)] = [weakref.ref(image), file_version, _ImagePyramid(), 0]
+
+            self.__serial += 1
+            entry[3] = self.__serial
+            pyramid = entry[2]
+        finally:
+            self.__lock.release()
+
+        # Reducing can take a while, so it's done without holding the cache lock
+        level = pyramid.get_level(image, width, height)
+        self.__trim()
+
+        return level
+
+    def __trim(self):
+        self.__lock.acquire()
+        try:
+            for k, e in self.__entries.items():
+                if e[0]() is None:
+                    del self.__entries[k]
+
+            size = sum(e[2].size for e in self.__entries.itervalues())
+            if size > self.max_size:
+                # As for _FigureCache, evict until we are well under the limit
+                by_age = sorted(self.__entries.iteritems(), key=lambda (k, e): e[3])
+                for k, e in by_age:
+                    if size <= self.max_size * 3 / 4:
+                        break
+                    del self.__entries[k]
+                    size -= e[2].size
+        finally:
+            self.__lock.release()
+
+_pyramid_cache = _PyramidCache(MAX_PYRAMID_CACHE_SIZE)
+
+def _render_surface(result, figsize, dpi, width, height):
+    # Replay the calls recorded on result into a new figure, and draw it into
+    # an image surface of the given width and height
+    figure = Figure(facecolor='white', figsize=figsize, dpi=dpi)
+    _PlotResultCanvas(figure)
+    axes = figure.add_subplot(111)
+    result._replay(axes, result._get_reduce_transform(axes.bbox.width, axes.bbox.height), compact=True)
+    if result.decimate:
+        _decimate_lines(axes, axes.bbox.width)
+
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+    renderer = RendererCairo(figure.dpi)
+    renderer.set_width_height(width, height)
+    renderer.set_ctx_from_surface(surface)
+    figure.draw(renderer)
+
+    return surface
+
+class _RenderRequest(object):
+    def __init__(self, result, figsize, dpi, width, height, font_size, callback):
+        self.result = result
+        self.figsize = figsize
+        self.dpi = dpi
+        self.width = width
+        self.height = height
+        self.font_size = font_size
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class _RenderThread(object):
+    # Renders plots in a thread separate from the main thread, so that drawing
+    # a lot of plots doesn't stop the user interface from responding. Each request
+    # uses its own figure, so nothing is shared with the main thread other than
+    # the (unchanging) recorded calls. Requests are handled one at a time in order.
+    # The render thread also computes the digest of the recorded calls for the
+    # cache key, so a surface rendered before is found without hashing the data
+    # in the main thread. The callback is called in the main thread with the
+    # request, the surface, and None, or if rendering failed, with the request,
+    # None, and a message describing the error.
+
+    def __init__(self):
+        self.__condition = threading.Condition(thread.allocate_lock())
+        self.__queue = []
+        self.__started = False
+
+    def render(self, result, figsize, dpi, width, height, font_size, callback):
+        request = _RenderRequest(result, figsize, dpi, width, height, font_size, callback)
+
+        self.__condition.acquire()
+        try:
+            self.__queue.append(request)
+            if not self.__started:
+                self.__started = True
+                thread.start_new_thread(self.__run_thread, ())
+            else:
+                self.__condition.notify()
+        finally:
+            self.__condition.release()
+
+        return request
+
+    def __deliver(self, request, surface, error):
+        if not request.cancelled:
+            request.callback(request, surface, error)
+
+        return False
+
+    def __run_thread(self):
+        while True:
+            self.__condition.acquire()
+            try:
+                while not self.__queue:
+                    self.__condition.wait()
+                request = self.__queue.pop(0)
+            finally:
+                self.__condition.release()
+
+            if request.cancelled:
+                continue
+
+            error = None
+            try:
+                key = _surface_key(request.result, request.figsize, request.dpi,
+                                   request.width, request.height, request.font_size)
+                surface = _figure_cache.lookup(key)
+                if surface is None:
+                    surface = _render_surface(request.result, request.figsize, request.dpi,
+                                              request.width, request.height)
+                    _figure_cache.store(key, request.result, surface,
+                                        surface.get_stride() * request.height)
+            except Exception, e:
+                surface = None
+                error = str(e) or e.__class__.__name__
+
+            eventLoop().add_idle(lambda r=request, s=surface, e=error: self.__deliver(r, s, e))
+
+_render_thread = None
+
+def _get_render_thread():
+    global _render_thread
+
+    if _render_thread is None:
+        _render_thread = _RenderThread()
+
+    return _render_thread
+
 class PlotWidget(custom_result.ResultWidget):
     __gsignals__ = {
         'button-press-event': 'override',
         'button-release-event': 'override',
         'expose-event': 'override',
-        'size-allocate': 'override',
         'unrealize': 'override'
     }
 
@@ -44,48 +446,130 @@ class PlotWidget(custom_result.ResultWidget):
 
         figsize=(DEFAULT_FIGURE_WIDTH, DEFAULT_FIGURE_HEIGHT)
 
+        # The figure is only used for its size and resolution; the recorded calls
+        # are replayed into figures of their own when rendering or saving
         self.figure = Figure(facecolor='white', figsize=figsize)
-        self.canvas = _PlotResultCanvas(self.figure)
-
-        self.axes = self.figure.add_subplot(111)
 
         self.add_events(gtk.gdk.BUTTON_PRESS_MASK | gtk.gdk.BUTTON_RELEASE)
 
+        self.result = result
+
+        # The figure is rendered in a separate thread (see _RenderThread). Until
+        # the contents for the current size are ready, we show the last contents
+        # we rendered, scaled to the current size.
         self.cached_contents = None
+        self.cached_size = None
+        self.cached_contents_stale = False
+        # If rendering failed, a message describing the error
+        self.render_error = None
+        self.render_request = None
+        self.resize_timeout = None
 
         self.sidebar_width = -1
 
     def do_expose_event(self, event):
         cr = self.window.cairo_create()
 
-        if not self.cached_contents:
-            self.cached_contents = cr.get_target().create_similar(cairo.CONTENT_COLOR,
-                                                                  self.allocation.width, self.allocation.height)
-
-            renderer = RendererCairo(self.figure.dpi)
-            renderer.set_width_height(self.allocation.width, self.allocation.height)
-            renderer.set_ctx_from_surface(self.cached_contents)
-
-            self.figure.draw(renderer)
+        width, height = self.allocation.width, self.allocation.height
+        if self.cached_size != (width, height) or self.cached_contents_stale:
+            self.__queue_render()
 
         # event.region is not bound: http://bugzilla.gnome.org/show_bug.cgi?id=487158
 #        gdk_context = gtk.gdk.CairoContext(renderer.ctx)
 #        gdk_context.region(event.region)
 #        gdk_context.clip()
 
-        cr.set_source_surface(self.cached_contents, 0, 0)
-        cr.paint()
+        if self.cached_contents:
+            cached_width, cached_height = self.cached_size
+            if (cached_width, cached_height) != (width, height):
+                cr.scale(float(width) / cached_width, float(height) / cached_height)
+            cr.set_source_surface(self.cached_contents, 0, 0)
+            cr.paint()
+        else:
+            # Placeholder until the figure is rendered; the figure background
+            cr.set_source_rgb(1, 1, 1)
+            cr.paint()
+
+            if self.render_error is not None:
+                layout = cr.create_layout()
+                layout.set_text("Error drawing plot: %s" % self.render_error)
+                layout.set_width(width * pango.SCALE)
+                layout.set_wrap(pango.WRAP_WORD_CHAR)
+                cr.set_source_rgb(0.6, 0, 0)
+                cr.move_to(0, 0)
+                cr.show_layout(layout)
+
+    def __queue_render(self):
+        if self.resize_timeout is not None:
+            return
+
+        width, height = self.allocation.width, self.allocation.height
+        if width <= 0 or height <= 0:
+            return
+
+        if self.render_request is not None:
+            if (self.render_request.width, self.render_request.height) == (width, height):
+                return
+            self.render_request.cancel()
+
+        figsize = (self.figure.get_figwidth(), self.figure.get_figheight())
+        font_size = matplotlib.rcParams['font.size']
+        key = _surface_key(self.result, figsize, self.figure.dpi, width, height, font_size, compute=False)
+        if key is not None:
+            surface = _figure_cache.lookup(key)
+            if surface is not None:
+                self.cached_contents = surface
+                self.cached_size = (width, height)
+                self.cached_contents_stale = False
+                self.render_error = None
+                return
+
+        self.render_request = _get_render_thread().render(self.result, figsize, self.figure.dpi,
+                                                          width, height, font_size, self.__on_rendered)
+
+    def __cancel_render(self):
+        if self.render_request is not None:
+            self.render_request.cancel()
+            self.render_request = None
+
+    def __on_rendered(self, request, surface, error):
+        if request is not self.render_request:
+            return
+
+        self.render_request = None
+        # If rendering failed, we show the error on the placeholder
+        self.cached_contents = surface
+        self.cached_size = (request.width, request.height)
+        self.cached_contents_stale = False
+        self.render_error = error
+
+        self.queue_draw()
+
+    def __delay_render(self):
+        # Avoid rendering at each intermediate size when the size is changing
+        # rapidly; see RESIZE_RENDER_DELAY
+        self.__cancel_render()
+        if self.resize_timeout is not None:
+            gobject.source_remove(self.resize_timeout)
 
-    def do_size_allocate(self, allocation):
-        if allocation.width != self.allocation.width or allocation.height != self.allocation.height:
-            self.cached_contents = None
+        self.resize_timeout = gobject.timeout_add(RESIZE_RENDER_DELAY, self.__on_resize_timeout)
 
-        gtk.DrawingArea.do_size_allocate(self, allocation)
+    def __on_resize_timeout(self):
+        self.resize_timeout = None
+        self.queue_draw()
+
+        return False
 
     def do_unrealize(self):
         gtk.DrawingArea.do_unrealize(self)
 
+        self.__cancel_render()
+        if self.resize_timeout is not None:
+            gobject.source_remove(self.resize_timeout)
+            self.resize_timeout = None
+
         self.cached_contents = None
+        self.cached_size = None
 
     def do_button_press_event(self, event):
         if event.button == 3:
@@ -123,6 +607,7 @@ class PlotWidget(custom_result.ResultWidget):
 
     def sync_dpi(self, dpi):
         self.figure.set_dpi(dpi)
+        self.cached_contents_stale = True
         if self.sidebar_width >= 0:
             self.recompute_figure_size()
 
@@ -132,36 +617,29 @@ class PlotWidget(custom_result.ResultWidget):
 
         self.sidebar_width = width
         if self.sidebar_width >= 0:
+            if self.window is not None:
+                self.__delay_render()
             self.recompute_figure_size()
 
     def sync_style(self, style):
-        self.cached_contents = None
+        # Keep showing the old contents until they are rendered again
+        self.__cancel_render()
+        self.cached_contents_stale = True
+        self.queue_draw()
 
         matplotlib.rcParams['font.size'] = self.parent.style.font_desc.get_size() / pango.SCALE
 
     def __save(self, filename):
-        # The save/restore here was added to matplotlib's after 0.90. We duplicate
-        # it for compatibility with older versions. (The code would need modification
-        # for 0.98 and newer, which is the reason for the particular version in the
-        # check)
-
-        version = [int(x) for x in matplotlib.__version__.split('.')]
-        need_save = version[:2] < [0, 98]
-        if need_save:
-            orig_dpi = self.figure.dpi.get()
-            orig_facecolor = self.figure.get_facecolor()
-            orig_edgecolor = self.figure.get_edgecolor()
-
-        try:
-            self.canvas.print_figure(filename)
-        finally:
-            if need_save:
-                self.figure.dpi.set(orig_dpi)
-                self.figure.set_facecolor(orig_facecolor)
-                self.figure.set_edgecolor(orig_edgecolor)
-                self.figure.set_canvas(self.canvas)
+        # Saving uses the full data, so replay it into a new figure rather than
+        # reusing anything from rendering. Since the figure is thrown away
+        # afterwards, we don't need to restore what print_figure() changes.
+        figure = Figure(facecolor='white',
+                        figsize=(self.figure.get_figwidth(), self.figure.get_figheight()),
+                        dpi=self.figure.dpi)
+        canvas = _PlotResultCanvas(figure)
+        self.result._replay(figure.add_subplot(111))
 
-        # Return dimensions to caller.
+        canvas.print_figure(filename)
 
 #    def do_size_allocate(self, allocation):
 #        gtk.DrawingArea.do_size_allocate(self, allocation)
@@ -169,7 +647,7 @@ class PlotWidget(custom_result.ResultWidget):
 #        dpi = self.figure.dpi.get()
 #        self.figure.set_size_inches (allocation.width / dpi, allocation.height / dpi)
 
-def _validate_args(args):
+def _split_args(args):
     #
     # The matplotlib argument parsing is a little wonky
     #
@@ -180,7 +658,8 @@ def _validate_args(args):
     #
     #  plot(x, y, y2)
     #
-    # is not. We just duplicate the algorithm here
+    # is not. We just duplicate the algorithm here, generating the
+    # indices (xi, yi, formati) for each group of arguments
     #
     l = len(args)
     i = 0
@@ -208,6 +687,20 @@ def _validate_args(args):
             formati = i + 2
             i += 3
 
+        yield xi, yi, formati
+
+def _group_sizes(args):
+    return [(xi is not None) + 1 + (formati is not None) for xi, _, formati in _split_args(args)]
+
+def _same_kwargs(a, b):
+    try:
+        return bool(a == b)
+    except (ValueError, TypeError):
+        # Comparing numpy arrays
+        return False
+
+def _validate_args(args):
+    for xi, yi, formati in _split_args(args):
         if xi is not None:
             arg = args[xi]
             if isinstance(arg, numpy.ndarray):
@@ -241,28 +734,117 @@ def _validate_args(args):
             raise TypeError("Expected format string for argument %d" % (formati + 1))
 
 class Axes(RecordedObject, custom_result.CustomResult):
-    def __init__(self, display='inline'):
+    def __init__(self, display='inline', decimate=True):
         RecordedObject.__init__(self)
         self.display = display
+        # If True, huge line plots are drawn with fewer points; see _decimate_lines()
+        self.decimate = decimate
+
+    def __copy__(self):
+        new = RecordedObject.__copy__(self)
+        new.display = self.display
+        new.decimate = self.decimate
+        return new
+
+    def _get_reduce_transform(self, width, height):
+        # Get a transform for _replay() that replaces images passed to imshow()
+        # that are much bigger than width x height with reduced versions.
+        # The full data is still used when saving.
+        def transform(call, args, kwargs):
+            if call != 'imshow' or len(args) == 0:
+                return args, kwargs
+
+            image = args[0]
+            if (not isinstance(image, numpy.ndarray) or isinstance(image, numpy.ma.MaskedArray) or
+                not image.ndim in (2, 3)):
+                return args, kwargs
+
+            rows, cols = image.shape[:2]
+            if rows // 2 < height or cols // 2 < width:
+                return args, kwargs
+
+            reduced = _pyramid_cache.get_level(image, width, height)
+
+            # Keep the coordinates the same as for the full image
+            kwargs = dict(kwargs)
+            if kwargs.get('extent') is None:
+                origin = kwargs.get('origin') or matplotlib.rcParams['image.origin']
+                if origin == 'lower':
+                    kwargs['extent'] = (-0.5, cols - 0.5, -0.5, rows - 0.5)
+                else:
+                    kwargs['extent'] = (-0.5, cols - 0.5, rows - 0.5, -0.5)
+
+            return (reduced,) + tuple(args[1:]), kwargs
+
+        return transform
 
     def _check_plot(self, name, args, kwargs, spec):
         _validate_args(args)
 
+    def _compact_plot(self, calls):
+        # Consecutive plot() calls with the same keyword arguments can be made as
+        # a single call with all the arguments, as long as the arguments still
+        # split into the same groups; see _split_args()
+        result = [] # [args, kwargs, last group of args]
+        for args, kwargs in calls:
+            sizes = _group_sizes(args)
+            if sizes and result and _same_kwargs(result[-1][1], kwargs):
+                last_args, _, tail = result[-1]
+                if _group_sizes(tail + args) == [len(tail)] + sizes:
+                    last_args.extend(args)
+                    result[-1][2] = args[len(args) - sizes[-1]:]
+                    continue
+
+            if sizes:
+                tail = args[len(args) - sizes[-1]:]
+            else:
+                tail = ()
+            result.append([list(args), kwargs, tail])
+
+        return [(tuple(args), kwargs) for args, kwargs, _ in result]
+
+    def is_equivalent(self, other):
+        return (self.display == other.display and self.decimate == other.decimate and
+                self._same_calls(other))
+
     def create_widget(self):
-        widget = PlotWidget(self)
-        self._replay(widget.axes)
-        return widget
+        return PlotWidget(self)
 
-    def print_result(self, print_context, render=True):
-        figure = Figure(facecolor='white', figsize=(6,4.5))
-        figure.set_dpi(72)
+    def __create_print_figure(self, replay):
+        figure = Figure(facecolor='white', figsize=(PRINT_FIGURE_WIDTH, PRINT_FIGURE_HEIGHT))
+        figure.set_dpi(PRINT_DPI)
         # Don't draw the frame, please.
         figure.set_frameon(False)
 
         canvas = _PlotResultCanvas(figure)
 
-        axes = figure.add_subplot(111)
-        self._replay(axes)
+        if replay:
+            axes = figure.add_subplot(111)
+            self._replay(axes, self._get_reduce_transform(axes.bbox.width * PRINT_DETAIL_SCALE,
+                                                          axes.bbox.height * PRINT_DETAIL_SCALE),
+                         compact=True)
+            if self.decimate:
+                _decimate_lines(axes, axes.bbox.width * PRINT_DETAIL_SCALE)
+
+        return figure
+
+    def print_result(self, print_context, render=True):
+        # When measuring, the size doesn't depend on the contents, so we skip
+        # replaying the calls. When rendering, the replayed figure is cached, so
+        # printing and exporting to PDF repeatedly doesn't replay each time.
+        if render:
+            # We don't want to hash the data here in the main thread to get the
+            # digest, so if it isn't known, we go by the identity of the calls
+            digest = self._calls_digest(compute=False)
+            if digest is None:
+                digest = ('calls', id(self._recreation_calls))
+            key = ('print', digest, self.decimate, matplotlib.rcParams['font.size'])
+            figure = _figure_cache.lookup(key)
+            if figure is None:
+                figure = self.__create_print_figure(replay=True)
+                _figure_cache.store(key, self, figure, _estimate_figure_size(self))
+        else:
+            figure = self.__create_print_figure(replay=False)
 
         width, height = figure.bbox.width, figure.bbox.height
 
@@ -304,11 +886,19 @@ Axes._set_target_class(matplotlib.axes.Axes, filter_method)
 
 
 def plot(*args, **kwargs):
-    axes = Axes()
+    """Plot lines, as with matplotlib's plot(). Lines with a huge number of points
+    are drawn with only the points visible at the size of the plot, unless
+    decimate=False is passed. The full data is always used when saving the plot."""
+
+    axes = Axes(decimate=kwargs.pop('decimate', True))
     axes.plot(*args, **kwargs)
     return axes
 
 def imshow(*args, **kwargs):
+    """Display an image, as with matplotlib's imshow(). Images much bigger than the
+    size of the plot are drawn from a reduced version, computed when first needed.
+    Memory-mapped arrays (numpy.memmap) are read a strip at a time, not copied."""
+
     axes = Axes()
     axes.imshow(*args, **kwargs)
     return axes
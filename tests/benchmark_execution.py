@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+#--------------------------------------------------------------------------------------
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+
+#--------------------------------------------------------------------------------------
+# Measures how many statements per second ThreadExecutor executes, one by one
+# and in batched mode, for a worksheet of many tiny statements like a generated
+# parameter sweep. Not run as part of the tests.
+#
+#     python benchmark_execution.py [statements]
+#
+
+#--------------------------------------------------------------------------------------
+import sys
+import time
+
+
+#--------------------------------------------------------------------------------------
+def measure( the_texts, the_batched ) :
+    from reinteract.notebook import Notebook
+    from reinteract.statement import Statement
+    from reinteract.thread_executor import ThreadExecutor
+    from reinteract.worksheet import Worksheet
+
+    a_worksheet = Worksheet( Notebook() )
+    an_executor = ThreadExecutor( batched = the_batched )
+    a_loop = an_executor.event_loop
+    for a_text in the_texts :
+        an_executor.add_statement( Statement( a_text, a_worksheet ) )
+        pass
+
+    an_executor.sig_complete.connect( lambda the_executor : a_loop.quit() )
+    assert an_executor.compile()
+
+    a_start = time.time()
+    an_executor.execute()
+    a_loop.run()
+    an_elapsed = time.time() - a_start
+
+    a_worksheet.destroy()
+
+    return len( the_texts ) / an_elapsed
+
+
+#--------------------------------------------------------------------------------------
+def report( the_name, the_templates, the_count ) :
+    a_texts = [ a_template % { 'i' : i } for i in xrange( the_count ) for a_template in the_templates ]
+    a_one_by_one = measure( a_texts, False )
+    a_batched = measure( a_texts, True )
+    print "%-30s %8.0f statements/s one by one, %8.0f batched (%4.1f x)" % ( the_name, a_one_by_one, a_batched, a_batched / a_one_by_one )
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def benchmark_execution( the_count ) :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment
+    adjust_environment()
+
+    #--------------------------------------------------------------------------------------
+    report( "assignments", [ "x%(i)d = %(i)d" ], the_count )
+    report( "assignments and output", [ "x%(i)d = %(i)d * 2\nx%(i)d" ], the_count )
+    report( "printing", [ "print %(i)d" ], the_count )
+    report( "mixed with mutations", [ "x%(i)d = %(i)d", "l = [x%(i)d]\nl.append(1)" ], the_count // 2 )
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    #--------------------------------------------------------------------------------------
+    if len( sys.argv ) > 1 :
+        benchmark_execution( int( sys.argv[ 1 ] ) )
+    else :
+        benchmark_execution( 2000 )
+        pass
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+#--------------------------------------------------------------------------------------
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+
+#--------------------------------------------------------------------------------------
+# Measures the cost of emitting a signal, for the different kinds of slots,
+# and of emitting it while held by a SignalGroup, compared to calling the
+# slot directly. Not run as part of the tests.
+#
+#     python benchmark_signals.py [emissions]
+#
+
+#--------------------------------------------------------------------------------------
+import sys
+import time
+
+
+#--------------------------------------------------------------------------------------
+def measure( the_function, the_count ) :
+    a_start = time.time()
+    for i in xrange( the_count ) :
+        the_function( i )
+        pass
+
+    return ( time.time() - a_start ) / the_count
+
+
+#--------------------------------------------------------------------------------------
+def report( the_name, the_cost, the_baseline ) :
+    print "%-40s %8.3f us  (%5.1f x direct call)" % ( the_name, the_cost * 1e6, the_cost / the_baseline )
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def benchmark_signals( the_count ) :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment
+    adjust_environment()
+
+    from reinteract.signals import Signal, SignalGroup
+
+    #--------------------------------------------------------------------------------------
+    class Listener( object ) :
+        def on_emit( self, the_value ) :
+            pass
+
+        def __call__( self, the_value ) :
+            pass
+
+        pass
+
+    def listen_function( the_value ) :
+        pass
+
+    #--------------------------------------------------------------------------------------
+    a_listener = Listener()
+    a_baseline = measure( a_listener.on_emit, the_count )
+    report( "direct call", a_baseline, a_baseline )
+
+    #--------------------------------------------------------------------------------------
+    a_sig = Signal()
+    report( "no slots", measure( a_sig, the_count ), a_baseline )
+
+    a_sig = Signal()
+    a_sig.connect( listen_function )
+    report( "function slot", measure( a_sig, the_count ), a_baseline )
+
+    a_sig = Signal()
+    a_sig.connect( a_listener.on_emit )
+    report( "method slot", measure( a_sig, the_count ), a_baseline )
+
+    a_sig = Signal( False )
+    a_sig.connect( a_listener.on_emit )
+    report( "method slot, not threadsafe", measure( a_sig, the_count ), a_baseline )
+
+    a_sig = Signal()
+    a_sig.connect( a_listener )
+    report( "object slot", measure( a_sig, the_count ), a_baseline )
+
+    a_listeners = [ Listener() for i in range( 10 ) ]
+    a_sig = Signal()
+    for a_slot in a_listeners :
+        a_sig.connect( a_slot.on_emit )
+        pass
+    report( "10 method slots", measure( a_sig, the_count ), a_baseline )
+
+    #--------------------------------------------------------------------------------------
+    def measure_held( the_signal, the_group, the_emit ) :
+        a_start = time.time()
+        the_group.hold()
+        for i in xrange( the_count ) :
+            the_emit( the_signal, i )
+            pass
+        the_group.flush()
+
+        return ( time.time() - a_start ) / the_count
+
+    a_sig = Signal()
+    a_group = SignalGroup( a_sig )
+    a_sig.connect( a_listener.on_emit )
+    report( "method slot, not held", measure( a_sig, the_count ), a_baseline )
+    report( "method slot, held", measure_held( a_sig, a_group, lambda the_signal, i : the_signal( i ) ), a_baseline )
+    report( "method slot, held, repeated emission", measure_held( a_sig, a_group, lambda the_signal, i : the_signal( 0 ) ), a_baseline )
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    #--------------------------------------------------------------------------------------
+    if len( sys.argv ) > 1 :
+        benchmark_signals( int( sys.argv[ 1 ] ) )
+    else :
+        benchmark_signals( 100000 )
+        pass
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
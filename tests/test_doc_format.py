@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+########################################################################
+#
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+#--------------------------------------------------------------------------------------
+def test_doc_format_0():
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    import gc
+    import weakref
+
+    from reinteract import doc_format
+    from reinteract.doc_format import get_doc_segments
+
+    #--------------------------------------------------------------------------------------
+    class Documented(object):
+        """Some documentation"""
+        pass
+
+    # The formatted docs are cached
+    segments = get_doc_segments(Documented)
+    assert "Some documentation" in "".join(text for text, bold in segments)
+    assert get_doc_segments(Documented) is segments
+
+    # Instances get the documentation of their class
+    assert get_doc_segments(Documented()) is segments
+
+    # Objects that can't be weakly referenced are cached too
+    len_segments = get_doc_segments(len)
+    assert get_doc_segments(len) is len_segments
+
+    # The cache doesn't keep the object alive
+    documented_ref = weakref.ref(Documented)
+    del Documented
+    gc.collect()
+    assert_equals(documented_ref(), None)
+
+    # And when the id() is reused, the docs of the old object aren't returned
+    class Other(object):
+        """Other documentation"""
+        pass
+    assert "Other documentation" in "".join(text for text, bold in get_doc_segments(Other))
+
+    # The cache is bounded
+    classes = []
+    for i in xrange(doc_format.MAX_CACHED_DOCS + 10):
+        klass = type('Class%d' % i, (object,), {})
+        classes.append(klass)
+        get_doc_segments(klass)
+    assert len(doc_format._docs_cache) <= doc_format.MAX_CACHED_DOCS
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    #--------------------------------------------------------------------------------------
+    test_doc_format_0()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
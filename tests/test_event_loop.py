@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+#--------------------------------------------------------------------------------------
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+
+#--------------------------------------------------------------------------------------
+def test_event_loop_0() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    global_settings = adjust_environment()
+
+    from reinteract.event_loop import create_event_loop
+
+    import thread
+    import time
+
+    #--------------------------------------------------------------------------------------
+    # Functors run in order, and ones returning True are called again
+    a_loop = create_event_loop( 'python' )
+    a_log = []
+
+    a_counter = [ 0 ]
+    def repeat() :
+        a_counter[ 0 ] += 1
+        a_log.append( 'repeat' )
+        if a_counter[ 0 ] == 3 :
+            a_loop.quit()
+            pass
+
+        return a_counter[ 0 ] < 3
+
+    a_loop.add_idle( lambda : a_log.append( 'first' ) )
+    a_loop.add_idle( repeat )
+    a_loop.add_idle( lambda : a_log.append( 'second' ) )
+    a_loop.run()
+
+    assert_equals( a_log, [ 'first', 'repeat', 'second', 'repeat', 'repeat' ] )
+
+    #--------------------------------------------------------------------------------------
+    # Cached events queued before the loop gets to them are called just once
+    class Listener( object ) :
+        def __init__( self ) :
+            self.count = 0
+            pass
+        def on_event( self ) :
+            self.count += 1
+            pass
+        pass
+
+    a_listener = Listener()
+    an_other = Listener()
+    for i in range( 10 ) :
+        a_loop.cache_event( a_listener.on_event )
+        a_loop.cache_event( an_other.on_event )
+        pass
+
+    a_loop.add_idle( lambda : a_loop.quit() )
+    a_loop.run()
+
+    assert_equals( a_listener.count, 1 )
+    assert_equals( an_other.count, 1 )
+
+    #--------------------------------------------------------------------------------------
+    # Functors can be queued from other threads while the loop is waiting
+    a_listener = Listener()
+    def notify() :
+        time.sleep( 0.05 )
+        a_loop.cache_event( a_listener.on_event )
+        time.sleep( 0.05 )
+        a_loop.add_idle( lambda : a_loop.quit() )
+        pass
+
+    thread.start_new_thread( notify, () )
+    a_loop.run()
+
+    assert_equals( a_listener.count, 1 )
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def test_event_loop_1() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    global_settings = adjust_environment()
+
+    from reinteract.event_loop import create_event_loop
+    from reinteract.notebook import Notebook
+    from reinteract.statement import Statement
+    from reinteract.thread_executor import ThreadExecutor
+    from reinteract.worksheet import Worksheet
+
+    #--------------------------------------------------------------------------------------
+    # A ThreadExecutor driven by the Python backend rather than GLib
+    a_notebook = Notebook()
+    a_worksheet = Worksheet( a_notebook )
+
+    a_loop = create_event_loop( 'python' )
+    an_executor = ThreadExecutor( event_loop = a_loop )
+
+    a_statements = [ Statement( "a = 1", a_worksheet ),
+                     Statement( "a + 1", a_worksheet ),
+                     Statement( "a + 2", a_worksheet ) ]
+    for a_statement in a_statements :
+        an_executor.add_statement( a_statement )
+        pass
+
+    a_completed = []
+    def on_statement_complete( the_executor, the_statement ) :
+        a_completed.append( the_statement )
+        pass
+
+    def on_complete( the_executor ) :
+        a_loop.quit()
+        pass
+
+    an_executor.sig_statement_complete.connect( on_statement_complete )
+    an_executor.sig_complete.connect( on_complete )
+
+    an_executor.compile()
+    an_executor.execute()
+    a_loop.run()
+
+    assert_equals( a_completed, a_statements )
+    assert_equals( [ a_statement.results for a_statement in a_statements[ 1: ] ], [ [ '2' ], [ '3' ] ] )
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    #--------------------------------------------------------------------------------------
+    test_event_loop_0()
+    test_event_loop_1()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
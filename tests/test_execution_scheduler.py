@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+#--------------------------------------------------------------------------------------
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+
+#--------------------------------------------------------------------------------------
+def test_execution_scheduler_0() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    from reinteract.event_loop import create_event_loop
+    from reinteract.execution_scheduler import ExecutionJob, ExecutionScheduler
+    from reinteract.notebook import Notebook
+    from reinteract.statement import Statement
+    from reinteract.thread_executor import ThreadExecutor
+    from reinteract.worksheet import Worksheet
+
+    import sys
+    import threading
+    import time
+
+    #--------------------------------------------------------------------------------------
+    a_loop = create_event_loop( 'python' )
+    a_worksheet = Worksheet( Notebook() )
+    a_scope = a_worksheet.global_scope
+    a_started = []
+    # Calling a method of the list directly would make the statement copy it first
+    a_scope[ 'record' ] = a_started.append
+    a_scope[ 'threading' ] = threading
+
+    def wait_for( the_condition ) :
+        a_start = time.time()
+        while not the_condition() :
+            assert time.time() < a_start + 5, "Timed out"
+            time.sleep( 0.01 )
+            pass
+        pass
+
+    def submit( the_scheduler, the_name, the_text = "", the_owner = None ) :
+        # Each job records when it starts executing, then runs the_text
+        an_executor = ThreadExecutor( event_loop = a_loop )
+        an_executor.add_statement( Statement( "record(%r)\n%s" % ( the_name, the_text ), a_worksheet ) )
+        assert an_executor.compile()
+        return the_scheduler.submit( an_executor, the_owner )
+
+    def is_done( the_job ) :
+        return lambda : the_job.state == ExecutionJob.DONE
+
+    def statement_state( the_job ) :
+        return the_job.executor.statements[ 0 ].state
+
+    #--------------------------------------------------------------------------------------
+    # Jobs of the focused owner run first, and one of them gets an extra thread when
+    # all the threads are busy
+    a_scheduler = ExecutionScheduler( max_threads = 1 )
+    a_gate = threading.Event()
+    a_focused_gate = threading.Event()
+    a_scope[ 'gate' ] = a_gate
+    a_scope[ 'focused_gate' ] = a_focused_gate
+
+    a_scheduler.set_focused( 'focused' )
+    a_blocker = submit( a_scheduler, 'blocker', "gate.wait(5)" )
+    wait_for( lambda : a_started == [ 'blocker' ] )
+
+    a_focused = submit( a_scheduler, 'focused', "focused_gate.wait(5)", 'focused' )
+    wait_for( lambda : a_started == [ 'blocker', 'focused' ] )
+    assert_equals( a_scheduler.get_running_count(), 2 )
+
+    # Both threads are busy now, so these are queued
+    a_first = submit( a_scheduler, 'first' )
+    a_second_focused = submit( a_scheduler, 'second focused', "", 'focused' )
+    a_last = submit( a_scheduler, 'last' )
+    assert_equals( a_scheduler.get_queue_depth(), 3 )
+
+    a_gate.set()
+    wait_for( is_done( a_last ) )
+    assert_equals( a_started, [ 'blocker', 'focused', 'second focused', 'first', 'last' ] )
+    a_focused_gate.set()
+    wait_for( is_done( a_focused ) )
+
+    #--------------------------------------------------------------------------------------
+    # The extra thread is released once its job is done
+    a_gate.clear()
+    a_focused_gate.clear()
+    del a_started[ : ]
+
+    a_blocker = submit( a_scheduler, 'blocker', "gate.wait(5)" )
+    wait_for( lambda : a_started == [ 'blocker' ] )
+    a_focused = submit( a_scheduler, 'focused', "", 'focused' )
+    wait_for( is_done( a_focused ) )
+
+    # If the extra thread were still around, this would start
+    a_waiting = submit( a_scheduler, 'waiting' )
+    time.sleep( 0.2 )
+    assert_equals( a_waiting.state, ExecutionJob.QUEUED )
+    assert_equals( a_scheduler.get_running_count(), 1 )
+
+    #--------------------------------------------------------------------------------------
+    # Cancelling a queued job finishes it off without running it, while cancelling
+    # a running job interrupts it and the thread goes on to the next job
+    a_waiting.cancel()
+    assert_equals( a_waiting.state, ExecutionJob.DONE )
+    assert_equals( statement_state( a_waiting ), Statement.INTERRUPTED )
+    assert_equals( a_scheduler.get_queue_depth(), 0 )
+
+    a_next = submit( a_scheduler, 'next' )
+    a_blocker.cancel()
+    wait_for( is_done( a_next ) )
+    assert_equals( statement_state( a_blocker ), Statement.INTERRUPTED )
+    assert_equals( statement_state( a_next ), Statement.EXECUTE_SUCCESS )
+    assert_equals( a_started, [ 'blocker', 'focused', 'next' ] )
+
+    #--------------------------------------------------------------------------------------
+    # An interruption still pending when a job finishes doesn't reach the next job run
+    # in the same thread. To leave one pending, the job interrupts itself with the check
+    # interval raised so that Python doesn't notice it; the next job lowers it again.
+    import ctypes
+    a_scope[ 'ctypes' ] = ctypes
+    a_scope[ 'sys' ] = sys
+    a_check_interval = sys.getcheckinterval()
+
+    try:
+        a_job = submit( a_scheduler, 'interrupted',
+                        "sys.setcheckinterval(1000000000)\n"
+                        "ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(threading.current_thread().ident),\n"
+                        "                                           ctypes.py_object(KeyboardInterrupt))" )
+        wait_for( is_done( a_job ) )
+        assert_equals( statement_state( a_job ), Statement.EXECUTE_SUCCESS )
+
+        a_job = submit( a_scheduler, 'after interrupted',
+                        "sys.setcheckinterval(%d)\n"
+                        "for i in range(1000): pass" % a_check_interval )
+        wait_for( is_done( a_job ) )
+        assert_equals( statement_state( a_job ), Statement.EXECUTE_SUCCESS )
+    finally:
+        sys.setcheckinterval( a_check_interval )
+
+    a_worksheet.destroy()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    #--------------------------------------------------------------------------------------
+    test_execution_scheduler_0()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
@@ -179,6 +179,97 @@ def test_notebook_0():
         write_file("mod7.py", "a = 2")
         do_test("import mod6", "mod6.a", 2) # creates a different new notebook
 
+        # Prefetching ignores errors, including names we can't import at all
+        nb = Notebook(base)
+        assert_equals(nb.prefetch_import("colorsys"), True)
+        assert_equals(nb.prefetch_import("mod1"), False)
+        assert_equals(nb.prefetch_import(None, ["x"]), False)
+        assert_equals(nb.prefetch_import(""), False)
+        assert_equals(nb.prefetch_import("no_such_module_at_all"), False)
+
+    finally:
+        cleanup()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def test_notebook_1():
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    from reinteract.notebook import Notebook
+
+    import os
+    import tempfile
+    import threading
+    import time
+
+    #--------------------------------------------------------------------------------------
+    base = tempfile.mkdtemp("", u"notebook_threads")
+
+    def cleanup():
+        for root, dirs, files in os.walk(base, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            for name in dirs:
+                os.rmdir(os.path.join(root, name))
+        os.rmdir(base)
+
+    def write_file(name, contents):
+        f = open(os.path.join(base, name), "w")
+        f.write(contents)
+        f.close()
+
+    def import_in_thread(nb, import_text, results):
+        def do_import():
+            scope = {}
+            nb.setup_globals(scope)
+            exec import_text in scope
+            results.append(scope)
+
+        t = threading.Thread(target=do_import)
+        t.setDaemon(True)
+        t.start()
+        return t
+
+    try:
+        write_file("fast.py", "a = 1")
+        write_file("slow.py", "import time\ntime.sleep(1.0)\nb = 2")
+        write_file("circ1.py", "import time\ntime.sleep(0.2)\nimport circ2\nc = 3")
+        write_file("circ2.py", "import time\ntime.sleep(0.2)\nimport circ1\nd = 4")
+
+        # Importing an already loaded module isn't blocked by a slow import
+        # in another thread
+        nb = Notebook(base)
+        import_in_thread(nb, "import fast", []).join()
+
+        slow_results = []
+        slow_thread = import_in_thread(nb, "import slow", slow_results)
+        time.sleep(0.1)
+        start = time.time()
+        fast_results = []
+        import_in_thread(nb, "import fast", fast_results).join(0.5)
+        assert_equals(len(fast_results), 1)
+        assert time.time() - start < 0.5
+
+        # But importing a module that is being loaded waits for it to be complete
+        results = []
+        import_in_thread(nb, "import slow", results).join(5.)
+        assert_equals(len(results), 1)
+        assert_equals(eval("slow.b", results[0]), 2)
+        slow_thread.join()
+
+        # Two threads importing modules that import each other don't deadlock
+        nb = Notebook(base)
+        results = []
+        t1 = import_in_thread(nb, "import circ1", results)
+        t2 = import_in_thread(nb, "import circ2", results)
+        t1.join(5.)
+        t2.join(5.)
+        assert_equals(len(results), 2)
     finally:
         cleanup()
 
@@ -186,10 +277,57 @@ def test_notebook_0():
     pass
 
 
+#--------------------------------------------------------------------------------------
+def test_notebook_2():
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    from reinteract.notebook import Notebook
+    from reinteract.worksheet import Worksheet
+
+    import os
+    import tempfile
+
+    #--------------------------------------------------------------------------------------
+    base = tempfile.mkdtemp("", u"notebook_limits")
+
+    def write_index(contents):
+        f = open(os.path.join(base, "index.rnb"), "w")
+        f.write(contents)
+        f.close()
+
+    try:
+        # Worksheets get the resource limits set for the notebook
+        write_index("[Notebook]\ntime_limit = 30\nmemory_limit = 1.5\ncpu_time_limit = ten\n")
+        worksheet = Worksheet(Notebook(base))
+        limits = worksheet.limits
+        assert_equals((limits.wall_time, limits.cpu_time, limits.memory), (30., None, 1572864))
+        worksheet.destroy()
+
+        # Without any, they have no limits
+        write_index("[Notebook]\ndescription = No limits\n")
+        worksheet = Worksheet(Notebook(base))
+        assert_equals(worksheet.limits, None)
+        worksheet.destroy()
+
+        worksheet = Worksheet(Notebook())
+        assert_equals(worksheet.limits, None)
+        worksheet.destroy()
+    finally:
+        os.remove(os.path.join(base, "index.rnb"))
+        os.rmdir(base)
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
 #--------------------------------------------------------------------------------------
 if __name__ == "__main__":
     #--------------------------------------------------------------------------------------
     test_notebook_0()
+    test_notebook_1()
+    test_notebook_2()
 
     #--------------------------------------------------------------------------------------
     pass
@@ -93,10 +93,186 @@ def test_recorded_object_0():
     pass
 
 
+#--------------------------------------------------------------------------------------
+def test_recorded_object_1():
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    from reinteract.recorded_object import RecordedObject
+
+    #--------------------------------------------------------------------------------------
+    class TestTarget:
+        def __init__():
+            pass
+
+        def method(self, *args, **kwargs):
+            pass
+
+        pass
+
+    class TestRecorded(RecordedObject):
+        pass
+
+    TestRecorded._set_target_class(TestTarget)
+
+    # Tests of comparing recorded calls
+
+    def recorded(*calls):
+        o = TestRecorded()
+        for args, kwargs in calls:
+            o.method(*args, **kwargs)
+        return o
+
+    a = recorded(((1, [2, 3]), { 'x': 'y' }))
+    assert_equals(a._same_calls(a), True)
+    assert_equals(a._same_calls(recorded(((1, [2, 3]), { 'x': 'y' }))), True)
+    assert_equals(a._same_calls(recorded(((1, [2, 4]), { 'x': 'y' }))), False)
+    assert_equals(a._same_calls(recorded(((1, [2, 3]), { 'x': 'z' }))), False)
+    assert_equals(a._same_calls(recorded(((1.0, [2, 3]), { 'x': 'y' }))), False)
+    assert_equals(a._same_calls(recorded()), False)
+
+    # The digest identifies the calls, and changes as calls are recorded
+    b = recorded(((1, [2, 3]), { 'x': 'y' }))
+    assert_equals(a._calls_digest() == b._calls_digest(), True)
+    assert_equals(a._calls_digest() == recorded(((1, [2, 4]), { 'x': 'y' }))._calls_digest(), False)
+    digest = b._calls_digest()
+    b.method()
+    assert_equals(b._calls_digest(compute=False), None)
+    assert_equals(b._calls_digest() == digest, False)
+    assert_equals(b._calls_digest(compute=False), b._calls_digest())
+
+    # Copies share the digest, which stays valid while the calls are alive
+    c = b.__copy__()
+    assert_equals(c._calls_digest(), b._calls_digest())
+    assert_equals(c._recreation_calls.get_digest() is b._recreation_calls.get_digest(), True)
+    ref = b._calls_ref()
+    del b, c
+    assert_equals(ref(), None)
+
+    # The digest of a memory-mapped array changes when its file does
+    import os, tempfile
+    class Dtype(object):
+        str = '|u1'
+        pass
+
+    class MappedArray(object):
+        def __init__(self, filename):
+            self.filename = filename
+            self.dtype = Dtype()
+            self.shape = (1,)
+            self.strides = (1,)
+            self.__array_interface__ = { 'data': (0, True) }
+
+        def tostring(self):
+            raise AssertionError("Contents of a memory-mapped array shouldn't be read")
+
+        pass
+
+    handle, filename = tempfile.mkstemp()
+    try:
+        os.write(handle, "1")
+        a = recorded(((MappedArray(filename),), {}))
+        digest = a._calls_digest()
+        assert_equals(a._calls_digest(), digest)
+        os.write(handle, "2")
+        assert_equals(a._calls_digest() == digest, False)
+    finally:
+        os.close(handle)
+        os.remove(filename)
+        pass
+
+    # Objects that compare element-by-element
+    class Array(object):
+        def __init__(self, values):
+            self.values = values
+            self.shape = (len(values),)
+
+        def __eq__(self, other):
+            return Array([x == y for x, y in zip(self.values, other.values)])
+
+        def all(self):
+            return all(self.values)
+
+        pass
+
+    a = recorded(((Array([1, 2]),), {}))
+    assert_equals(a._same_calls(recorded(((Array([1, 2]),), {}))), True)
+    assert_equals(a._same_calls(recorded(((Array([1, 3]),), {}))), False)
+    assert_equals(a._same_calls(recorded(((Array([1, 2, 3]),), {}))), False)
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def test_recorded_object_2():
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    import copy
+    from reinteract.recorded_object import RecordedObject
+
+    #--------------------------------------------------------------------------------------
+    class TestTarget:
+        def __init__(self):
+            self.calls = []
+            pass
+
+        def add(self, *args):
+            self.calls.append(('add', args))
+            pass
+
+        def other(self):
+            self.calls.append(('other', ()))
+            pass
+
+        pass
+
+    class TestRecorded(RecordedObject):
+        def _compact_add(self, calls):
+            return [(sum((args for args, kwargs in calls), ()), {})]
+
+        pass
+
+    TestRecorded._set_target_class(TestTarget)
+
+    def replay(o, compact=False):
+        target = TestTarget()
+        o._replay(target, compact=compact)
+        return target.calls
+
+    # Copies share the recorded calls, but recording more calls on one
+    # doesn't affect the other
+
+    a = TestRecorded()
+    a.add(1)
+    b = copy.copy(a)
+    b.add(2)
+    a.other()
+
+    assert_equals(replay(a), [('add', (1,)), ('other', ())])
+    assert_equals(replay(b), [('add', (1,)), ('add', (2,))])
+    assert_equals(len(a._recreation_calls), 2)
+    assert_equals(a._same_calls(copy.copy(a)), True)
+
+    # Compacting consecutive calls
+
+    b.other()
+    b.add(3)
+    assert_equals(replay(b, compact=True), [('add', (1, 2)), ('other', ()), ('add', (3,))])
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
 #--------------------------------------------------------------------------------------
 if __name__ == "__main__":
     #--------------------------------------------------------------------------------------
     test_recorded_object_0()
+    test_recorded_object_1()
+    test_recorded_object_2()
 
     #--------------------------------------------------------------------------------------
     pass
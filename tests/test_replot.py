@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+########################################################################
+#
+# Copyright 2026 agent
+#
+# This file is part of Reinteract and distributed under the terms
+# of the BSD license. See the file COPYING in the Reinteract
+# distribution for full details.
+#
+########################################################################
+
+#--------------------------------------------------------------------------------------
+def test_replot_0():
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    import replot
+
+    #--------------------------------------------------------------------------------------
+    # Consecutive plot() calls are merged when the groups of arguments are kept
+    axes = replot.Axes()
+
+    def compact(*calls):
+        return axes._compact_plot([(args, {}) for args in calls])
+
+    x = [1, 2, 3]
+    y = [4, 5, 6]
+    assert_equals(compact((x, y), (x, y, 'r')), [((x, y, x, y, 'r'), {})])
+
+    # A format string can't be merged onto the end of a group without one
+    assert_equals(compact((y,), ('r',)), [((y,), {}), (('r',), {})])
+
+    # plot() with no arguments, after another plot() or by itself
+    assert_equals(compact((x, y), ()), [((x, y), {}), ((), {})])
+    assert_equals(compact((), (x, y)), [((), {}), ((x, y), {})])
+    assert_equals(compact((), ()), [((), {}), ((), {})])
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    #--------------------------------------------------------------------------------------
+    test_replot_0()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
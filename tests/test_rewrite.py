@@ -42,7 +42,7 @@ def test_rewrite_0():
             def __exit__(self, exception_type, exception_value, traceback):
                 pass
 
-        scope = { 'reinteract_output': set_test_args, '__reinteract_builder': Builder }
+        scope = { 'reinteract_output': set_test_args, '__reinteract_builder': Builder, '__reinteract_profiler': Builder }
 
         exec compiled in scope
 
@@ -65,6 +65,13 @@ def test_rewrite_0():
     test_output('build as l:\n    l = 42', (42,))
     test_output('build:\n    pass', (None,))
 
+    #
+    # And our profile "keyword"
+    #
+    test_output('profile:\n    a = 1', (None,))
+    test_output('profile:  # comment\n    a = 1', (None,))
+    test_output('profile = 1\nd = {\n    profile: 2}\nd', ({1: 2},))
+
     #
     # Test that our intercepting of print works
     #
@@ -311,6 +318,24 @@ a.a = A()
 
     assert_equals(get_imports('from __future__ import division').get_future_features(), set(['division']))
 
+    #
+    # Test finding the names a statement binds
+    #
+
+    def get_bound_names(code):
+        rewriter = Rewriter(code)
+        rewriter.rewrite_and_compile()
+        bound_names = rewriter.get_bound_names()
+        return sorted(bound_names) if bound_names is not None else None
+
+    assert_equals(get_bound_names('a = b + 1'), ['a'])
+    assert_equals(get_bound_names('for i in x: y = i'), ['i', 'y'])
+    assert_equals(get_bound_names('import os.path, re as r'), ['os', 'r'])
+    assert_equals(get_bound_names('def f(x):\n    y = x'), ['f'])
+    assert_equals(get_bound_names('l.append(1)'), ['l'])
+    assert_equals(get_bound_names('from re import *'), None)
+    assert_equals(get_bound_names('exec "a = 1"'), None)
+
     #
     # Test passing in future_features to use in compilation
     #
@@ -14,7 +14,7 @@
 #--------------------------------------------------------------------------------------
 def test_shell_buffer() :
     #--------------------------------------------------------------------------------------
-    from test_utils import adjust_environment
+    from test_utils import adjust_environment, assert_equals
     adjust_environment()
 
     # The tests we include here are tests of the interaction of editing
@@ -23,6 +23,7 @@ def test_shell_buffer() :
     # testing is done in Worksheet.
 
     from reinteract.shell_buffer import ShellBuffer, ADJUST_NONE, _forward_line
+    from reinteract.shell_buffer import RESULT_PREVIEW_LINES, RESULT_PAGE_LINES, SHOW_MORE_TEXT
     from reinteract.chunks import StatementChunk, BlankChunk, CommentChunk
 
     from reinteract.notebook import Notebook
@@ -298,6 +299,59 @@ a.foo()""")
 'a' apparently modified, but can't copy it
 A()""")
 
+    # Large results are shown collapsed, and the rest is inserted a page at a time
+    clear()
+
+    total = RESULT_PREVIEW_LINES + 2 * RESULT_PAGE_LINES + 30
+    insert(0, 0, "for i in range(%d): print i" % total)
+    calculate()
+    chunk = buf.worksheet.get_chunk(0)
+    assert_equals(chunk.pending_lines, total - RESULT_PREVIEW_LINES)
+    expect(">>> for i in range(%d): print i\n" % total +
+           "\n".join(str(i) for i in range(RESULT_PREVIEW_LINES)) + "\n" +
+           SHOW_MORE_TEXT % (total - RESULT_PREVIEW_LINES))
+
+    buf.show_more_results(chunk)
+    assert_equals(chunk.pending_lines, total - RESULT_PREVIEW_LINES - RESULT_PAGE_LINES)
+    buf.show_more_results(chunk)
+    assert_equals(chunk.pending_lines, 30)
+    expect(">>> for i in range(%d): print i\n" % total +
+           "\n".join(str(i) for i in range(total - 30)) + "\n" +
+           SHOW_MORE_TEXT % 30)
+
+    buf.show_more_results(chunk)
+    assert_equals(chunk.pending_results, None)
+    expect(">>> for i in range(%d): print i\n" % total +
+           "\n".join(str(i) for i in range(total)))
+
+    # When a statement is executed again and its custom result is equivalent
+    # to the old one, the old result and its widget are kept
+    clear()
+
+    custom_results = []
+    buf.connect('add-custom-result', lambda buf, result, anchor: custom_results.append(result))
+
+    insert(0, 0, """from reinteract.custom_result import CustomResult
+class R(CustomResult):
+    def __init__(self, v): self.v = v
+    def is_equivalent(self, other): return self.v == other.v
+v = 1
+R(v)""")
+    calculate()
+    assert_equals(len(custom_results), 1)
+    chunk = buf.worksheet.get_chunk(5)
+
+    insert(4, 5, "+0")
+    calculate()
+    assert_equals(len(custom_results), 1)
+    assert chunk.results[0] is custom_results[0]
+
+    # But a result that isn't equivalent replaces it
+    insert(4, 7, "+1")
+    calculate()
+    assert_equals(len(custom_results), 2)
+    assert chunk.results[0] is custom_results[1]
+
 
 ######################################################################
 if __name__ == "__main__":
@@ -250,12 +250,158 @@ def test_signals_2() :
     #--------------------------------------------------------------------------------------
     pass
 
+#--------------------------------------------------------------------------------------
+def test_signals_3() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    global_settings = adjust_environment()
+
+    from reinteract.signals import Signal
+
+    #--------------------------------------------------------------------------------------
+    def listener( *args ) :
+        listener.LOGGER.append( args )
+        pass
+
+    listener.LOGGER = []
+
+    #--------------------------------------------------------------------------------------
+    # connecting and disconnecting during an emission affects later emissions only
+    del listener.LOGGER[ : ]
+    a_sig = Signal()
+
+    def disconnecter( *args ) :
+        a_sig.disconnect( disconnecter )
+        a_sig.connect( listener )
+        pass
+
+    a_sig.connect( disconnecter )
+    a_sig( 1 )
+    assert_equals( listener.LOGGER, [] )
+
+    a_sig( 2 )
+    assert_equals( listener.LOGGER, [ ( 2, ) ] )
+
+    #--------------------------------------------------------------------------------------
+    # disconnecting object slots
+    class Listener :
+        def __call__( self, *args ) :
+            listener( *args )
+            pass
+        pass
+
+    del listener.LOGGER[ : ]
+    a_sig = Signal()
+    an_object = Listener()
+    a_sig.connect( an_object )
+    a_sig.disconnect( an_object )
+    a_sig( 3 )
+    assert_equals( listener.LOGGER, [] )
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+#--------------------------------------------------------------------------------------
+def test_signals_4() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    global_settings = adjust_environment()
+
+    from reinteract.signals import Signal, SignalGroup
+
+    #--------------------------------------------------------------------------------------
+    def logger( the_name ) :
+        def log( *args, **kwargs ) :
+            logger.LOGGER.append( ( the_name, ) + args )
+            pass
+        return log
+
+    logger.LOGGER = []
+
+    a_first = Signal()
+    a_second = Signal()
+    an_ungrouped = Signal()
+    a_group = SignalGroup( a_first, a_second )
+
+    a_first.connect( logger( 'first' ) )
+    a_second.connect( logger( 'second' ) )
+    an_ungrouped.connect( logger( 'ungrouped' ) )
+
+    #--------------------------------------------------------------------------------------
+    # without a hold, emissions are delivered immediately
+    a_first( 1 )
+    assert_equals( logger.LOGGER, [ ( 'first', 1 ) ] )
+
+    #--------------------------------------------------------------------------------------
+    # held emissions of all signals in the group are delivered in order on the last flush;
+    # only consecutive identical ones are dropped
+    del logger.LOGGER[ : ]
+    a_group.hold()
+    a_first( 1 )
+    a_second( 2 )
+    a_second( 2 )
+    a_group.hold()
+    a_first( 1 )
+    an_ungrouped( 3 )
+    a_group.flush()
+    a_first( 4 )
+    assert_equals( logger.LOGGER, [ ( 'ungrouped', 3 ) ] )
+
+    a_group.flush()
+    assert_equals( logger.LOGGER, [ ( 'ungrouped', 3 ),
+                                    ( 'first', 1 ), ( 'second', 2 ), ( 'first', 1 ), ( 'first', 4 ) ] )
+
+    #--------------------------------------------------------------------------------------
+    # emissions are the same only if they pass the same objects
+    del logger.LOGGER[ : ]
+    with a_group :
+        a_first( [] )
+        a_first( [] )
+        a_first( 5, the_arg = 6 )
+        a_first( 5, the_arg = 7 )
+        pass
+    assert_equals( logger.LOGGER, [ ( 'first', [] ), ( 'first', [] ), ( 'first', 5 ), ( 'first', 5 ) ] )
+
+    #--------------------------------------------------------------------------------------
+    # an emission made while delivering held ones goes after the rest of them
+    del logger.LOGGER[ : ]
+    a_chained = Signal()
+    a_group = SignalGroup( a_chained )
+    a_chained.connect( logger( 'chained' ) )
+
+    def chain( *args ) :
+        if args == ( 1, ) :
+            a_chained( 3 )
+            pass
+        pass
+
+    a_chained.connect( chain )
+    with a_group :
+        a_chained( 1 )
+        a_chained( 2 )
+        pass
+    assert_equals( logger.LOGGER, [ ( 'chained', 1 ), ( 'chained', 2 ), ( 'chained', 3 ) ] )
+
+    #--------------------------------------------------------------------------------------
+    # a signal can only be part of one group
+    try :
+        SignalGroup( a_chained )
+        raise AssertionError( "expected ValueError" )
+    except ValueError :
+        pass
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
 #--------------------------------------------------------------------------------------
 if __name__ == "__main__":
     #--------------------------------------------------------------------------------------
     test_signals_0()
     test_signals_1()
     test_signals_2()
+    test_signals_3()
+    test_signals_4()
 
     #--------------------------------------------------------------------------------------
     pass
@@ -98,6 +98,178 @@ def test_statement_0():
     # Advanced use of "context manager" protocol
     expect_result('from reinteract.statement import Statement; Statement.get_current() != None', repr(True))
 
+    # Huge results are truncated, but can be expanded
+    from reinteract.statement import TruncatedResult
+    s1 = Statement("range(100000)", worksheet)
+    s1.compile()
+    s1.execute()
+    result = s1.results[0]
+    assert isinstance(result, TruncatedResult)
+    assert result.endswith(", ...]")
+    assert result.obj is s1.result_scope['_']
+
+    expanded = result.expand()
+    assert len(expanded) > len(result)
+    while isinstance(expanded, TruncatedResult):
+        expanded = expanded.expand()
+    assert_equals(expanded, repr(range(100000)))
+
+    # Long output keeps the start and the end, with the rest in a file
+    import reinteract.statement
+    from reinteract.statement import OmittedOutputResult
+    saved_limits = reinteract.statement.STDOUT_HEAD_LINES, reinteract.statement.STDOUT_TAIL_LINES
+    reinteract.statement.STDOUT_HEAD_LINES, reinteract.statement.STDOUT_TAIL_LINES = 3, 2
+    try:
+        s1 = Statement("for i in range(10): print i\n1\nprint 'a',; print 'b'", worksheet)
+        s1.compile()
+        s1.execute()
+        assert_equals(s1.results, ['0', '1', '2', '... 5 lines omitted ...', '8', '9', '1', 'a b'])
+        omitted = s1.results[3]
+        assert isinstance(omitted, OmittedOutputResult)
+        f = open(omitted.filename)
+        assert_equals(f.read(), "".join("%d\n" % i for i in range(10)) + "a b\n")
+        f.close()
+
+        # Executing again replaces the file, rather than adding another one
+        import os
+        cache_dir = os.path.dirname(omitted.filename)
+        cache_files = os.listdir(cache_dir)
+        s1.execute()
+        assert not os.path.exists(omitted.filename)
+        omitted = s1.results[3]
+        assert os.path.exists(omitted.filename)
+        assert_equals(len(os.listdir(cache_dir)), len(cache_files))
+
+        # The file goes away when the output is dropped
+        s2 = Statement("for i in range(10): print i\nundefined_name", worksheet)
+        s2.compile()
+        s2.execute()
+        assert_equals(s2.results, None)
+        assert_equals(len(os.listdir(cache_dir)), len(cache_files))
+
+        s1.release_output()
+        assert not os.path.exists(omitted.filename)
+    finally:
+        reinteract.statement.STDOUT_HEAD_LINES, reinteract.statement.STDOUT_TAIL_LINES = saved_limits
+
+    # Each execution records how long it took
+    s1 = Statement("import time\nx = [0]", worksheet)
+    s1.compile()
+    s1.execute()
+    s2 = Statement("time.sleep(0.05)\nx.append(1)", worksheet, parent=s1)
+    s2.compile()
+    assert_equals(s2.stats, None)
+    s2.execute()
+    assert s2.stats.wall_time >= 0.05
+    assert s2.stats.copy_time <= s2.stats.wall_time
+    assert s2.stats.cpu_time >= 0
+
+    # CPU time used by other threads at the same time isn't counted
+    import thread, threading, time
+    from reinteract.resource_limits import get_thread_cpu_time
+    if get_thread_cpu_time(thread.get_ident()) is not None:
+        def spin():
+            end = time.time() + 0.5
+            while time.time() < end:
+                pass
+        spinner = threading.Thread(target=spin)
+        spinner.start()
+        s2 = Statement("time.sleep(0.3)", worksheet, parent=s1)
+        s2.compile()
+        s2.execute()
+        spinner.join()
+        assert s2.stats.cpu_time < 0.1
+
+    # The profile keyword gives a call tree of the code in the block
+    from reinteract.sampling_profiler import ProfileResult
+    s1 = Statement("import time\n"
+                   "def spin():\n"
+                   "    start = time.time()\n"
+                   "    while time.time() < start + 0.1: pass\n"
+                   "profile:\n"
+                   "    spin()", worksheet)
+    s1.compile()
+    assert_equals(s1.execute(), True)
+    result = s1.results[0]
+    assert isinstance(result, ProfileResult)
+    assert_equals([node.name for node in result.root.get_sorted_children()][0:1], ['spin'])
+
+    # Values that can't be measured don't make the statement fail
+    s1 = Statement("class BadList(list):\n"
+                   "    def __iter__(self): raise RuntimeError()\n"
+                   "bad = BadList([1, 2, 3])", worksheet)
+    s1.compile()
+    assert_equals(s1.execute(), True)
+    assert_equals(sorted(binding.name for binding in s1.memory.bindings), ['BadList', 'bad'])
+
+    # timeit() runs code with the variables of the worksheet
+    from reinteract.benchmark import TimeitResult
+    s1 = Statement("l = range(1000)", worksheet)
+    s1.compile()
+    s1.execute()
+    s2 = Statement("timeit('sorted(l)', runs=3)", worksheet, parent=s1)
+    s2.compile()
+    assert_equals(s2.execute(), True)
+    result = s2.results[0]
+    assert isinstance(result, TimeitResult)
+    assert_equals(len(result.times), 3)
+    assert result.min <= result.median
+
+    # A statement that yields at the top level waits for the yielded functions,
+    # which are called concurrently
+    s1 = Statement("import threading, time\n"
+                   "started = threading.Event()\n"
+                   "def first(): started.wait(5); return started.is_set()\n"
+                   "def second(): started.set(); return 2\n", worksheet)
+    s1.compile()
+    s1.execute()
+    s2 = Statement("a, b = yield first, second\n"
+                   "(yield lambda: 3) + a", worksheet, parent=s1)
+    assert_equals(s2.compile(), True)
+    assert_equals(s2.execute(), True)
+    assert_equals(s2.results, ['4'])
+    assert_equals((s2.result_scope['a'], s2.result_scope['b']), (True, 2))
+    assert '__reinteract_task' not in s2.result_scope
+
+    # At most MAX_TASK_THREADS functions are called at once
+    from reinteract.statement import MAX_TASK_THREADS
+    s1 = Statement("import threading, time\n"
+                   "lock = threading.Lock()\n"
+                   "running = [0, 0]\n"
+                   "def call():\n"
+                   "    with lock: running[0] += 1; running[1] = max(running)\n"
+                   "    time.sleep(0.01)\n"
+                   "    with lock: running[0] -= 1\n", worksheet)
+    s1.compile()
+    s1.execute()
+    s2 = Statement("done = yield [call] * 20\n"
+                   "running[1]", worksheet, parent=s1)
+    s2.compile()
+    assert_equals(s2.execute(), True)
+    assert 1 <= int(s2.results[0]) <= MAX_TASK_THREADS
+
+    # Errors from a yielded function are raised at the yield
+    s1 = Statement("try:\n"
+                   "    yield lambda: 1 / 0\n"
+                   "except ZeroDivisionError:\n"
+                   "    caught = True", worksheet)
+    s1.compile()
+    assert_equals(s1.execute(), True)
+    assert_equals(s1.result_scope['caught'], True)
+
+    s1 = Statement("x = 1\nyield 1", worksheet)
+    s1.compile()
+    assert_equals(s1.execute(), False)
+    assert 'TypeError' in s1.error_message
+    assert_equals(s1.error_line, 2)
+
+    s1 = Statement("from os.path import *\nyield []", worksheet)
+    assert_equals(s1.compile(), False)
+
+    nb.close()
+    import os
+    assert not os.path.exists(omitted.filename)
+
     #--------------------------------------------------------------------------------------
     pass
 
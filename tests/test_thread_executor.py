@@ -128,10 +128,197 @@ def test_thread_executor_0() :
         pass
 
 
+#--------------------------------------------------------------------------------------
+def test_thread_executor_1() :
+    from test_utils import adjust_environment, assert_equals
+    global_settings = adjust_environment()
+
+    from reinteract.notebook import Notebook
+    from reinteract.resource_limits import ResourceLimits
+    from reinteract.statement import Statement
+    from reinteract.thread_executor import ThreadExecutor
+    from reinteract.worksheet import Worksheet
+
+    import threading
+
+    notebook = Notebook()
+    worksheet = Worksheet(notebook)
+
+    # Statements that exceed their limits are interrupted by the watchdog
+    def test_limits(executor_limits, statements):
+        executor = ThreadExecutor(limits=executor_limits)
+        loop = executor.event_loop
+
+        for s, limits in statements:
+            statement = Statement(s, worksheet)
+            statement.limits = limits
+            executor.add_statement(statement)
+
+        def on_complete(executor):
+            loop.quit()
+
+        executor.sig_complete.connect(on_complete)
+
+        assert executor.compile()
+        executor.execute()
+
+        timeout_source = threading.Timer(5.0, loop.quit)
+        timeout_source.start()
+        loop.run()
+        timeout_source.cancel()
+
+        test_limits.statements = executor.statements
+        return [(s.state, s.error_message) for s in executor.statements]
+
+    results = test_limits(ResourceLimits(wall_time=0.3),
+                          [("a = 1", None),
+                           ("while True: pass", None),
+                           ("b = 1", None)])
+    assert_equals(results, [(Statement.EXECUTE_SUCCESS, None),
+                            (Statement.LIMIT_EXCEEDED, "Time limit exceeded: ran for more than 0.3 seconds"),
+                            (Statement.COMPILE_SUCCESS, None)])
+
+    # Limits of a statement override those of the executor
+    results = test_limits(ResourceLimits(wall_time=0.01),
+                          [("import time; time.sleep(0.2)", ResourceLimits()),
+                           ("while True: pass", ResourceLimits(cpu_time=0.3))])
+    assert_equals(results, [(Statement.EXECUTE_SUCCESS, None),
+                            (Statement.LIMIT_EXCEEDED, "CPU time limit exceeded: used more than 0.3 seconds of CPU time")])
+
+    # A statement that catches the interruption still exceeded its limits
+    results = test_limits(ResourceLimits(wall_time=0.3),
+                          [("try:\n    while True: pass\nexcept KeyboardInterrupt:\n    caught = True", None)])
+    assert_equals(results, [(Statement.LIMIT_EXCEEDED, "Time limit exceeded: ran for more than 0.3 seconds")])
+    assert_equals(test_limits.statements[0].result_scope, None)
+
+    # Functions yielded by a task that are still running when it is interrupted
+    # are left to finish, and counted; ones that haven't started are cancelled
+    gate = threading.Event()
+    worksheet.global_scope['gate'] = gate
+    worksheet.global_scope['called'] = []
+    results = test_limits(ResourceLimits(wall_time=0.3),
+                          [("yield [gate.wait] + [lambda: called.append(1) or gate.wait()] * 100", None)])
+    assert_equals(results[0][0], Statement.LIMIT_EXCEEDED)
+    from reinteract.statement import MAX_TASK_THREADS
+    assert_equals(test_limits.statements[0].orphaned_calls, MAX_TASK_THREADS)
+    assert_equals(len(worksheet.global_scope['called']), MAX_TASK_THREADS - 1)
+
+    # They don't keep other tasks from getting threads
+    results = test_limits(None, [("a = yield lambda: 1", None)])
+    assert_equals(results, [(Statement.EXECUTE_SUCCESS, None)])
+    gate.set()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def test_thread_executor_2() :
+    from test_utils import adjust_environment, assert_equals
+    global_settings = adjust_environment()
+
+    from reinteract.notebook import Notebook
+    from reinteract.statement import Statement
+    from reinteract.thread_executor import ThreadExecutor
+    from reinteract.worksheet import Worksheet
+
+    import threading
+
+    notebook = Notebook()
+    worksheet = Worksheet(notebook)
+
+    def run(texts, batched, interrupt_after=None):
+        executor = ThreadExecutor(batched=batched)
+        loop = executor.event_loop
+
+        for text in texts:
+            executor.add_statement(Statement(text, worksheet))
+
+        completed = []
+        def on_statement_complete(executor, statement):
+            completed.append(statement)
+
+        def on_complete(executor):
+            loop.quit()
+
+        executor.sig_statement_complete.connect(on_statement_complete)
+        executor.sig_complete.connect(on_complete)
+
+        assert executor.compile()
+        executor.execute()
+
+        if interrupt_after is not None:
+            interrupt_source = threading.Timer(interrupt_after, executor.interrupt)
+            interrupt_source.start()
+        timeout_source = threading.Timer(30.0, loop.quit)
+        timeout_source.start()
+        loop.run()
+        timeout_source.cancel()
+
+        assert_equals(completed, executor.statements)
+
+        return executor.statements
+
+    def user_names(scope):
+        if scope is None:
+            return None
+        return sorted((name, value) for name, value in scope.iteritems()
+                      if not name.startswith('__') and not callable(value))
+
+    def describe(statement):
+        return (statement.state, statement.results, user_names(statement.result_scope),
+                statement.memory and sorted(binding.name for binding in statement.memory.bindings))
+
+    # Batched mode gives the same results, output and result scopes; this
+    # crosses batches, and has runs of statements sharing a scope broken by
+    # ones that can't
+    texts = ["a = 0"]
+    for i in xrange(250):
+        texts.append("a += 1\nprint a\na * 2")
+        if i % 40 == 0:
+            texts.append("b%d = a\ndel a\na = b%d" % (i, i))
+        if i % 70 == 0:
+            texts.append("l = [a]\nl.append(a)")
+        if i % 90 == 0:
+            texts.append("def f(): return a")
+            texts.append("f()")
+    one_by_one = run(texts, False)
+    batched = run(texts, True)
+    assert_equals([ describe(s) for s in batched ], [ describe(s) for s in one_by_one ])
+    assert_equals(batched[-1].results, [ '250', '500' ])
+    assert_equals(batched[-1].result_scope['a'], 250)
+
+    # A function sees the scope it was defined in, not names bound later
+    texts = ["def g(): return c", "c = 1", "g()"]
+    assert_equals([ describe(s) for s in run(texts, True) ], [ describe(s) for s in run(texts, False) ])
+
+    # A statement executed after one that shared its scope sees only what was
+    # bound before it
+    statements = run(["x = 1", "y = 2", "x = 3", "del y"], True)
+    after = Statement("x, y", worksheet, statements[1])
+    after.compile()
+    after.execute()
+    assert_equals(after.results, [ '(1, 2)' ])
+
+    # Errors and interruption stop execution as usual
+    statements = run(["a = 1", "b", "a = 2"], True)
+    assert_equals([ s.state for s in statements ], [ Statement.EXECUTE_SUCCESS, Statement.EXECUTE_ERROR, Statement.COMPILE_SUCCESS ])
+    assert_equals(user_names(statements[0].result_scope), [ ('a', 1) ])
+
+    statements = run(["a = 1", "a = 2\nwhile True: pass", "a = 3"], True, interrupt_after=0.2)
+    assert_equals([ s.state for s in statements ], [ Statement.EXECUTE_SUCCESS, Statement.INTERRUPTED, Statement.COMPILE_SUCCESS ])
+    assert_equals(user_names(statements[0].result_scope), [ ('a', 1) ])
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
 #--------------------------------------------------------------------------------------
 if __name__ == "__main__":
     #--------------------------------------------------------------------------------------
     test_thread_executor_0()
+    test_thread_executor_1()
+    test_thread_executor_2()
 
     #--------------------------------------------------------------------------------------
     pass
@@ -683,12 +683,275 @@ def test_worksheet_2() :
     pass
 
 
+#--------------------------------------------------------------------------------------
+def test_worksheet_3() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment
+    adjust_environment()
+
+    import os, sys
+    import tempfile
+
+    from reinteract.notebook import Notebook
+    from reinteract.worksheet import Worksheet
+
+    #--------------------------------------------------------------------------------------
+    base = tempfile.mkdtemp("", u"prefetch")
+    local_file = os.path.join(base, "prefetch_local.py")
+    f = open(local_file, "w")
+    f.write("import sys\nsys._prefetch_local_loaded = True\n")
+    f.close()
+
+    try:
+        worksheet = Worksheet(Notebook(base))
+        worksheet.insert(0, 0, "import colorsys\nimport prefetch_local\nfrom os import path\nnot valid python")
+
+        # Other tests may have imported it already
+        sys.modules.pop('colorsys', None)
+        worksheet.prefetch_imports(wait=True)
+
+        # Global modules are imported, notebook-local modules are left alone
+        assert 'colorsys' in sys.modules
+        assert not hasattr(sys, '_prefetch_local_loaded')
+    finally:
+        os.remove(local_file)
+        os.rmdir(base)
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def test_worksheet_4() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    import threading
+    import time
+
+    from reinteract.event_loop import eventLoop
+    from reinteract.lookup_thread import LookupThread, TIMED_OUT
+    from reinteract.notebook import Notebook
+    from reinteract.worksheet import Worksheet
+
+    loop = eventLoop()
+
+    def run_loop(timeout=2.0):
+        timer = threading.Timer(timeout, loop.quit)
+        timer.start()
+        loop.run()
+        timer.cancel()
+
+    #--------------------------------------------------------------------------------------
+    worksheet = Worksheet( Notebook() )
+    worksheet.insert(0, 0, "import colorsys\ncolorsys.rgb_to_h")
+    worksheet.calculate(wait=True)
+
+    results = []
+    def on_result(name):
+        def callback(result):
+            results.append((name, result))
+            loop.quit()
+        return callback
+
+    # A request that is cancelled is dropped, the later one is delivered
+    stale = worksheet.find_completions_async(1, 17, on_result('stale'))
+    stale.cancel()
+    worksheet.find_completions_async(1, 17, on_result('current'))
+    run_loop()
+
+    assert_equals(results, [('current', worksheet.find_completions(1, 17))])
+    assert_equals([c[0] for c in results[0][1]], ['rgb_to_hls', 'rgb_to_hsv'])
+
+    del results[:]
+    worksheet.get_object_at_location_async(1, 2, on_result('object'))
+    run_loop()
+
+    assert_equals(results[0][1][1:], (1, 0, 1, 8))
+    assert_equals(results[0][1][0].__name__, 'colorsys')
+
+    worksheet.destroy()
+
+    #--------------------------------------------------------------------------------------
+    # A lookup that is stuck past its deadline times out, and doesn't block later lookups
+    lookup_thread = LookupThread(deadline=0.2)
+
+    del results[:]
+    lookup_thread.run(lambda: time.sleep(1.0), on_result('stuck'))
+    run_loop()
+    assert_equals(results, [('stuck', TIMED_OUT)])
+
+    lookup_thread.run(lambda: 42, on_result('later'))
+    run_loop()
+    assert_equals(results, [('stuck', TIMED_OUT), ('later', 42)])
+
+    # Wait for the stuck lookup to return and make sure its result isn't delivered
+    time.sleep(1.0)
+    run_loop(0.2)
+    assert_equals(results, [('stuck', TIMED_OUT), ('later', 42)])
+
+    # A lookup queued behind a stuck one times out too
+    lookup_thread.destroy()
+    del results[:]
+    lookup_thread = LookupThread(deadline=0.2)
+    lookup_thread.run(lambda: time.sleep(0.5), on_result('stuck'))
+    lookup_thread.run(lambda: 42, on_result('queued'))
+    while len(results) < 2:
+        run_loop()
+    assert_equals(results, [('stuck', TIMED_OUT), ('queued', TIMED_OUT)])
+
+    lookup_thread.destroy()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def test_worksheet_5() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    from reinteract.notebook import Notebook
+    from reinteract.worksheet import Worksheet
+
+    #--------------------------------------------------------------------------------------
+    # Chunks keep the statistics from executing their statements
+    worksheet = Worksheet( Notebook() )
+    worksheet.insert(0, 0, "import time\ntime.sleep(0.1)\n# comment\ntime.sleep(0.2)\na = 1")
+    worksheet.calculate(wait=True)
+
+    slowest = worksheet.get_slowest_chunks(2)
+    assert_equals([chunk.start for chunk in slowest], [3, 1])
+    assert slowest[0].stats.wall_time >= 0.2
+
+    # Editing a chunk discards its statistics
+    worksheet.insert(3, 0, "#")
+    assert_equals([chunk.start for chunk in worksheet.get_slowest_chunks()][0:2], [1, 0])
+
+    worksheet.destroy()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def test_worksheet_6() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    from reinteract.notebook import Notebook
+    from reinteract.worksheet import Worksheet
+
+    #--------------------------------------------------------------------------------------
+    # Chunks know how much memory the variables they bind keep alive
+    worksheet = Worksheet( Notebook() )
+    worksheet.insert(0, 0, "big = 'x' * 1000000\nsmall = 1\nlength = len(big)\nbig = big[:10]\nsmall")
+    worksheet.calculate(wait=True)
+
+    largest = worksheet.get_largest_bindings()
+    assert_equals([ ( chunk.start, binding.name ) for chunk, binding in largest ][0:1], [ ( 0, 'big' ) ])
+    assert largest[0][1].size >= 1000000
+    assert_equals(sorted(binding.name for chunk, binding in largest), [ '_', 'big', 'big', 'length', 'small' ])
+
+    # Showing a result keeps it alive as '_'
+    assert_equals([ binding.name for binding in worksheet.get_chunk(4).memory.bindings ], [ '_' ])
+
+    # Dropping the binding inserts a del after the last statement using it
+    assert_equals(worksheet.drop_binding(worksheet.get_chunk(1), 'small'), True)
+    assert_equals(worksheet.get_text(), "big = 'x' * 1000000\nsmall = 1\nlength = len(big)\nbig = big[:10]\nsmall\ndel small")
+
+    # But the first 'big' is used by the statement rebinding it
+    assert_equals(worksheet.drop_binding(worksheet.get_chunk(0), 'big'), False)
+
+    worksheet.destroy()
+
+    # A variable used by a function can't be dropped, since the function could
+    # be called at any point
+    worksheet = Worksheet( Notebook() )
+    worksheet.insert(0, 0, "x = 1\ndef f(): return x\ny = 2\nf()")
+    worksheet.calculate(wait=True)
+    assert_equals(worksheet.drop_binding(worksheet.get_chunk(0), 'x'), False)
+    assert_equals(worksheet.drop_binding(worksheet.get_chunk(2), 'y'), True)
+
+    # Even if the function is defined before the variable
+    worksheet.insert(0, 0, "g = lambda: z\nz = 1\n")
+    worksheet.calculate(wait=True)
+    assert_equals(worksheet.drop_binding(worksheet.get_chunk(1), 'z'), False)
+
+    worksheet.destroy()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
+#--------------------------------------------------------------------------------------
+def test_worksheet_7() :
+    #--------------------------------------------------------------------------------------
+    from test_utils import adjust_environment, assert_equals
+    adjust_environment()
+
+    from reinteract.notebook import Notebook, NotebookFile
+    from reinteract.worksheet import Worksheet
+
+    #--------------------------------------------------------------------------------------
+    # During a user action, the text, line and code-modified signals are emitted
+    # immediately, while the chunk and state signals are held and emitted in order
+    # at the end
+    worksheet = Worksheet( Notebook() )
+    log = []
+
+    def logger(name):
+        def log_emission(worksheet, *args):
+            log.append((name,) + tuple(arg.start if hasattr(arg, 'start') else arg for arg in args))
+        return log_emission
+
+    for name in ['text_inserted', 'lines_inserted', 'chunk_inserted', 'chunk_status_changed',
+                 'code_modified', 'state']:
+        getattr(worksheet, 'sig_' + name).connect(logger(name))
+
+    worksheet.begin_user_action()
+    worksheet.insert(0, 0, "a = 1\nb = 2")
+    assert_equals(log, [('text_inserted', 0, 0, "a = 1\nb = 2"), ('lines_inserted', 0, 1),
+                        ('code_modified', True)])
+
+    del log[:]
+    worksheet.end_user_action()
+    assert_equals(log, [('state', NotebookFile.NEEDS_EXECUTE),
+                        ('chunk_inserted', 0), ('chunk_inserted', 1)])
+
+    # State changes while calculating within a user action are held along with them
+    worksheet.calculate(wait=True)
+    del log[:]
+    worksheet.begin_user_action()
+    worksheet.insert(1, 0, "c = 3\n")
+    worksheet.calculate(wait=True)
+    assert_equals(log, [('text_inserted', 1, 0, "c = 3\n"), ('lines_inserted', 1, 2)])
+
+    del log[:]
+    worksheet.end_user_action()
+    assert_equals(log, [('state', NotebookFile.EXECUTE_SUCCESS), ('state', NotebookFile.NEEDS_EXECUTE),
+                        ('chunk_inserted', 1), ('chunk_status_changed', 2)])
+
+    worksheet.destroy()
+
+    #--------------------------------------------------------------------------------------
+    pass
+
+
 #--------------------------------------------------------------------------------------
 if __name__ == "__main__":
     #--------------------------------------------------------------------------------------
     test_worksheet_0()
     test_worksheet_1()
     test_worksheet_2()
+    test_worksheet_3()
+    test_worksheet_4()
+    test_worksheet_5()
+    test_worksheet_6()
+    test_worksheet_7()
 
     #--------------------------------------------------------------------------------------
     pass